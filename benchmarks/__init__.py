@@ -0,0 +1 @@
+'''WorkState benchmarks, run as ``python -m benchmarks.<name>``'''
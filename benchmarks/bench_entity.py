@@ -0,0 +1,42 @@
+'''Benchmarks memory per live entity, free-standing and in a columnar store
+
+Usage: python -m benchmarks.bench_entity [entities]
+'''
+from __future__ import annotations
+
+import gc
+import sys
+import tracemalloc
+from typing import Any, Callable
+
+from tests.books import BookEngine
+from workstate.dispatch import Dispatcher
+
+
+def measure(create: Callable[[int], Any], count: int) -> float:
+    '''Bytes allocated, and still alive, per entity created'''
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live = create(count)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del live
+    return (after - before) / count
+
+
+def main(count: int = 1000000) -> None:
+    '''Runs the benchmark and prints bytes per live entity'''
+    BookEngine.compile()
+    print(f'{count} chapter entities')
+    for name, create in (
+        ('entity', lambda count: [
+            BookEngine.instantiate('chapter', key=key) for key in range(count)
+        ]),
+        ('store row', lambda count: Dispatcher(BookEngine).add('chapter', range(count))),
+    ):
+        print(f'{name:>10}: {measure(create, count):6.1f} bytes')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
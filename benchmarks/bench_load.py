@@ -0,0 +1,215 @@
+'''Load test of the Book/Chapter workflow through the runtime dispatcher
+
+Simulates authors and reviewers working on books: chapters get marked or
+completed, proposed, approved, rejected and canceled in a configurable mix,
+from a number of concurrent client threads. Reports throughput, latency
+percentiles per event type, the cascade depth distribution and memory
+growth, as text or JSON for comparing releases.
+
+Usage: python -m benchmarks.bench_load [--books N] [--chapters N] [--events N]
+       [--threads N] [--active N] [--mix propose=4,...] [--seed N] [--json]
+'''
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Tuple
+
+from tests.books import BookEngine
+from workstate.dispatch import Dispatcher
+from workstate.exceptions import EventRejectedException
+
+try:
+    import resource
+except ImportError:  # pragma: nocoverage
+    resource = None  # type: ignore
+
+#: Default event mix, as relative weights. ``mark`` and ``complete`` are
+#: attribute writes by reviewers and authors, the rest are chapter events.
+MIX = {'mark': 3, 'complete': 3, 'propose': 4, 'approve': 3, 'reject': 0.3, 'cancel': 0.01}
+
+
+def populate(books: int, chapters: int) -> Dispatcher:
+    '''Dispatcher holding books with their chapters, all in draft'''
+    dispatcher = Dispatcher(BookEngine)
+    dispatcher.add('book', range(books))
+    dispatcher.add('chapter', range(books * chapters), marked=False, complete=False)
+    size = books * chapters
+    dispatcher.link('chapter', range(size), 'book', [key // chapters for key in range(size)])
+    return dispatcher
+
+
+def workload(mix: Dict[str, float],
+             books: int,
+             chapters: int,
+             *,
+             active: int,
+             count: int,
+             seed: int) -> Iterator[Tuple[str, int]]:
+    '''Generates (event type, chapter key) pairs according to the mix
+
+    Work concentrates on a window of active books, which slides over all
+    books in the course of the run, so books actually get finished.
+    '''
+    rand = random.Random(seed)
+    (kinds, weights) = (list(mix), list(mix.values()))
+    active = max(1, min(active, books))
+    for idx in range(count):
+        first = idx * (books - active + 1) // count
+        book = first + rand.randrange(active)
+        yield (rand.choices(kinds, weights)[0], book * chapters + rand.randrange(chapters))
+
+
+def _client(dispatcher: Dispatcher,
+            events: Iterator[Tuple[str, int]],
+            latencies: Dict[str, List[int]],
+            outcomes: Counter) -> None:
+    '''Drives events into the dispatcher, recording latency and outcome of each'''
+    chapters = dispatcher.store('chapter')
+    clock = time.perf_counter_ns
+    for kind, key in events:
+        start = clock()
+        if kind in ('mark', 'complete'):
+            with dispatcher.cycle():
+                chapters.set(chapters.row(key), 'marked' if kind == 'mark' else 'complete', True)
+            outcome = 'write'
+        else:
+            try:
+                flow = dispatcher.event('chapter', key, kind)
+            except EventRejectedException:
+                outcome = 'rejected'
+            else:
+                outcome = f'depth {len(flow.events) - 1}'
+        latencies.setdefault(kind, []).append(clock() - start)
+        outcomes[outcome] += 1
+
+
+def _percentile(ordered: List[int], fraction: float) -> float:
+    '''Nearest-rank percentile of sorted samples, in microseconds'''
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] / 1000
+
+
+def _rss() -> int:
+    '''Peak resident set size of the process in KiB, 0 where unknown'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run(books: int = 200,
+        chapters: int = 10,
+        events: int = 100000,
+        *,
+        threads: int = 1,
+        active: int = 20,
+        mix: Dict[str, float] | None = None,
+        seed: int = 1) -> Dict[str, Any]:
+    '''Runs the load test, returns its report'''
+    rss = _rss()
+    dispatcher = populate(books, chapters)
+    populated = _rss()
+
+    latencies: List[Dict[str, List[int]]] = [{} for _ in range(threads)]
+    outcomes: List[Counter] = [Counter() for _ in range(threads)]
+    clients = [
+        threading.Thread(target=_client, args=(
+            dispatcher,
+            workload(mix or MIX, books, chapters, active=active, count=events // threads,
+                     seed=seed + idx),
+            latencies[idx],
+            outcomes[idx],
+        ))
+        for idx in range(threads)
+    ]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    merged: Dict[str, List[int]] = {}
+    for _latencies in latencies:
+        for kind, samples in _latencies.items():
+            merged.setdefault(kind, []).extend(samples)
+    total = sum(outcomes, Counter())
+    return {
+        'config': {
+            'books': books, 'chapters': chapters, 'events': events, 'threads': threads,
+            'active': active, 'mix': mix or MIX, 'seed': seed,
+        },
+        'seconds': elapsed,
+        'throughput': sum(len(samples) for samples in merged.values()) / elapsed,
+        'latency_us': {
+            kind: {
+                'count': len(samples),
+                'p50': _percentile(sorted(samples), 0.5),
+                'p99': _percentile(sorted(samples), 0.99),
+            }
+            for kind, samples in sorted(merged.items())
+        },
+        'outcomes': dict(sorted(total.items())),
+        'histogram': dispatcher.histogram(),
+        'memory_kib': {'populate': populated - rss, 'run': _rss() - populated},
+    }
+
+
+def report(result: Dict[str, Any]) -> None:
+    '''Prints a load test report'''
+    config = result['config']
+    print(f"{config['books']} books x {config['chapters']} chapters, {config['events']} events"
+          f" from {config['threads']} threads")
+    print(f"throughput: {result['throughput']:10.0f} events/s ({result['seconds']:.2f} s)")
+    print('latency (us):        count       p50       p99')
+    for kind, stats in result['latency_us'].items():
+        print(f"  {kind:>12}: {stats['count']:9} {stats['p50']:9.1f} {stats['p99']:9.1f}")
+    print('outcomes:')
+    for outcome, number in result['outcomes'].items():
+        print(f'  {outcome:>12}: {number:9}')
+    print('states:')
+    for scope, counts in result['histogram'].items():
+        print(f"  {scope:>12}: {', '.join(f'{k}={v}' for k, v in counts.items())}")
+    memory = result['memory_kib']
+    print(f"peak RSS growth: {memory['populate']} KiB populating, {memory['run']} KiB running")
+
+
+def _mix(text: str) -> Dict[str, float]:
+    '''Parses an event mix: comma separated event=weight pairs'''
+    mix: Dict[str, float] = {}
+    for item in text.split(','):
+        (kind, _, weight) = item.partition('=')
+        if kind not in MIX:
+            raise argparse.ArgumentTypeError(f'Unknown event type {kind}')
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main(argv: List[str] | None = None) -> Dict[str, Any]:
+    '''Runs the load test from command line arguments'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    parser.add_argument('--books', type=int, default=200)
+    parser.add_argument('--chapters', type=int, default=10, help='chapters per book')
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=1, help='concurrent clients')
+    parser.add_argument('--active', type=int, default=20, help='books worked on at a time')
+    parser.add_argument('--mix', type=_mix, default=None, help='e.g. propose=4,approve=3')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    result = run(
+        args.books, args.chapters, args.events,
+        threads=args.threads, active=args.active, mix=args.mix, seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        report(result)
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''Benchmarks loading a model description against equivalent class-based definitions
+
+The loader fills the parsed containers of a scope directly, which is what
+the scope rows compare. Building an engine also validates and compiles
+every scope, the same work either way, so the engine rows differ by less.
+
+Usage: python -m benchmarks.bench_loader [scopes] [states]
+'''
+from __future__ import annotations
+
+import json
+import sys
+import timeit
+from typing import Any, Dict, List
+
+from workstate.engine import Engine, Scope
+from workstate.loader import build_scope, loads
+
+
+def describe(scopes: int, states: int) -> Dict[str, Any]:
+    '''Model description of scopes, each a chain of states with a wildcard cancel'''
+    document: Dict[str, Any] = {'name': 'BenchEngine', 'scopes': {}}
+    for idx in range(scopes):
+        names = [f's{state}' for state in range(states)]
+        document['scopes'][f'scope{idx}'] = {
+            'initial': names[0],
+            'states': {name: f'State {name}' for name in names},
+            'transitions': {
+                **{f'{a}__{b}': f'{a} to {b}' for a, b in zip(names, names[1:])},
+                '__canceled': 'Canceled',
+            },
+            'events': {
+                **{f'next_{a}': [f'{a}__{b}'] for a, b in zip(names, names[1:])},
+                'cancel': ['*__canceled'],
+            },
+        }
+    return document
+
+
+def define(document: Dict[str, Any], engine: bool = True) -> type | None:
+    '''Defines the same model through Scope and Engine classes'''
+    scopes: List[type] = []
+    for scope, spec in document['scopes'].items():
+        dct = {
+            'scope': scope,
+            'initial': spec['initial'],
+            'States': type('States', (), dict(spec['states'])),
+            'Transitions': type('Transitions', (), dict(spec['transitions'])),
+            'Events': type('Events', (), dict(spec['events'])),
+        }
+        scopes.append(type(Scope)(scope.title(), (Scope, ), dct))  # type: ignore
+    if not engine:
+        return None
+    return type(Engine)('BenchEngine', (Engine, ), {'scopes': scopes})  # type: ignore
+
+
+def main(scopes: int = 30, states: int = 100) -> None:
+    '''Runs the benchmark and prints the best timings'''
+    document = describe(scopes, states)
+    text = json.dumps(document)
+    print(f'{scopes} scopes of {states} states')
+    for name, func in (
+        ('scope classes', lambda: define(document, engine=False)),
+        ('scope loader', lambda: [
+            build_scope(scope, spec) for scope, spec in document['scopes'].items()
+        ]),
+        ('engine classes', lambda: define(document)),
+        ('engine loader', lambda: loads(text)),
+    ):
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print(f'{name:>14}: {best * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
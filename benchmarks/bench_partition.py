@@ -0,0 +1,78 @@
+'''Throughput of the Book/Chapter workflow against the number of partitions
+
+Proposes and approves every chapter of a set of books, so that each book
+gets published by a trigger cascading from its last chapter, often onto
+another partition. Runs once through a single in-process Dispatcher and then
+through PartitionedDispatchers of a growing number of worker processes.
+Reports events per second, and the speed up over one partition.
+
+Usage: python -m benchmarks.bench_partition [books] [chapters] [partitions]
+'''
+from __future__ import annotations
+
+import os
+import sys
+import time
+from typing import Any, List, Tuple
+
+from tests.books import BookEngine
+from workstate.dispatch import Dispatcher
+from workstate.partition import PartitionedDispatcher
+
+
+def events(books: int, chapters: int) -> List[Tuple[str, int, str]]:
+    '''Proposes, then approves, all chapters'''
+    return [
+        ('chapter', key, event)
+        for event in ('propose', 'approve') for key in range(books * chapters)
+    ]
+
+
+def populate(dispatcher: Any, books: int, chapters: int) -> None:
+    '''Adds books with their chapters, ready to be proposed'''
+    size = books * chapters
+    dispatcher.add('book', range(books))
+    dispatcher.add('chapter', range(size), marked=True, complete=True)
+    dispatcher.link('chapter', range(size), 'book', [key // chapters for key in range(size)])
+
+
+def single(books: int, chapters: int) -> float:
+    '''Events per second through one in-process Dispatcher'''
+    dispatcher = Dispatcher(BookEngine)
+    populate(dispatcher, books, chapters)
+    posted = events(books, chapters)
+    start = time.perf_counter()
+    for scope, key, event in posted:
+        dispatcher.event(scope, key, event)
+    return len(posted) / (time.perf_counter() - start)
+
+
+def partitioned(books: int, chapters: int, partitions: int) -> float:
+    '''Events per second through a PartitionedDispatcher'''
+    with PartitionedDispatcher(BookEngine, partitions=partitions) as dispatcher:
+        populate(dispatcher, books, chapters)
+        posted = events(books, chapters)
+        start = time.perf_counter()
+        results = dispatcher.dispatch(posted)
+        elapsed = time.perf_counter() - start
+        assert all(result.error is None for result in results)
+        assert dispatcher.histogram()['book']['published'] == books
+    return len(posted) / elapsed
+
+
+def main(books: int = 2000, chapters: int = 10, partitions: int = 0) -> None:
+    '''Runs the benchmark for 1, 2, 4, ... partitions'''
+    limit = partitions or os.cpu_count() or 1
+    print(f'{books} books of {chapters} chapters, {books * chapters * 2} events')
+    print('partitions  events/s  speed up')
+    print(f"{'-':>10} {single(books, chapters):9.0f}  (single Dispatcher)")
+    (count, base) = (1, 0.0)
+    while count <= limit:
+        rate = partitioned(books, chapters, count)
+        base = base or rate
+        print(f'{count:10} {rate:9.0f} {rate / base:9.2f}')
+        count *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
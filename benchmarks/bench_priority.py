@@ -0,0 +1,199 @@
+'''Tail latency of interactive events under saturating background load
+
+A feeder keeps a backlog of bulk ``reindex`` events, half of them for a few
+hot documents, well beyond what the single worker can drain, while a client
+posts interactive ``approve``/``reopen`` events at a steady rate. Reports
+latency percentiles of the interactive events from post to dispatch, and the
+bulk throughput, draining through the FIFO EventQueue and the Scheduler.
+
+EventQueue is not safe to post to while draining, so that run serializes
+posts and batches with a lock.
+
+Usage: python -m benchmarks.bench_priority [--seconds N] [--backlog N]
+       [--rate N] [--batch N] [--work N] [--json]
+'''
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Deque, Dict, List
+
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope
+from workstate.queue import EventQueue, Scheduler
+
+#: Simulated guard cost of a bulk event, in seconds
+WORK = {'reindex': 20e-6}
+
+#: Documents receiving the interactive events, the others get bulk events
+INTERACTIVE = 16
+
+
+def _busy(seconds: float) -> None:
+    '''Burns CPU for a while, like a guard querying an index'''
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+class Document(Scope):  # pylint: disable=R0903
+    'A document, reindexed in bulk and approved interactively'
+    initial = 'draft'
+
+    class Transitions:  # pylint: disable=R0903
+        'Reindexing has a cost'
+
+        def draft__draft(self) -> bool:
+            'Reindexed'
+            _busy(WORK['reindex'])
+            return True
+
+    class Events:  # pylint: disable=R0903
+        'Document events'
+        reindex = ['draft__draft']
+        approve = ['draft__approved']
+        reopen = ['approved__draft']
+
+    class Priorities:  # pylint: disable=R0903
+        'Priority classes of the events'
+        approve = 'interactive'
+        reopen = 'interactive'
+        reindex = 'bulk'
+
+
+class DocumentEngine(Engine):  # pylint: disable=R0903
+    'Engine of the benchmark model'
+    scopes = [Document]
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    '''Nearest-rank percentile of sorted samples, in milliseconds'''
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+
+def run(mode: str,  # pylint: disable=R0914
+        *,
+        seconds: float = 2.0,
+        documents: int = 10000,
+        backlog: int = 20000,
+        rate: float = 200,
+        batch: int = 64,
+        seed: int = 1) -> Dict[str, Any]:
+    '''Runs the load against one queue kind ('fifo' or 'priority'), returns its report'''
+    dispatcher = Dispatcher(DocumentEngine)
+    dispatcher.add('document', range(documents))
+    queue: Any = Scheduler(dispatcher) if mode == 'priority' else EventQueue(dispatcher, ())
+    lock: Any = threading.Lock() if mode == 'fifo' else nullcontext()
+    posted: Dict[int, Deque[float]] = {key: deque() for key in range(INTERACTIVE)}
+    latencies: List[float] = []
+    counts = {'posted': 0, 'bulk': 0}
+    stop = threading.Event()
+
+    def feeder() -> None:
+        rand = random.Random(seed)
+        while not stop.is_set():
+            if counts['posted'] - counts['bulk'] >= backlog:
+                time.sleep(0.0005)
+                continue
+            for _ in range(256):
+                key = rand.randrange(INTERACTIVE, documents)
+                if rand.random() < 0.5:
+                    key = INTERACTIVE + key % 4
+                with lock:
+                    queue.post('document', key, 'reindex')
+            counts['posted'] += 256
+
+    def client() -> None:
+        state = [False] * INTERACTIVE
+        idx = 0
+        while not stop.is_set():
+            key = idx % INTERACTIVE
+            posted[key].append(time.perf_counter())
+            with lock:
+                queue.post('document', key, 'reopen' if state[key] else 'approve')
+            state[key] = not state[key]
+            idx += 1
+            time.sleep(1 / rate)
+
+    def worker() -> None:
+        while not stop.is_set():
+            with lock:
+                results = queue.drain(batch)
+            now = time.perf_counter()
+            for result in results:
+                if result.event == 'reindex':
+                    counts['bulk'] += 1
+                else:
+                    latencies.append(now - posted[result.key].popleft())
+            if not results:
+                time.sleep(0.0001)
+
+    threads = [threading.Thread(target=target) for target in (feeder, client, worker)]
+    threads[0].start()
+    # Let the backlog build up before measuring
+    while counts['posted'] < backlog:
+        time.sleep(0.001)
+    start = time.perf_counter()
+    bulk = counts['bulk']
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        'mode': mode,
+        'interactive': len(ordered),
+        'waiting': sum(len(times) for times in posted.values()),
+        'latency_ms': {
+            'p50': _percentile(ordered, 0.5),
+            'p99': _percentile(ordered, 0.99),
+            'max': _percentile(ordered, 1.0),
+        },
+        'bulk_per_s': (counts['bulk'] - bulk) / elapsed,
+    }
+
+
+def report(results: List[Dict[str, Any]]) -> None:
+    '''Prints the reports side by side'''
+    print('mode       interactive  waiting   p50 ms   p99 ms   max ms    bulk/s')
+    for result in results:
+        latency = result['latency_ms']
+        print(f"{result['mode']:<10} {result['interactive']:11} {result['waiting']:8}"
+              f" {latency['p50']:8.2f} {latency['p99']:8.2f} {latency['max']:8.2f}"
+              f" {result['bulk_per_s']:9.0f}")
+
+
+def main(argv: List[str] | None = None) -> List[Dict[str, Any]]:
+    '''Runs the benchmark from command line arguments'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help='measured time per mode')
+    parser.add_argument('--backlog', type=int, default=20000, help='queued bulk events')
+    parser.add_argument('--rate', type=float, default=200, help='interactive events per second')
+    parser.add_argument('--batch', type=int, default=64, help='events per drain')
+    parser.add_argument('--work', type=float, default=20, help='bulk guard cost in us')
+    parser.add_argument('--json', action='store_true', help='print the reports as JSON')
+    args = parser.parse_args(argv)
+    WORK['reindex'] = args.work / 1e6
+    results = [
+        run(mode, seconds=args.seconds, backlog=args.backlog, rate=args.rate, batch=args.batch)
+        for mode in ('fifo', 'priority')
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+    return results
+
+
+if __name__ == '__main__':
+    main()
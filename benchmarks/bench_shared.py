@@ -0,0 +1,124 @@
+'''Benchmarks worker start up and model memory, compiling per worker against attaching
+
+Each worker process either loads and compiles the model description itself,
+or attaches to the compiled model published once in shared memory. Reports
+per worker the start up time, the Python heap taken by the model, and the
+time of dispatching events through the model.
+
+Then times attaching to a model of Python scopes (tests.books) in spawned
+workers, cold and with the module imported before: unpickling the scope
+classes and conditions imports their module, which parses the scopes.
+
+Usage: python -m benchmarks.bench_shared [scopes] [states] [workers]
+'''
+from __future__ import annotations
+
+import gc
+import importlib
+import json
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from benchmarks.bench_loader import describe
+from workstate.dispatch import Dispatcher
+from workstate.loader import loads
+from workstate.shared import SharedModel
+
+#: Events dispatched per worker
+EVENTS = 20000
+
+
+def worker(mode: str, source: str, results: Any) -> None:
+    '''Builds or attaches to the model, then dispatches through it'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    model: Any = SharedModel.attach(source) if mode == 'attach' else loads(source)
+    compiled = model.compile()
+    startup = time.perf_counter() - start
+    (heap, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    dispatcher = Dispatcher(model)
+    scope = next(iter(compiled.scopes))
+    store = dispatcher.add(scope, range(EVENTS))
+    start = time.perf_counter()
+    for key in range(EVENTS):
+        store.event(key, 'next_s0')
+    dispatch = time.perf_counter() - start
+    results.put({
+        'mode': mode,
+        'startup_ms': startup * 1000,
+        'heap_kb': heap / 1024,
+        'dispatch_us': dispatch / EVENTS * 1e6,
+    })
+    del dispatcher, store, compiled
+    if mode == 'attach':
+        gc.collect()
+        model.close()
+
+
+def attach_classes(mode: str, name: str, results: Any) -> None:
+    '''Attaches to a model of Python scopes, importing their module before if preloaded'''
+    if mode == 'preloaded':
+        importlib.import_module('tests.books')
+    start = time.perf_counter()
+    model = SharedModel.attach(name)
+    compiled = model.compile()
+    results.put({'mode': mode, 'startup_ms': (time.perf_counter() - start) * 1000})
+    del compiled
+    gc.collect()
+    model.close()
+
+
+def run(mode: str, source: str, workers: int, target: Any = worker) -> List[Dict[str, Any]]:
+    '''Starts fresh worker processes, returns their reports'''
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=target, args=(mode, source, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return reports
+
+
+def main(scopes: int = 30, states: int = 100, workers: int = 4) -> None:
+    '''Runs the benchmark and prints the mean over the workers'''
+    text = json.dumps(describe(scopes, states))
+    shared = SharedModel.publish(loads(text))
+    print(f'{scopes} scopes of {states} states, {workers} workers, '
+          f'shared segment {len(shared.buffer) / 1024:.0f} kB')
+    print('mode      startup ms  heap kB  dispatch us')
+    try:
+        for mode, source in (('compile', text), ('attach', shared.name or '')):
+            reports = run(mode, source, workers)
+            mean = {
+                key: sum(report[key] for report in reports) / len(reports)
+                for key in ('startup_ms', 'heap_kb', 'dispatch_us')
+            }
+            print(f"{mode:<8} {mean['startup_ms']:11.1f} {mean['heap_kb']:8.0f}"
+                  f" {mean['dispatch_us']:12.2f}")
+    finally:
+        shared.close()
+        shared.unlink()
+
+    # Spawned workers import this module, so it must not import tests.books itself
+    shared = SharedModel.publish(importlib.import_module('tests.books').BookEngine)
+    print('Python scopes  startup ms')
+    try:
+        for mode in ('cold', 'preloaded'):
+            reports = run(mode, shared.name or '', workers, attach_classes)
+            print(f"{mode:<14} {sum(report['startup_ms'] for report in reports) / workers:10.1f}")
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -20,6 +20,10 @@ setup(
     # Dependencies
     # install_requires=[],
     # tests_require=[],
+    extras_require={
+        'numpy': ['numpy'],
+        'yaml': ['PyYAML'],
+    },
 
     # Packages
     packages=['workstate'],
@@ -0,0 +1,92 @@
+'''Book/Chapter sample workflow shared by the runtime tests'''
+import time
+from typing import Callable
+
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope, trigger
+
+# pylint: disable=C0111,R0903,E1101,W0238
+
+
+class Chapter(Scope):
+    'A chapter'
+    initial = 'draft'
+
+    class States:
+        draft = 'The chapter is being written'
+        proposed = 'The chapter is proposed for approval'
+        approved = 'The chapter is approved'
+        canceled = 'The chapter is canceled'
+
+    class Transitions:
+        draft__proposed = 'Request chapter approval'
+        proposed__draft = 'Chapter declined'
+        __canceled = 'Chapter canceled'
+
+        def proposed__approved(self):
+            'Chapter approved'
+            return self.marked  # type: ignore
+
+    class Events:
+        propose = "Propose the draft for review", ['draft__proposed']
+        approve = ['proposed__approved']
+        reject = ['proposed__draft']
+        cancel = ['*__canceled'], "Cancel the chapter"
+
+    class Triggers:
+        @trigger('reject', ['proposed'])
+        def check_complete(self):
+            'Rejects chapter if not complete when landing at proposed state'
+            return not self.complete  # type: ignore
+
+
+class Book(Scope):
+    'A book'
+    initial = 'draft'
+
+    class States:
+        draft = 'Book is being written'
+        published = 'Book is done'
+        canceled = 'The Book is canceled'
+
+    class Transitions:
+        draft__published = 'All chapters are approved'
+        __canceled = 'Book canceled'
+
+    class Events:
+        all_approved = ['draft__published']
+        cancel = ['*__canceled']
+
+    class Triggers:
+        @trigger('all_approved', ['chapter:approved'])
+        def publish_book(self):
+            'Publishes book if all chapters are approved'
+            for chapter in self.get_chapter():  # type: ignore
+                if chapter.state != 'approved':
+                    return False
+            return True
+
+
+class BookEngine(Engine):
+    scopes = [Book, Chapter]
+
+
+class Clock:
+    '''A settable stand-in for time.time'''
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def book_dispatcher(chapters: int = 2,
+                    ready: bool = True,
+                    clock: Callable[[], float] = time.time) -> Dispatcher:
+    '''A Dispatcher with book 1 and its chapters, marked and complete if ready'''
+    dispatcher = Dispatcher(BookEngine, clock=clock)
+    dispatcher.add('book', [1])
+    dispatcher.add('chapter', range(chapters), marked=ready, complete=ready)
+    dispatcher.link('chapter', range(chapters), 'book', [1] * chapters)
+    return dispatcher
@@ -0,0 +1,206 @@
+'''WorkState test compiled tables'''
+import random
+import unittest
+from typing import Dict, List, Tuple
+
+from tests.books import BookEngine, Chapter
+from workstate.compiled import Candidate, CompiledScope
+from workstate.dispatch import Dispatcher
+from workstate.engine import BrokenStateModelException, Engine, Scope
+from workstate.exceptions import EventRejectedException
+
+# pylint: disable=C0111,R0903,W0612,R0801
+
+
+class ReachabilityTest(unittest.TestCase):
+    '''Tests the transitive closure index'''
+
+    def test_can_reach(self):
+        '''Reach: Transitive reachability within a scope'''
+        self.assertTrue(Chapter.can_reach('draft', 'approved'))
+        self.assertTrue(Chapter.can_reach('approved', 'approved'))
+        self.assertTrue(Chapter.can_reach('chapter:approved', 'canceled'))
+        self.assertFalse(Chapter.can_reach('approved', 'draft'))
+        self.assertFalse(BookEngine.can_reach('book', 'published', 'draft'))
+        self.assertTrue(BookEngine.can_reach('book', 'draft', 'published'))
+
+    def test_wildcards(self):
+        '''Reach: Wildcard edges apply from every state'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                goo = ['first__second']
+                gaa = ['*__third']
+                back = ['third__first']
+
+        compiled = Scope1.compile().get_scope('scope1')
+        self.assertTrue(all(
+            compiled.can_reach(a, b) for a in compiled.states for b in compiled.states
+        ))
+
+    def test_can_fire(self):
+        '''Reach: Events that can still fire from a state'''
+        compiled = Chapter.compile().get_scope('chapter')
+        self.assertTrue(compiled.can_fire('draft', 'approve'))
+        self.assertTrue(compiled.can_fire('approved', 'cancel'))
+        self.assertFalse(compiled.can_fire('approved', 'approve'))
+        self.assertFalse(compiled.can_fire('canceled', 'cancel'))
+        self.assertFalse(compiled.can_fire('draft', 'moo'))
+
+    def test_closure_limited(self):
+        '''Reach: Closure limited to a set of events'''
+        compiled = Chapter.compile().get_scope('chapter')
+        reach = compiled.closure({compiled.event_ids['propose']})
+        self.assertEqual(reach[compiled.state_id('draft')], 0b1001)
+        self.assertEqual(reach[compiled.state_id('proposed')], 0b1000)
+
+    def test_engine_unreachable(self):
+        '''Reach: Engine validation reports unreachable states per scope'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                goo = ['first__second']
+
+        class Scope2(Scope):
+            initial = 'first'
+
+            class Events:
+                gaa = ['second__third']
+
+        with self.assertRaisesRegex(
+                BrokenStateModelException,
+                r"States \['scope2:second', 'scope2:third'\] not reachable"):
+
+            class TestEngine(Engine):
+                scopes = [Scope1, Scope2]
+
+
+class Ticket(Scope):
+    initial = 'new'
+
+    class Events:
+        web = ['new__web_triage']
+        mail = ['new__mail_triage']
+        phone = ['new__phone_triage']
+        assign = ['web_triage__web_assigned', 'mail_triage__mail_assigned',
+                  'phone_triage__phone_assigned']
+        close = ['web_assigned__closed', 'mail_assigned__closed', 'phone_assigned__closed']
+        escalate = ['phone_assigned__escalated']
+        resolve = ['escalated__closed']
+        cancel = ['*__canceled']
+
+
+class TicketEngine(Engine):
+    scopes = [Ticket]
+
+
+class MinimalTicketEngine(TicketEngine):
+    scopes = [Ticket]
+    minimize = True
+
+
+def moore(cscope: CompiledScope) -> List[int]:
+    '''Naive partition refinement, until no block splits any more'''
+    block = [0] * len(cscope.states)
+    while True:
+        signatures: Dict[Tuple, int] = {}
+        refined = [
+            signatures.setdefault((block[state_id], tuple(
+                (event_id, tuple((cand.condition, block[cand.target]) for cand in cands))
+                for (_state_id, event_id), cands in sorted(cscope.table.items(), key=str)
+                if _state_id == state_id
+            ), cscope.watchers.get(state_id, ()), cscope.timers.get(state_id, ())), len(signatures))
+            for state_id in range(len(cscope.states))
+        ]
+        if len(signatures) == len(set(block)):
+            return refined
+        block = refined
+
+
+class MinimizeTest(unittest.TestCase):
+    '''Tests merging equivalent states'''
+
+    def test_partition(self):
+        '''Minimize: Equivalent states are merged, keeping their names as aliases'''
+        cscope = TicketEngine.compile().get_scope('ticket')
+        mini = MinimalTicketEngine.compile().get_scope('ticket')
+        self.assertEqual(mini.states, ['new', 'web_triage', 'web_assigned', 'phone_triage',
+                                       'phone_assigned', 'canceled', 'closed', 'escalated'])
+        self.assertEqual(mini.aliases, {
+            'mail_triage': 'web_triage', 'mail_assigned': 'web_assigned',
+        })
+        self.assertEqual(mini.state_id('ticket:mail_triage'), mini.state_id('web_triage'))
+        self.assertEqual(mini.fullname(mini.state_id('mail_assigned')), 'ticket:web_assigned')
+        self.assertLess(len(mini.table), len(cscope.table))
+        self.assertEqual(mini.unreachable(), [])
+        self.assertTrue(mini.can_reach('mail_triage', 'closed'))
+        self.assertFalse(mini.can_reach('mail_triage', 'escalated'))
+        self.assertEqual(cscope.minimized().table, mini.table)
+        self.assertIs(mini.minimized(), mini)
+        self.assertIs(Chapter.compile().get_scope('chapter').minimized(),
+                      Chapter.compile().get_scope('chapter'))
+
+    def test_dispatch(self):
+        '''Minimize: Minimized tables dispatch like the original ones'''
+        results = []
+        for model in (TicketEngine, MinimalTicketEngine):
+            dispatcher = Dispatcher(model)
+            dispatcher.add('ticket', range(3))
+            tickets = dispatcher.store('ticket')
+            for key, event in enumerate(('web', 'mail', 'phone')):
+                tickets.event(key, event)
+            for event in ('assign', 'escalate', 'close', 'resolve'):
+                for key in range(3):
+                    try:
+                        tickets.event(key, event)
+                    except EventRejectedException:
+                        pass
+            results.append([
+                tickets.compiled.aliases.get(tickets[key].state, tickets[key].state)
+                for key in range(3)
+            ])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1], ['closed'] * 3)
+
+    def test_names(self):
+        '''Minimize: Entities in merged states report the merged state's name'''
+        dispatcher = Dispatcher(MinimalTicketEngine)
+        history = dispatcher.keep_history()
+        dispatcher.add('ticket', [1])
+        flow = dispatcher.event('ticket', 1, 'mail')
+        self.assertEqual(flow.state, 'ticket:web_triage')
+        self.assertEqual(dispatcher.state('ticket', 1), 'web_triage')
+        self.assertEqual(dispatcher.histogram()['ticket']['web_triage'], 1)
+        self.assertEqual(history.steps('ticket', 0)[-1].to_state, 'ticket:web_triage')
+        self.assertEqual(dispatcher.stats.edge_counts()['ticket:new__mail_triage'], 1)
+        self.assertEqual(MinimalTicketEngine.compile().get_scope('ticket').aliases['mail_triage'],
+                         'web_triage')
+
+    def test_graph(self):
+        '''Minimize: Graphs keep showing the original states'''
+        self.assertIn('ticket:mail_triage', str(MinimalTicketEngine.graph()))
+        self.assertIn('ticket:mail_triage', str(MinimalTicketEngine.graph_focus('ticket')))
+
+    def test_random(self):
+        '''Minimize: Hopcroft refinement matches naive refinement on random tables'''
+        rand = random.Random(7)
+        for _ in range(50):
+            size = rand.randint(1, 30)
+            cscope = CompiledScope('random', None, 0, states=[f's{idx}' for idx in range(size)],
+                                   events=['a', 'b', 'c'])
+            for state_id in range(size):
+                for event_id in range(3):
+                    if rand.random() < 0.6:
+                        cscope.table[(state_id, event_id)] = (
+                            Candidate(rand.randrange(min(size, 4)), None, 0),
+                        )
+            cscope.index()
+            (hopcroft, naive) = (cscope.partition(), moore(cscope))
+            self.assertEqual(
+                [hopcroft.index(block) for block in hopcroft],
+                [naive.index(block) for block in naive],
+            )
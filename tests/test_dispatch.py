@@ -0,0 +1,219 @@
+'''WorkState test Dispatcher'''
+import unittest
+
+from tests.books import Chapter, book_dispatcher
+from workstate.compiled import GUARDED, MULTIPLE, UNCONDITIONAL
+from workstate.dispatch import Dispatcher
+from workstate.engine import BrokenStateModelException, Engine, Scope, trigger
+from workstate.exceptions import EventRejectedException
+
+# pylint: disable=C0111,R0903,E1101
+
+
+class Task(Scope):
+    initial = 'open'
+
+    class Transitions:
+        def held__done(self):
+            return self.ok  # type: ignore
+
+        def review__done(self):
+            return self.ok  # type: ignore
+
+        def review__held(self):
+            return not self.ok  # type: ignore
+
+    class Events:
+        hold = ['open__held']
+        check = ['open__review']
+        finish = ['open__done', 'held__done', 'review__done', 'review__held']
+
+
+class TaskEngine(Engine):
+    scopes = [Task]
+
+
+class DispatchTest(unittest.TestCase):
+    '''Tests event dispatch'''
+
+    def test_trigger_rejects(self):
+        '''Dispatch: Same-scope trigger fires on entering a state'''
+        dispatcher = book_dispatcher(ready=False)
+        flow = dispatcher.event('chapter', 0, 'propose')
+        self.assertEqual(flow.events, [
+            ('propose', None, 'chapter:draft', 'chapter:proposed'),
+            ('reject', 'chapter:check_complete', 'chapter:proposed', 'chapter:draft'),
+        ])
+        self.assertEqual(dispatcher.state('chapter', 0), 'draft')
+
+    def test_guard(self):
+        '''Dispatch: Transition guard rejects event'''
+        dispatcher = book_dispatcher(ready=False)
+        chapter = dispatcher.store('chapter')[0]
+        chapter.complete = True
+        self.assertEqual(chapter.event('propose').state, 'chapter:proposed')
+        with self.assertRaisesRegex(EventRejectedException, 'failing on condition'):
+            chapter.event('approve')
+        self.assertEqual(chapter.state, 'proposed')
+        chapter.marked = True
+        self.assertEqual(chapter.event('approve').events, [
+            ('approve', None, 'chapter:proposed', 'chapter:approved'),
+        ])
+
+    def test_not_allowed(self):
+        '''Dispatch: Event without transition from current state is rejected'''
+        dispatcher = book_dispatcher(ready=False)
+        with self.assertRaisesRegex(EventRejectedException, 'not allowed in state chapter:draft'):
+            dispatcher.event('chapter', 0, 'approve')
+        with self.assertRaisesRegex(EventRejectedException, 'not allowed'):
+            dispatcher.event('chapter', 0, 'all_approved')
+
+    def test_wildcard(self):
+        '''Dispatch: Wildcard transitions apply from any state'''
+        dispatcher = book_dispatcher(ready=False)
+        dispatcher.event('chapter', 1, 'cancel')
+        self.assertEqual(dispatcher.state('chapter', 1), 'canceled')
+        with self.assertRaises(EventRejectedException):
+            dispatcher.event('chapter', 1, 'cancel')
+
+    def test_entry_kinds(self):
+        '''Dispatch: Unconditional, single-guard and multi-candidate entries'''
+        compiled = TaskEngine.compile().get_scope('task')
+        finish = compiled.event_ids['finish']
+        self.assertEqual([compiled.kinds[(compiled.state_id(state), finish)]
+                          for state in ('open', 'held', 'review')],
+                         [UNCONDITIONAL, GUARDED, MULTIPLE])
+        self.assertEqual(list(compiled.direct[finish]), [compiled.state_id('done'), -1, -1, -1])
+        results = []
+        for bulk in (False, True):
+            dispatcher = Dispatcher(TaskEngine)
+            dispatcher.add('task', range(12), ok=[key % 2 == 0 for key in range(12)])
+            for key in range(4, 12):
+                dispatcher.event('task', key, 'hold' if key < 8 else 'check')
+            if bulk:
+                dispatcher.apply('task', 'finish')
+            else:
+                for key in range(12):
+                    try:
+                        dispatcher.event('task', key, 'finish')
+                    except EventRejectedException:
+                        pass
+            results.append(([dispatcher.state('task', key) for key in range(12)],
+                            dispatcher.histogram(), dispatcher.stats.edge_counts()))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1][1]['task'], {'open': 0, 'held': 4, 'done': 8, 'review': 0})
+
+    def test_cross_scope_trigger(self):
+        '''Dispatch: Cross-scope trigger fires on linked entity'''
+        dispatcher = book_dispatcher(ready=False)
+        chapters = dispatcher.store('chapter')
+        for key in (0, 1):
+            chapters[key].complete = True
+            chapters[key].marked = True
+            chapters.event(key, 'propose')
+        self.assertEqual(len(chapters.event(0, 'approve').events), 1)
+        self.assertEqual(dispatcher.state('book', 1), 'draft')
+        self.assertEqual(chapters.event(1, 'approve').events[-1], (
+            'all_approved', 'book:publish_book', 'book:draft', 'book:published',
+        ))
+        self.assertEqual(dispatcher.state('book', 1), 'published')
+
+    def test_unknown_scope(self):
+        '''Dispatch: Unknown scope'''
+        with self.assertRaisesRegex(BrokenStateModelException, 'not part of the model'):
+            book_dispatcher(ready=False).event('moo', 1, 'cancel')
+
+    def test_cascade_limit(self):
+        '''Dispatch: Endless trigger cascades are stopped'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                go = ['first__second']
+                back = ['second__first']
+
+            class Triggers:
+                @trigger('back', ['second'])
+                def to_first(self):
+                    return True
+
+                @trigger('go', ['first'])
+                def to_second(self):
+                    return True
+
+        dispatcher = Dispatcher(Scope1)
+        dispatcher.add('scope1', [1])
+        with self.assertRaisesRegex(BrokenStateModelException, 'cascade exceeded'):
+            dispatcher.event('scope1', 1, 'go')
+
+
+class FragileBook(Scope):
+    scope = 'book'
+    initial = 'draft'
+
+    class Transitions:
+        draft__published = 'All chapters are approved'
+
+    class Events:
+        all_approved = ['draft__published']
+
+    class Triggers:
+        @trigger('all_approved', ['chapter:approved'])
+        def publish_book(self):
+            if self.locked:  # type: ignore
+                raise RuntimeError('Book is locked')
+            chapters = self.get_chapter()  # type: ignore
+            return all(chapter.state == 'approved' for chapter in chapters)
+
+
+class FragileEngine(Engine):
+    scopes = [FragileBook, Chapter]
+
+
+class TransactionTest(unittest.TestCase):
+    '''Tests atomic dispatch of cascades'''
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(FragileEngine)
+        self.dispatcher.add('book', [1], locked=False)
+        self.dispatcher.add('chapter', [0], marked=True, complete=True)
+        self.dispatcher.link('chapter', [0], 'book', [1])
+        self.dispatcher.event('chapter', 0, 'propose')
+
+    def test_commit(self):
+        '''Transaction: Cascade is committed as a whole'''
+        flow = self.dispatcher.event('chapter', 0, 'approve', atomic=True)
+        self.assertEqual(flow.state, 'book:published')
+        self.assertEqual(self.dispatcher.histogram(), {
+            'book': {'draft': 0, 'published': 1},
+            'chapter': {'draft': 0, 'proposed': 0, 'approved': 1, 'canceled': 0},
+        })
+        self.assertEqual(self.dispatcher.recount(), self.dispatcher.histogram())
+        self.assertEqual(self.dispatcher.stats.edge_counts()['book:draft__published'], 1)
+        self.assertEqual(self.dispatcher.stats.edge_counts()['chapter:proposed__approved'], 1)
+
+    def test_rollback(self):
+        '''Transaction: Guard raising halfway through a cascade rolls it back'''
+        self.dispatcher.store('book')[1].locked = True
+        before = self.dispatcher.histogram()
+        with self.assertRaisesRegex(RuntimeError, 'locked'):
+            self.dispatcher.event('chapter', 0, 'approve', atomic=True)
+        self.assertEqual(self.dispatcher.state('chapter', 0), 'proposed')
+        self.assertEqual(self.dispatcher.histogram(), before)
+        self.assertEqual(self.dispatcher.recount(), before)
+        self.assertEqual(self.dispatcher.stats.edge_counts()['chapter:proposed__approved'], 0)
+
+        self.dispatcher.store('book')[1].locked = False
+        self.dispatcher.event('chapter', 0, 'approve', atomic=True)
+        self.assertEqual(self.dispatcher.state('book', 1), 'published')
+
+    def test_group(self):
+        '''Transaction: Several events are rolled back together'''
+        self.dispatcher.add('chapter', [1], marked=True, complete=True)
+        with self.assertRaises(EventRejectedException):
+            with self.dispatcher.transaction():
+                self.dispatcher.event('chapter', 0, 'approve')
+                self.dispatcher.event('chapter', 1, 'approve')
+        self.assertEqual(self.dispatcher.state('chapter', 0), 'proposed')
+        self.assertEqual(self.dispatcher.histogram()['chapter']['approved'], 0)
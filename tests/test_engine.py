@@ -232,3 +232,101 @@ class EngineTest(unittest.TestCase):
                 'scope1:second -> scope2:second',
             },
         )
+
+    def test_shared_scope_models(self):
+        '''Engine: Engines share parsed scope models, only keeping glue locally'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                foo = ['first__second']
+                cancel = ['*__canceled']
+
+        class Scope2(Scope):
+            initial = 'first'
+
+            class Events:
+                bar = ['first__second']
+                cancel = ['*__canceled']
+
+            class Triggers:
+                @trigger('bar', ['scope1:second'])
+                def justdoit(self):
+                    return True
+
+        class TestEngine1(Engine):
+            scopes = [Scope1, Scope2]
+
+        class TestEngine2(Engine):
+            scopes = [Scope1, Scope2]
+
+        (parsed1, parsed2) = (TestEngine1.get_parsed(), TestEngine2.get_parsed())
+        for name in ('scope1:first', 'scope2:second'):
+            self.assertIs(parsed1.states.states[name], parsed2.states.states[name])
+        self.assertIs(
+            parsed1.transitions.transitions['scope1:first__second'],
+            Scope1.get_parsed().transitions.transitions['scope1:first__second'],
+        )
+        self.assertIs(parsed1.events.events['foo'], Scope1.get_parsed().events.events['foo'])
+        self.assertEqual(
+            list(parsed1.events.events['cancel'].transitions),
+            ['scope1:*__canceled', 'scope2:*__canceled'],
+        )
+        self.assertEqual(
+            list(parsed1.states.states['scope1:second'].triggers), ['scope2:justdoit']
+        )
+        self.assertEqual(list(Scope1.get_parsed().states.states['scope1:second'].triggers), [])
+        self.assertEqual(
+            list(parsed1.states.states),
+            list(Scope1.get_parsed().states.states) + list(Scope2.get_parsed().states.states),
+        )
+
+    def test_same_named_scopes(self):
+        '''Engine: Scopes sharing a name are merged, none of them dropped'''
+
+        def part_scope() -> type:
+            class Part(Scope):
+                initial = 'a'
+
+                class Events:
+                    go = ['a__b']
+
+            return Part
+
+        class Part(Scope):
+            initial = 'a'
+
+            class Events:
+                stop = ['a__c']
+
+        class TestEngine(Engine):
+            scopes = [part_scope(), Part]
+
+        parsed = TestEngine.get_parsed()
+        self.assertEqual(list(parsed.states.states), ['part:a', 'part:b', 'part:c'])
+        self.assertEqual(list(parsed.transitions.transitions), ['part:a__b', 'part:a__c'])
+        self.assertEqual(TestEngine.compile().scopes['part'].events, ['go', 'stop'])
+
+    def test_deduplicated_edges(self):
+        '''Engine: Repeated edges and merges don't pile up duplicates'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                foo = ['first__second', 'first__second']
+                bar = ['second__first']
+
+        class TestEngine(Engine):
+            scopes = [Scope1, Scope1]
+
+        parsed = TestEngine.get_parsed()
+        self.assertEqual(list(parsed.events.events['foo'].transitions), ['scope1:first__second'])
+        parsed.events.merge_event(parsed.events.events['foo'])
+        self.assertEqual(len(parsed.events.events['foo'].transitions), 1)
+        self.assertEqual(list(parsed.states.states['scope1:first'].dest_edges),
+                         ['scope1:first__second'])
+        self.assertIn('scope1:first__second', parsed.states.states['scope1:second'].source_edges)
+        self.assertEqual(TestEngine.get_event_map()['scope1:first__second'], ['foo'])
+        self.assertEqual(len(TestEngine.compile().scopes['scope1'].candidates(0, 'foo')), 1)
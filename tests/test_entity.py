@@ -0,0 +1,71 @@
+'''WorkState test free-standing entities'''
+import sys
+import unittest
+
+from tests.books import BookEngine, Chapter
+from workstate.entity import Entity
+from workstate.exceptions import EventRejectedException
+
+# pylint: disable=C0111,R0903,E1101
+
+
+class Doc:
+    def __init__(self, complete: bool = False, marked: bool = False) -> None:
+        self.complete = complete
+        self.marked = marked
+
+
+class EntityTest(unittest.TestCase):
+    '''Tests entities outside of a store'''
+
+    def test_instantiate(self):
+        '''Entity: Instances share the compiled scope'''
+        first = Chapter.instantiate({'complete': False}, key=1)
+        second = BookEngine.instantiate('chapter', Doc(), key=2, state='proposed')
+        self.assertEqual((first.key, first.state, first.scope), (1, 'draft', 'chapter'))
+        self.assertEqual(second.state, 'proposed')
+        self.assertIs(first.compiled, Chapter.instantiate().compiled)
+        self.assertIs(second.compiled, BookEngine.compile().scopes['chapter'])
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertLess(sys.getsizeof(first), 100)
+
+    def test_events(self):
+        '''Entity: Events and same-scope triggers through the shared tables'''
+        sample = Chapter.instantiate({'complete': False, 'marked': False})
+        self.assertEqual(sample.event('propose').events, [
+            ('propose', None, 'chapter:draft', 'chapter:proposed'),
+            ('reject', 'chapter:check_complete', 'chapter:proposed', 'chapter:draft'),
+        ])
+        self.assertEqual(sample.state, 'draft')
+        sample.obj['complete'] = True
+        self.assertEqual(sample.propose().state, 'chapter:proposed')
+        with self.assertRaisesRegex(EventRejectedException, 'failing on condition'):
+            sample.approve()
+        sample.obj['marked'] = True
+        self.assertEqual(sample.approve().events, [
+            ('approve', None, 'chapter:proposed', 'chapter:approved'),
+        ])
+        with self.assertRaisesRegex(EventRejectedException, 'not allowed'):
+            sample.event('propose')
+
+    def test_cross_scope(self):
+        '''Entity: Cross-scope triggers are left to a Dispatcher'''
+        sample = BookEngine.instantiate('chapter', Doc(True, True), state='proposed')
+        self.assertEqual(len(sample.approve().events), 1)
+
+    def test_allowed(self):
+        '''Entity: Allowed events of the current state'''
+        sample = Chapter.instantiate()
+        self.assertEqual(sorted(sample.allowed()), ['cancel', 'propose'])
+        sample.state_id = sample.compiled.state_id('canceled')
+        self.assertEqual(sample.allowed(), [])
+
+    def test_attributes(self):
+        '''Entity: Unknown attributes'''
+        sample = Chapter.instantiate(Doc())
+        with self.assertRaisesRegex(AttributeError, 'chapter entity has no attribute moo'):
+            getattr(sample, 'moo')
+        self.assertEqual(repr(sample), "<chapter:draft key=None>")
+        bare = Entity.__new__(Entity)
+        with self.assertRaises(AttributeError):
+            getattr(bare, 'moo')
@@ -0,0 +1,186 @@
+'''WorkState test declarative condition expressions'''
+import random
+import unittest
+from typing import Type
+
+import numpy as np
+
+from tests.books import BookEngine
+from workstate.compiled import compile_parsed
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope, trigger
+from workstate.exceptions import EventRejectedException
+from workstate.expr import Expr, attr, count, in_state
+
+# pylint: disable=C0111,R0903,R0124,C0121
+
+
+class Chapter(Scope):
+    initial = 'draft'
+
+    class Transitions:
+        proposed__approved = attr('marked').describe('Chapter approved')
+
+    class Events:
+        propose = ['draft__proposed']
+        approve = ['proposed__approved']
+        reject = ['proposed__draft']
+        cancel = ['*__canceled']
+
+    class Triggers:
+        check_complete = trigger('reject', ['proposed'])(~attr('complete'))
+
+
+class Book(Scope):
+    initial = 'draft'
+
+    class Events:
+        all_approved = ['draft__published']
+        cancel = ['*__canceled']
+
+    class Triggers:
+        publish_book = trigger('all_approved', ['chapter:approved'])(
+            count('chapter', 'approved') == count('chapter')
+        )
+
+
+class ExprEngine(Engine):
+    scopes = [Book, Chapter]
+
+
+def populate(model: type, books: int, chapters: int, seed: int = 1) -> Dispatcher:
+    rand = random.Random(seed)
+    size = books * chapters
+    dispatcher = Dispatcher(model)
+    dispatcher.add('book', range(books))
+    dispatcher.add(
+        'chapter', range(size),
+        complete=[rand.random() < 0.8 for _ in range(size)],
+        marked=[rand.random() < 0.9 for _ in range(size)],
+    )
+    dispatcher.link('chapter', range(size), 'book', [key // chapters for key in range(size)])
+    return dispatcher
+
+
+class ExprTest(unittest.TestCase):
+    '''Tests declarative condition expressions'''
+
+    def test_declared(self):
+        '''Expr: Names, docs and dependencies of declared conditions'''
+        trans = ExprEngine.get_parsed().transitions.transitions['chapter:proposed__approved']
+        self.assertEqual(trans.doc, 'Chapter approved')
+        _trigger = ExprEngine.get_parsed().triggers.triggers['book:publish_book']
+        self.assertEqual(_trigger.doc, 'count(chapter: approved) == count(chapter)')
+        depends = getattr(_trigger.condition, 'depends')
+        self.assertEqual(depends, ((), ('chapter', )))
+        self.assertEqual(str(attr('a') & (attr('b') | ~in_state('x', 'y'))),
+                         '(a & (b | ~in_state(x, y)))')
+        self.assertEqual((attr('a') > 1).depends, (('a', ), ()))
+
+    def test_truth(self):
+        '''Expr: Expressions have no truth value'''
+        expr = attr('a')
+        self.assertIn(expr, [expr])
+        self.assertEqual({expr: 1}[expr], 1)
+        for compared in (expr == expr, expr != expr, expr < 1, expr & 1):
+            with self.assertRaisesRegex(TypeError, 'no truth value'):
+                bool(compared)
+
+    def test_recompile(self):
+        '''Expr: Compiled scopes are re-used only with the same expression objects'''
+        def task_scope(condition: Expr) -> Type[Scope]:
+            class Task(Scope):
+                initial = 'open'
+
+                class Transitions:
+                    open__done = condition
+
+                class Events:
+                    finish = ['open__done']
+
+            return Task
+
+        condition = attr('effort') > 1
+        first = task_scope(condition)
+        for (task, reused) in ((task_scope(condition), True),
+                               (task_scope(attr('effort') > 1), False)):
+            compiled = compile_parsed(task.get_parsed(), {'task': 'open'}, {'task': first},
+                                      [first.compile()])
+            self.assertIs(compiled.scopes['task'] is first.compile().scopes['task'], reused)
+
+    def test_dispatch(self):
+        '''Expr: Expression conditions dispatch like the equivalent callables'''
+        for model in (BookEngine, ExprEngine):
+            dispatcher = populate(model, 1, 2)
+            chapters = dispatcher.store('chapter')
+            chapters[0].complete = False
+            self.assertEqual(chapters.event(0, 'propose').state, 'chapter:draft')
+            for key in (0, 1):
+                chapters[key].complete = True
+                chapters[key].marked = True
+                chapters.event(key, 'propose')
+            self.assertEqual(len(chapters.event(0, 'approve').events), 1)
+            self.assertEqual(chapters.event(1, 'approve').events[-1], (
+                'all_approved', 'book:publish_book', 'book:draft', 'book:published',
+            ))
+
+    def test_vector(self):
+        '''Expr: Vectorized evaluation matches per entity evaluation'''
+        dispatcher = populate(ExprEngine, 10, 5)
+        chapters = dispatcher.store('chapter')
+        chapters.apply('propose')
+        books = dispatcher.store('book')
+        for expr, store in (
+            (attr('complete') & ~attr('marked'), chapters),
+            (in_state('proposed') | (attr('marked') == False), chapters),  # noqa: E712
+            (count('book', 'draft') > 0, chapters),
+            (count('chapter', 'proposed') >= 4, books),
+            (count('chapter') == 5, books),
+        ):
+            self.assertEqual(
+                expr.vector(store).tolist(),
+                [expr(store[key]) for key in range(len(store))],
+                str(expr),
+            )
+            rows = np.arange(1, len(store), 3)
+            self.assertEqual(
+                np.broadcast_to(expr.vector(store, rows), (len(rows), )).tolist(),
+                [expr(store[key]) for key in rows.tolist()],
+                str(expr),
+            )
+
+    def test_apply(self):
+        '''Expr: Bulk application matches dispatching entity by entity'''
+        results = []
+        for model, bulk in ((BookEngine, False), (BookEngine, True), (ExprEngine, True)):
+            dispatcher = populate(model, 20, 4)
+            chapters = dispatcher.store('chapter')
+            moved = []
+            for event in ('propose', 'approve'):
+                if bulk:
+                    moved.append(chapters.apply(event).tolist())
+                    continue
+                moved.append([])
+                for key in range(len(chapters)):
+                    if event in chapters.compiled.allowed[chapters.states[chapters.row(key)]]:
+                        try:
+                            chapters.event(key, event)
+                        except EventRejectedException:
+                            continue
+                        moved[-1].append(key)
+            results.append((moved, dispatcher.histogram(), dispatcher.stats.edge_counts()))
+            self.assertEqual(dispatcher.recount(), dispatcher.histogram())
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        self.assertGreater(results[0][1]['book']['published'], 0)
+
+    def test_apply_keys(self):
+        '''Expr: Bulk application to given entities'''
+        dispatcher = populate(ExprEngine, 1, 3)
+        self.assertEqual(dispatcher.apply('chapter', 'cancel', [2, 0, 2]).tolist(), [2, 0])
+        self.assertEqual(dispatcher.recount(), dispatcher.histogram())
+        self.assertEqual(dispatcher.stats.edge_counts()['chapter:*__canceled'], 2)
+        self.assertEqual(dispatcher.apply('chapter', 'cancel').tolist(), [1])
+        self.assertEqual(dispatcher.apply('chapter', 'cancel').tolist(), [])
+        self.assertEqual(dispatcher.apply('chapter', 'moo').tolist(), [])
+        self.assertIsInstance(dispatcher.apply('book', 'cancel'), np.ndarray)
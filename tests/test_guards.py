@@ -0,0 +1,162 @@
+'''WorkState test isolated condition evaluation'''
+import threading
+import unittest
+
+from tests.books import BookEngine
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope, depends, isolate, trigger
+from workstate.exceptions import EventRejectedException
+from workstate.guards import REJECT
+
+# pylint: disable=C0111,R0903,E1101
+
+HANG = threading.Event()
+
+
+class Job(Scope):
+    initial = 'idle'
+
+    class Transitions:
+        @isolate(0.05, True)
+        def idle__running(self):
+            HANG.wait(5)
+            return True
+
+        @isolate(0.05, REJECT)
+        def running__finished(self):
+            HANG.wait(5)
+            return True
+
+        @isolate(1)
+        def running__idle(self):
+            return self.ready  # type: ignore
+
+    class Events:
+        start = ['idle__running']
+        finish = ['running__finished']
+        pause = ['running__idle']
+
+    class Triggers:
+        @trigger('pause', ['running'])
+        @isolate(0.05, True)
+        def check_ready(self):
+            HANG.wait(5)
+            return False
+
+
+class Probe(Scope):
+    initial = 'idle'
+
+    class Transitions:
+        @depends('ready')
+        @isolate(0.05, False)
+        def idle__ready(self):
+            HANG.wait(5)
+            return True
+
+    class Events:
+        probe = ['idle__ready']
+
+
+class Deploy(Scope):
+    initial = 'idle'
+
+    class Events:
+        start = ['idle__running']
+        verify = ['running__verified']
+
+    class Triggers:
+        @trigger('verify', ['running'])
+        @isolate(0.05, REJECT)
+        def check_health(self):
+            HANG.wait(5)
+            return True
+
+
+class JobEngine(Engine):
+    scopes = [Job]
+
+
+class GuardTest(unittest.TestCase):
+    '''Tests isolated condition evaluation'''
+
+    def tearDown(self):
+        HANG.set()
+
+    def test_timeouts(self):
+        '''Guards: Timed out conditions result in their default or reject'''
+        HANG.clear()
+        dispatcher = Dispatcher(JobEngine)
+        dispatcher.add('job', [1, 2], ready=False)
+        pool = dispatcher.guard_pool(workers=8)
+        self.assertEqual(dispatcher.event('job', 1, 'start').state, 'job:running')
+        with self.assertRaisesRegex(EventRejectedException, 'job:running__finished timed out'):
+            dispatcher.event('job', 1, 'finish')
+        self.assertEqual(pool.timeouts, {
+            'job:idle__running': 1, 'job:check_ready': 1, 'job:running__finished': 1,
+        })
+        self.assertEqual(pool.calls['job:running__idle'], 1)
+        pool.close()
+
+    def test_reject_cascade(self):
+        '''Guards: Rejecting timeouts of triggers stop the cascade, not the event'''
+        HANG.clear()
+        dispatcher = Dispatcher(Deploy)
+        dispatcher.add('deploy', [1, 2])
+        pool = dispatcher.guard_pool()
+        self.assertEqual(dispatcher.event('deploy', 1, 'start').state, 'deploy:running')
+        self.assertEqual(dispatcher.apply('deploy', 'start', [2]).tolist(), [2])
+        self.assertEqual(dispatcher.histogram()['deploy'], {'idle': 0, 'running': 2, 'verified': 0})
+        self.assertEqual(pool.timeouts, {'deploy:check_health': 2})
+        pool.close()
+
+    def test_timeouts_uncached(self):
+        '''Guards: Timeout results aren't cached as condition results'''
+        HANG.clear()
+        dispatcher = Dispatcher(Probe)
+        dispatcher.add('probe', [1])
+        pool = dispatcher.guard_pool()
+        with dispatcher.cycle():
+            for _ in range(2):
+                with self.assertRaises(EventRejectedException):
+                    dispatcher.event('probe', 1, 'probe')
+            self.assertEqual(dispatcher.memo.results, {})
+        self.assertEqual(pool.timeouts, {'probe:idle__ready': 2})
+        HANG.set()
+        self.assertEqual(dispatcher.event('probe', 1, 'probe').state, 'probe:ready')
+        pool.close()
+
+    def test_results(self):
+        '''Guards: Conditions returning in time pass their result'''
+        HANG.set()
+        dispatcher = Dispatcher(JobEngine)
+        dispatcher.add('job', [1], ready=True)
+        pool = dispatcher.guard_pool()
+        self.assertEqual(dispatcher.event('job', 1, 'start').state, 'job:running')
+        self.assertEqual(dispatcher.event('job', 1, 'pause').state, 'job:idle')
+        self.assertEqual(pool.calls['job:check_ready'], 1)
+        self.assertEqual(pool.calls['job:running__idle'], 1)
+        self.assertEqual(sum(pool.timeouts.values()), 0)
+        pool.close()
+
+    def test_named(self):
+        '''Guards: Policies by name take precedence and survive reloads'''
+        dispatcher = Dispatcher(BookEngine)
+        dispatcher.add('book', [1])
+        dispatcher.add('chapter', [0], marked=True, complete=True)
+        dispatcher.link('chapter', [0], 'book', [1])
+        pool = dispatcher.guard_pool(conditions={
+            'chapter:proposed__approved': (1, False),
+            'book:publish_book': (1, False),
+        })
+        self.assertEqual(
+            sorted(name for (name, _, _) in pool.policies.values()),
+            ['book:publish_book', 'chapter:proposed__approved'],
+        )
+        dispatcher.event('chapter', 0, 'propose')
+        self.assertEqual(dispatcher.event('chapter', 0, 'approve').state, 'book:published')
+        self.assertEqual(pool.calls, {'chapter:proposed__approved': 1, 'book:publish_book': 1})
+        dispatcher.reload(BookEngine)
+        self.assertEqual(len(dispatcher.memo.pool.policies), 2)  # type: ignore
+        self.assertEqual(dispatcher.guard_pool().policies, {})
+        pool.close()
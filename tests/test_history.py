@@ -0,0 +1,123 @@
+'''WorkState test transition history'''
+import unittest
+from dataclasses import replace
+
+from tests.books import BookEngine, Clock, book_dispatcher
+from tests.test_reload import ReviewEngine
+from workstate.compiled import CompiledEngine
+from workstate.exceptions import BrokenStateModelException
+from workstate.history import History, Step
+
+# pylint: disable=C0111,R0903
+
+
+class HistoryTest(unittest.TestCase):
+    '''Tests compact per-entity transition history'''
+
+    def test_steps(self):
+        '''History: Hops are recorded and decoded with their causes'''
+        clock = Clock(1000.0)
+        dispatcher = book_dispatcher(clock=clock)
+        self.assertEqual(dispatcher.timeline('chapter', 0), [])
+        dispatcher.keep_history()
+        chapters = dispatcher.store('chapter')
+        chapters[0].complete = False
+        chapters.event(0, 'propose')
+        clock.now += 1.5
+        chapters[0].complete = True
+        chapters.event(0, 'propose')
+        chapters.event(1, 'propose')
+        chapters.event(0, 'approve')
+        clock.now += 0.25
+        chapters.event(1, 'approve')
+        self.assertEqual(dispatcher.timeline('chapter', 0), [
+            Step(1000.0, 'propose', None, 'chapter:draft', 'chapter:proposed'),
+            Step(1000.0, 'reject', 'chapter:check_complete', 'chapter:proposed', 'chapter:draft'),
+            Step(1001.5, 'propose', None, 'chapter:draft', 'chapter:proposed'),
+            Step(1001.5, 'approve', None, 'chapter:proposed', 'chapter:approved'),
+        ])
+        self.assertEqual(dispatcher.timeline('book', 1), [
+            Step(1001.75, 'all_approved', 'book:publish_book', 'book:draft', 'book:published'),
+        ])
+        self.assertEqual(len(dispatcher.history.raw('chapter', 1)[0]), 5)  # type: ignore
+
+    def test_capacity(self):
+        '''History: Rings keep the most recent records'''
+        clock = Clock(1000.0)
+        history = History(BookEngine.compile(), capacity=3, clock=clock)
+        for idx in range(5):
+            clock.now += 1
+            history.record('chapter', 7, idx, 0, idx, idx + 1)
+        self.assertEqual([record[0] for record in history.raw('chapter', 7)], [2, 3, 4])
+        self.assertEqual(len(history.rings['chapter'][7]), 7)
+        with self.assertRaisesRegex(ValueError, 'at least 1'):
+            History(BookEngine.compile(), capacity=0)
+
+    def test_age(self):
+        '''History: Records past the maximum age are dropped'''
+        clock = Clock(1000.0)
+        history = History(BookEngine.compile(), max_age=10, clock=clock)
+        history.record('chapter', 1, 0, 0, 0, 1)
+        clock.now += 6
+        history.record('chapter', 1, 0, 0, 1, 0)
+        history.record('chapter', 2, 0, 0, 0, 1)
+        clock.now += 6
+        self.assertEqual(len(history.raw('chapter', 1)), 1)
+        self.assertEqual(history.prune(), 0)
+        clock.now += 6
+        self.assertEqual(history.raw('chapter', 1), [])
+        self.assertEqual(history.prune(), 2)
+        self.assertEqual(history.rings['chapter'], {})
+        self.assertEqual(History(BookEngine.compile()).prune(), 0)
+
+    def test_transaction(self):
+        '''History: Rolled back hops are not recorded'''
+        dispatcher = book_dispatcher(clock=Clock(1000.0))
+        dispatcher.keep_history()
+        with self.assertRaises(RuntimeError):
+            with dispatcher.transaction():
+                dispatcher.event('chapter', 0, 'propose')
+                raise RuntimeError
+        self.assertEqual(dispatcher.timeline('chapter', 0), [])
+        dispatcher.event('chapter', 0, 'propose', atomic=True)
+        self.assertEqual(len(dispatcher.timeline('chapter', 0)), 1)
+
+    def test_bulk(self):
+        '''History: Bulk application records hops'''
+        dispatcher = book_dispatcher(clock=Clock(1000.0))
+        dispatcher.keep_history()
+        dispatcher.apply('chapter', 'propose')
+        dispatcher.apply('chapter', 'approve')
+        self.assertEqual(
+            [step.event for step in dispatcher.timeline('chapter', 1)], ['propose', 'approve']
+        )
+        self.assertEqual(dispatcher.timeline('book', 1)[0].trigger, 'book:publish_book')
+
+    def test_reload(self):
+        '''History: Records are translated to a reloaded model'''
+        dispatcher = book_dispatcher(clock=Clock(1000.0))
+        dispatcher.keep_history()
+        dispatcher.event('chapter', 0, 'propose')
+        dispatcher.event('chapter', 0, 'approve')
+        dispatcher.event('chapter', 1, 'propose')
+        dispatcher.reload(ReviewEngine, {'chapter:proposed': 'review'})
+        self.assertEqual(
+            [(step.event, step.to_state) for step in dispatcher.timeline('chapter', 0)],
+            [('?', 'chapter:review'), ('approve', 'chapter:approved')],
+        )
+        self.assertEqual(dispatcher.timeline('chapter', 1)[0].from_state, 'chapter:draft')
+
+    def test_limits(self):
+        '''History: Models with ids beyond the record fields are refused'''
+        compiled = ReviewEngine.compile()
+        chapter = compiled.scopes['chapter']
+        timers = {
+            state_id: tuple(timer._replace(id=0x7FFF) for timer in _timers)
+            for state_id, _timers in chapter.timers.items()
+        }
+        History(compiled)
+        with self.assertRaisesRegex(BrokenStateModelException, 'too many timers'):
+            History(CompiledEngine(
+                {**compiled.scopes, 'chapter': replace(chapter, timers=timers)},
+                compiled.triggers,
+            ))
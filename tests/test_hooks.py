@@ -0,0 +1,119 @@
+'''WorkState test profiling hooks'''
+import unittest
+from typing import Any, Dict, List, Tuple
+
+from tests.books import BookEngine, Clock, book_dispatcher
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope
+from workstate.exceptions import EventRejectedException
+from workstate.hooks import HOOKS, PHASES, Hooks
+
+# pylint: disable=C0111,R0903
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+
+    def __call__(self, phase: str, context: Dict[str, Any]) -> None:
+        self.calls.append((phase, context))
+
+    def phases(self) -> List[str]:
+        return [phase for phase, _ in self.calls]
+
+
+class HooksTest(unittest.TestCase):
+    '''Tests profiling hooks'''
+
+    def tearDown(self):
+        HOOKS.clear()
+
+    def test_registry(self):
+        '''Hooks: Hook points hold the callbacks of their phases'''
+        hooks = Hooks()
+        recorder = Recorder()
+        self.assertEqual(hooks.dispatch, ())
+        with hooks.registered('dispatch_end', recorder):
+            self.assertEqual(hooks.dispatch, (recorder, ))
+            hooks.register('guard', recorder)
+            self.assertEqual(hooks.guard, (recorder, ))
+        self.assertEqual(hooks.dispatch, ())
+        hooks.unregister('guard', recorder)
+        self.assertFalse(any(hooks.callbacks[phase] for phase in PHASES))
+        with self.assertRaisesRegex(ValueError, 'Unknown hook phase parse'):
+            hooks.register('parse', recorder)
+
+    def test_build(self):
+        '''Hooks: Parsing, merging, validating and compiling models are timed'''
+        recorder = Recorder()
+        for phase in ('scope_parse', 'engine_merge', 'engine_validate', 'compile'):
+            HOOKS.register(phase, recorder)
+
+        class Task(Scope):
+            initial = 'open'
+
+            class Events:
+                finish = ['open__done']
+
+        class TaskEngine(Engine):
+            scopes = [Task]
+
+        # Validation compiles the scope, then the engine re-using it
+        self.assertEqual(recorder.phases(), [
+            'scope_parse', 'engine_merge', 'compile', 'compile', 'engine_validate',
+        ])
+        self.assertEqual(recorder.calls[0][1]['scope'], 'task')
+        self.assertEqual(recorder.calls[1][1]['scopes'], ['task'])
+        self.assertEqual([context['model'] for _, context in recorder.calls[2:4]],
+                         ['Task', 'TaskEngine'])
+        self.assertIs(recorder.calls[3][1]['result'], TaskEngine.compile())
+        self.assertTrue(all(context['seconds'] >= 0 for _, context in recorder.calls))
+
+    def test_dispatch(self):
+        '''Hooks: Dispatches report their guard calls, triggers and commits'''
+        dispatcher = book_dispatcher(clock=Clock())
+        recorder = Recorder()
+        for phase in ('dispatch_start', 'dispatch_end', 'guard', 'trigger', 'commit'):
+            HOOKS.register(phase, recorder)
+        chapters = dispatcher.store('chapter')
+        chapters[0].complete = False
+        dispatcher.event('chapter', 0, 'propose', atomic=True)
+        self.assertEqual(recorder.phases(), [
+            'dispatch_start', 'guard', 'trigger', 'dispatch_end', 'commit',
+        ])
+        (start, guard, _trigger, end, commit) = [context for _, context in recorder.calls]
+        self.assertEqual(start, {'scope': 'chapter', 'key': 0, 'event': 'propose'})
+        self.assertEqual((guard['condition'], guard['key'], guard['result']),
+                         ('check_complete', 0, True))
+        self.assertEqual((_trigger['trigger'], _trigger['event']),
+                         ('chapter:check_complete', 'reject'))
+        self.assertTrue(end['result'])
+        self.assertGreaterEqual(end['seconds'], guard['seconds'])
+        self.assertEqual((commit['scopes'], commit['hops']), ({'chapter': 1}, 2))
+
+        recorder.calls.clear()
+        chapters[0].complete = True
+        dispatcher.apply('chapter', 'propose')
+        dispatcher.apply('chapter', 'approve')
+        self.assertEqual([
+            (phase, context.get('entities')) for phase, context in recorder.calls
+            if phase != 'guard'
+        ], [
+            ('dispatch_start', 2), ('dispatch_end', 2),
+            ('dispatch_start', 2), ('trigger', 1), ('dispatch_end', 2),
+        ])
+
+        recorder.calls.clear()
+        with self.assertRaises(EventRejectedException):
+            dispatcher.event('book', 1, 'all_approved')
+        self.assertIsInstance(recorder.calls[-1][1]['error'], EventRejectedException)
+
+    def test_unhooked(self):
+        '''Hooks: Nothing is reported without callbacks'''
+        recorder = Recorder()
+        with HOOKS.registered('guard', recorder):
+            pass
+        dispatcher = Dispatcher(BookEngine)
+        dispatcher.add('chapter', [1], marked=True, complete=True)
+        dispatcher.event('chapter', 1, 'propose')
+        self.assertEqual(recorder.calls, [])
@@ -0,0 +1,152 @@
+'''WorkState test model loader'''
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from tests.books import BookEngine
+from workstate.dispatch import Dispatcher
+from workstate.engine import BrokenStateModelException
+from workstate.loader import build_engine, load, loads, resolve
+
+# pylint: disable=C0111
+
+BOOKS = {
+    'name': 'BookEngine',
+    'scopes': {
+        'book': {
+            'doc': 'A book',
+            'initial': 'draft',
+            'states': {
+                'draft': 'Book is being written',
+                'published': 'Book is done',
+                'canceled': 'The Book is canceled',
+            },
+            'transitions': {
+                'draft__published': 'All chapters are approved',
+                '__canceled': 'Book canceled',
+            },
+            'events': {
+                'all_approved': ['draft__published'],
+                'cancel': ['*__canceled'],
+            },
+            'triggers': {
+                'publish_book': {
+                    'event': 'all_approved',
+                    'states': ['chapter:approved'],
+                    'condition': 'tests.books.Book.Triggers.publish_book',
+                },
+            },
+        },
+        'chapter': {
+            'doc': 'A chapter',
+            'initial': 'draft',
+            'states': {
+                'draft': 'The chapter is being written',
+                'proposed': 'The chapter is proposed for approval',
+                'approved': 'The chapter is approved',
+                'canceled': 'The chapter is canceled',
+            },
+            'transitions': {
+                'draft__proposed': 'Request chapter approval',
+                'proposed__approved': {
+                    'doc': 'Chapter approved',
+                    'condition': 'tests.books.Chapter.Transitions.proposed__approved',
+                },
+                'proposed__draft': 'Chapter declined',
+                '__canceled': 'Chapter canceled',
+            },
+            'events': {
+                'propose': {
+                    'doc': 'Propose the draft for review',
+                    'transitions': ['draft__proposed'],
+                },
+                'approve': ['proposed__approved'],
+                'reject': ['proposed__draft'],
+                'cancel': {'transitions': ['*__canceled'], 'doc': 'Cancel the chapter'},
+            },
+            'triggers': {
+                'check_complete': {
+                    'event': 'reject',
+                    'states': ['proposed'],
+                    'condition': 'tests.books.Chapter.Triggers.check_complete',
+                },
+            },
+        },
+    },
+}
+
+
+class LoaderTest(unittest.TestCase):
+    '''Tests loading models from descriptions'''
+
+    def test_equivalent(self):
+        '''Loader: Loaded model matches the class-based model'''
+        engine = build_engine(BOOKS)
+        (loaded, parsed) = (engine.get_parsed(), BookEngine.get_parsed())
+        self.assertEqual(engine.__name__, 'BookEngine')
+        self.assertEqual(loaded.scopes, parsed.scopes)
+        self.assertEqual(dict(loaded.states.states), dict(parsed.states.states))
+        self.assertEqual(dict(loaded.transitions.transitions), dict(parsed.transitions.transitions))
+        self.assertEqual(dict(loaded.events.events), dict(parsed.events.events))
+        self.assertEqual(dict(loaded.triggers.triggers), dict(parsed.triggers.triggers))
+
+    def test_dispatch(self):
+        '''Loader: Loaded model dispatches'''
+        dispatcher = Dispatcher(build_engine(BOOKS))
+        dispatcher.add('chapter', [1], complete=False, marked=False)
+        self.assertEqual(dispatcher.event('chapter', 1, 'propose').state, 'chapter:draft')
+
+    def test_formats(self):
+        '''Loader: JSON and YAML files'''
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'books.json')
+            with open(filename, 'w', encoding='utf-8') as outf:
+                json.dump(BOOKS, outf)
+            self.assertEqual(load(filename).compile().scopes['chapter'].states,
+                             ['draft', 'proposed', 'approved', 'canceled'])
+        engine = loads(
+            'scopes:\n'
+            '  door:\n'
+            '    initial: closed\n'
+            '    events: {open: [closed__opened], close: [opened__closed]}\n'
+            '    timers: {auto_close: [close, opened, 30]}\n',
+            'yaml',
+        )
+        self.assertEqual(engine.compile().scopes['door'].states, ['closed', 'opened'])
+        self.assertEqual(engine.get_parsed().timers.timers['door:auto_close'].seconds, 30.0)
+        with self.assertRaises(ValueError):
+            loads('', 'toml')
+
+    def test_broken(self):
+        '''Loader: Broken descriptions raise'''
+        with self.assertRaisesRegex(BrokenStateModelException, 'scopes'):
+            build_engine({'scopes': []})
+        with self.assertRaisesRegex(BrokenStateModelException, 'Events need'):
+            build_engine({'scopes': {'door': {'events': {'open': 'closed__opened'}}}})
+        with self.assertRaisesRegex(BrokenStateModelException, 'Triggers need'):
+            build_engine({'scopes': {'door': {'triggers': {'shut': 'close'}}}})
+        with self.assertRaisesRegex(BrokenStateModelException, 'Timers need'):
+            build_engine({'scopes': {'door': {'timers': {'shut': ['close', 'opened']}}}})
+        with self.assertRaisesRegex(BrokenStateModelException, 'not reachable'):
+            build_engine({'scopes': {'door': {
+                'initial': 'closed', 'events': {'open': ['opened__closed']},
+            }}})
+
+    def test_resolve(self):
+        '''Loader: Dotted paths resolve to callables'''
+        self.assertIs(resolve('os.path.join'), os.path.join)
+        for path in ('os.path.nope', 'nope.nope', 'os.sep'):
+            with self.assertRaisesRegex(BrokenStateModelException, 'Cannot resolve'):
+                resolve(path)
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'broken_conditions.py'), 'w', encoding='utf-8') as outf:
+                outf.write('import workstate_missing_dependency\n')
+            sys.path.insert(0, tmp)
+            try:
+                with self.assertRaisesRegex(ImportError, 'workstate_missing_dependency'):
+                    resolve('broken_conditions.check')
+            finally:
+                sys.path.remove(tmp)
+                sys.modules.pop('broken_conditions', None)
@@ -0,0 +1,111 @@
+'''WorkState test condition memoization'''
+import unittest
+
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope, depends, trigger
+
+# pylint: disable=C0111,R0903,E1101
+
+CALLS = {'ready': 0, 'done': 0, 'plain': 0}
+
+
+class Job(Scope):
+    initial = 'idle'
+
+    class Events:
+        start = ['idle__running']
+        pause = ['running__idle']
+        finish = ['running__finished']
+
+    class Triggers:
+        @trigger('finish', ['running'])
+        @depends('ready')
+        def check_ready(self):
+            CALLS['ready'] += 1
+            return self.ready  # type: ignore
+
+        @trigger('pause', ['running'])
+        def plain(self):
+            CALLS['plain'] += 1
+            return False
+
+
+@depends(scopes=['job'])
+def all_done(self):
+    CALLS['done'] += 1
+    return all(job.state == 'finished' for job in self.get_job())
+
+
+class Batch(Scope):
+    initial = 'open'
+
+    class Transitions:
+        open__closed = all_done
+
+    class Events:
+        close = ['open__closed']
+
+    class Triggers:
+        all_done = trigger('close', ['job:finished', 'job:running'])(all_done)
+
+
+class JobEngine(Engine):
+    scopes = [Batch, Job]
+
+
+class MemoTest(unittest.TestCase):
+    '''Tests condition result caching within a dispatch cycle'''
+
+    def setUp(self):
+        CALLS.update({key: 0 for key in CALLS})
+        self.dispatcher = Dispatcher(JobEngine)
+        self.dispatcher.add('batch', [1])
+        self.dispatcher.add('job', range(3), ready=False)
+        self.dispatcher.link('job', range(3), 'batch', [1] * 3)
+
+    def test_cached_in_cycle(self):
+        '''Memo: Conditions with dependencies are evaluated once per cycle'''
+        with self.dispatcher.cycle():
+            for _ in range(3):
+                self.dispatcher.event('job', 0, 'start')
+                self.dispatcher.event('job', 0, 'pause')
+        self.assertEqual(CALLS['ready'], 1)
+        self.assertEqual(CALLS['plain'], 3)
+        self.assertEqual(self.dispatcher.memo.hits, 2)
+        self.assertEqual(self.dispatcher.memo.results, {})
+
+    def test_not_cached_across_cycles(self):
+        '''Memo: Results are forgotten after a cycle'''
+        for _ in range(2):
+            self.dispatcher.event('job', 0, 'start')
+            self.dispatcher.event('job', 0, 'pause')
+        self.assertEqual(CALLS['ready'], 2)
+
+    def test_attribute_invalidates(self):
+        '''Memo: Writing a declared attribute invalidates the result'''
+        jobs = self.dispatcher.store('job')
+        with self.dispatcher.cycle():
+            jobs.event(0, 'start')
+            jobs.event(0, 'pause')
+            jobs[0].other = 1
+            jobs.event(0, 'start')
+            jobs.event(0, 'pause')
+            self.assertEqual(CALLS['ready'], 1)
+            jobs[0].ready = True
+            self.assertEqual(jobs.event(0, 'start').state, 'job:finished')
+        self.assertEqual(CALLS['ready'], 2)
+
+    def test_related_scope_invalidates(self):
+        '''Memo: State changes in a declared scope invalidate linked results'''
+        jobs = self.dispatcher.store('job')
+        with self.dispatcher.cycle():
+            jobs.event(1, 'start')
+            jobs.event(1, 'pause')
+            self.assertEqual(CALLS['done'], 1)
+            for key in range(3):
+                jobs[key].ready = True
+                jobs.event(key, 'start')
+        # Re-evaluated on every job move, the closing guard re-uses the trigger's result
+        self.assertEqual(CALLS['done'], 7)
+        self.assertEqual(self.dispatcher.memo.hits, 1)
+        self.assertEqual(self.dispatcher.state('batch', 1), 'closed')
@@ -0,0 +1,101 @@
+'''WorkState test partitioned dispatch'''
+import unittest
+
+from tests.books import BookEngine, Clock
+from tests.test_timers import DAY, Chapter
+from workstate.exceptions import EventRejectedException
+from workstate.partition import HashRing, PartitionedDispatcher
+
+# pylint: disable=C0111
+
+
+class HashRingTest(unittest.TestCase):
+    '''Tests consistent hash routing'''
+
+    def test_stable(self):
+        '''Ring: Keys are spread over all partitions, the same way every time'''
+        ring = HashRing(4)
+        owners = [ring(key) for key in range(1000)]
+        self.assertEqual(owners, [HashRing(4)(key) for key in range(1000)])
+        self.assertTrue(all(150 < owners.count(partition) < 350 for partition in range(4)))
+
+    def test_grow(self):
+        '''Ring: Adding a partition only moves keys onto the new partition'''
+        (small, large) = (HashRing(4), HashRing(5))
+        moved = [key for key in range(1000) if small(key) != large(key)]
+        self.assertTrue(all(large(key) == 4 for key in moved))
+        self.assertLess(len(moved), 350)
+
+
+class PartitionedDispatcherTest(unittest.TestCase):
+    '''Tests dispatch over worker processes'''
+
+    def setUp(self):
+        self.dispatcher = PartitionedDispatcher(BookEngine, partitions=2)
+        ring = self.dispatcher.ring
+        # A book with a chapter on either partition
+        self.book = 1
+        self.chapters = [
+            next(key for key in range(100, 200) if ring(key) == partition)
+            for partition in (0, 1)
+        ]
+        self.dispatcher.add('book', [self.book])
+        self.dispatcher.add('chapter', self.chapters, marked=True, complete=[True, True])
+        self.dispatcher.link('chapter', self.chapters, 'book', [self.book] * 2)
+
+    def tearDown(self):
+        self.dispatcher.close()
+
+    def test_event(self):
+        '''Partition: Events apply on the owning partition'''
+        flow = self.dispatcher.event('chapter', self.chapters[0], 'propose')
+        self.assertEqual(flow.state, 'chapter:proposed')
+        self.assertEqual(self.dispatcher.state('chapter', self.chapters[0]), 'proposed')
+        with self.assertRaises(EventRejectedException):
+            self.dispatcher.event('chapter', self.chapters[0], 'propose')
+
+    def test_cross_partition_cascade(self):
+        '''Partition: Triggers cascade onto entities of other partitions'''
+        results = self.dispatcher.dispatch(
+            ('chapter', key, event) for event in ('propose', 'approve') for key in self.chapters
+        )
+        self.assertEqual([result.error for result in results], [None] * len(results))
+        self.assertEqual(self.dispatcher.state('book', self.book), 'published')
+        self.assertIn(
+            ('all_approved', 'book:publish_book', 'book:draft', 'book:published'),
+            [hop for result in results for hop in result.flow.events],  # type: ignore
+        )
+        self.assertEqual(self.dispatcher.histogram(), {
+            'book': {'draft': 0, 'published': 1, 'canceled': 0},
+            'chapter': {'draft': 0, 'proposed': 0, 'approved': 2, 'canceled': 0},
+        })
+
+    def test_condition_reads_remote(self):
+        '''Partition: Conditions see the mirrored state of remote related entities'''
+        results = self.dispatcher.dispatch(
+            ('chapter', self.chapters[0], event) for event in ('propose', 'approve')
+        )
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.dispatcher.state('book', self.book), 'draft')
+
+    def test_ordering(self):
+        '''Partition: Events of an entity apply in order'''
+        events = ['approve', 'propose', 'propose', 'cancel']
+        results = self.dispatcher.dispatch(('chapter', self.chapters[1], event) for event in events)
+        self.assertEqual([result.event for result in results], events)
+        self.assertEqual([result.error is None for result in results], [False, True, False, True])
+        self.assertEqual(self.dispatcher.state('chapter', self.chapters[1]), 'canceled')
+
+    def test_tick_clock(self):
+        '''Partition: Timers are due by the clock of the dispatcher'''
+        clock = Clock()
+        with PartitionedDispatcher(Chapter, partitions=2, clock=clock) as dispatcher:
+            dispatcher.add('chapter', range(4))
+            dispatcher.dispatch(('chapter', key, 'propose') for key in range(4))
+            clock.now = DAY
+            self.assertEqual(dispatcher.tick(), [])
+            clock.now = 7 * DAY + 10
+            self.assertEqual(len(dispatcher.tick()), 4)
+            self.assertEqual(dispatcher.histogram(), {
+                'chapter': {'draft': 4, 'proposed': 0, 'approved': 0},
+            })
@@ -0,0 +1,65 @@
+'''WorkState test event-path planner'''
+import unittest
+from typing import Any
+
+from tests.books import BookEngine, Chapter
+from workstate.engine import Scope
+from workstate.planner import Planner, get_planner
+
+# pylint: disable=C0111,R0903
+
+
+class Scope1(Scope):
+    initial = 'a'
+
+    class Transitions:
+        def b__e(self):
+            return True
+
+    class Events:
+        ab = ['a__b']
+        bc = ['b__c']
+        cd = ['c__d']
+        de = ['d__e']
+        be = ['b__e']
+        reset = ['*__a']
+
+
+class PlannerTest(unittest.TestCase):
+    '''Tests shortest event paths'''
+
+    def test_plan(self):
+        '''Planner: Shortest path of unconditional events'''
+        self.assertEqual(Scope1.plan('a', 'e'), ['ab', 'bc', 'cd', 'de'])
+        self.assertEqual(Scope1.plan('e', 'c'), ['reset', 'ab', 'bc'])
+        self.assertEqual(Scope1.plan('c', 'c'), [])
+
+    def test_guarded(self):
+        '''Planner: Guarded edges only used when asked for'''
+        self.assertEqual(Scope1.plan('a', 'e', guarded=True), ['ab', 'be'])
+        self.assertIsNone(Chapter.plan('draft', 'approved'))
+        self.assertEqual(Chapter.plan('draft', 'approved', guarded=True), ['propose', 'approve'])
+
+    def test_no_path(self):
+        '''Planner: No path'''
+        self.assertIsNone(BookEngine.plan('book', 'published', 'draft'))
+        self.assertEqual(BookEngine.plan('book', 'draft', 'published'), ['all_approved'])
+
+    def test_next_hop(self):
+        '''Planner: Constant time next hop lookup'''
+        planner = get_planner(Scope1.compile().get_scope('scope1'))
+        self.assertIs(planner, get_planner(Scope1.compile().get_scope('scope1')))
+        self.assertEqual(planner.next_hop('a', 'd'), ('ab', 'b'))
+        self.assertEqual(planner.next_hop('b', 'd'), ('bc', 'c'))
+        self.assertIsNone(planner.next_hop('a', 'a'))
+
+    def test_large(self):
+        '''Planner: Chain of many states'''
+        events = {f'e{idx}': [f's{idx}__s{idx + 1}'] for idx in range(300)}
+        events['restart'] = ['*__s0']
+        scope: Any = type(
+            'Long', (Scope, ), {'initial': 's0', 'Events': type('Events', (), events)}
+        )
+        planner = Planner(scope.compile().get_scope('long'))
+        self.assertEqual(len(planner.plan('s0', 's300') or ()), 300)
+        self.assertEqual(planner.plan('s299', 's1'), ['restart', 'e0'])
@@ -0,0 +1,242 @@
+'''WorkState test event queue'''
+import unittest
+
+from tests.books import book_dispatcher
+from workstate.dispatch import Dispatcher
+from workstate.engine import BrokenStateModelException, Scope
+from workstate.exceptions import EventRejectedException
+from workstate.loader import build_scope
+from workstate.queue import EventQueue, Scheduler
+
+# pylint: disable=C0111,R0903,W0612,E1101
+
+
+class Scope1(Scope):
+    initial = 'first'
+
+    class Events:
+        goo = ['first__second']
+        gaa = ['second__third']
+        stop = ['*__stopped']
+
+
+class Ticket(Scope):
+    initial = 'open'
+
+    class Events:
+        touch = ['open__open']
+        reindex = ['open__open']
+        approve = ['open__approved']
+
+    class Priorities:
+        approve = 'interactive'
+        reindex = 'bulk'
+
+
+class Guarded(Scope):
+    initial = 'a'
+
+    class States:
+        a = 'Start'
+        b = 'Middle'
+        c = 'End'
+        dead = 'Dead end'
+
+    class Transitions:
+        a__b = 'Go'
+        b__c = 'Go on'
+
+        def a__dead(self):
+            'Maybe die'
+            return self.doomed  # type: ignore
+
+    class Events:
+        maybe = ['a__dead']
+        go = ['a__b']
+        go2 = ['b__c']
+
+
+class QueueTest(unittest.TestCase):
+    '''Tests per-entity queues and coalescing'''
+
+    def test_fifo(self):
+        '''Queue: Events are dispatched per entity in order'''
+        dispatcher = book_dispatcher(3)
+        queue = EventQueue(dispatcher, rules=())
+        for key in range(3):
+            queue.post('chapter', key, 'propose')
+            queue.post('chapter', key, 'approve')
+        self.assertEqual(len(queue), 6)
+        results = queue.drain()
+        self.assertEqual([(res.key, res.event) for res in results], [
+            (0, 'propose'), (0, 'approve'), (1, 'propose'), (1, 'approve'),
+            (2, 'propose'), (2, 'approve'),
+        ])
+        self.assertTrue(all(res.flow for res in results))
+        self.assertEqual(results[-1].flow.state, 'book:published')  # type: ignore
+        self.assertEqual(len(queue), 0)
+
+    def test_batches(self):
+        '''Queue: Draining stops at the batch size, part way through an entity if need be'''
+        dispatcher = Dispatcher(Scope1)
+        dispatcher.add('scope1', range(10))
+        queue = EventQueue(dispatcher)
+        for key in range(10):
+            queue.post('scope1', key, 'goo')
+        self.assertEqual(len(queue.drain(batch=4)), 4)
+        self.assertEqual(len(queue), 6)
+        self.assertEqual(len(queue.drain()), 6)
+        for event in ('gaa', 'stop'):
+            queue.post('scope1', 0, event)
+        queue.post('scope1', 1, 'gaa')
+        self.assertEqual([res.event for res in queue.drain(batch=1)], ['gaa'])
+        self.assertEqual(len(queue), 2)
+        self.assertEqual([(res.key, res.event) for res in queue.drain()], [(0, 'stop'), (1, 'gaa')])
+
+    def test_rejected(self):
+        '''Queue: Rejections are reported, not raised'''
+        dispatcher = book_dispatcher(3)
+        dispatcher.store('chapter')[0].marked = False
+        queue = EventQueue(dispatcher)
+        queue.post('chapter', 0, 'propose')
+        queue.post('chapter', 0, 'approve')
+        results = queue.drain()
+        self.assertIsNone(results[1].flow)
+        self.assertIsInstance(results[1].error, EventRejectedException)
+
+    def test_unreachable(self):
+        '''Queue: Events that can't fire from any reachable state are dropped'''
+        dispatcher = Dispatcher(Scope1)
+        dispatcher.add('scope1', [1])
+        queue = EventQueue(dispatcher)
+        for event in ('gaa', 'goo', 'goo', 'gaa', 'stop', 'goo', 'stop'):
+            queue.post('scope1', 1, event)
+        results = queue.drain()
+        self.assertEqual(
+            [res.event for res in results if res.flow], ['goo', 'gaa', 'stop'],
+        )
+        self.assertEqual(queue.coalesced, 4)
+        self.assertTrue(all(res.error is None for res in results))
+
+    def test_unreachable_triggers(self):
+        '''Queue: States reachable through triggers keep events alive'''
+        dispatcher = book_dispatcher(3)
+        dispatcher.store('chapter')[0].complete = False
+        queue = EventQueue(dispatcher)
+        for event in ('propose', 'propose', 'approve'):
+            queue.post('chapter', 0, event)
+        self.assertEqual(queue.coalesce('chapter', 0, ['propose', 'propose', 'approve']), [
+            True, True, True,
+        ])
+        self.assertEqual(len([res for res in queue.drain() if res.flow]), 2)
+        self.assertEqual(queue.coalesce('chapter', 0, ['approve', 'moo']), [False, False])
+
+    def test_unreachable_guarded(self):
+        '''Queue: Events stay alive as long as any of the possible states can fire them'''
+        dispatcher = Dispatcher(Guarded)
+        dispatcher.add('guarded', [1], doomed=False)
+        queue = EventQueue(dispatcher)
+        for event in ('maybe', 'go', 'go2'):
+            queue.post('guarded', 1, event)
+        results = queue.drain()
+        self.assertEqual([res.event for res in results if res.flow], ['go', 'go2'])
+        self.assertEqual(dispatcher.state('guarded', 1), 'c')
+
+    def test_supersede(self):
+        '''Queue: Unconditional wildcard events discard earlier queued events'''
+        dispatcher = book_dispatcher(3)
+        queue = EventQueue(dispatcher, rules=('supersede', ))
+        self.assertEqual(queue.superseding('chapter'), {'cancel'})
+        self.assertEqual(queue.superseding('book'), {'cancel'})
+        for event in ('propose', 'approve', 'cancel', 'cancel'):
+            queue.post('chapter', 1, event)
+        self.assertEqual(len(queue), 1)
+        results = queue.drain(batch=2)
+        self.assertEqual(len(queue), 1)
+        results += queue.drain()
+        self.assertEqual([res.event for res in results], ['propose', 'approve', 'cancel', 'cancel'])
+        self.assertEqual([res.flow is not None for res in results], [False, False, False, True])
+        self.assertTrue(all(res.error is None for res in results))
+        self.assertEqual(queue.coalesced, 3)
+        self.assertEqual(dispatcher.state('chapter', 1), 'canceled')
+
+    def test_unknown_rule(self):
+        '''Queue: Unknown coalescing rules are refused'''
+        with self.assertRaisesRegex(ValueError, 'moo'):
+            EventQueue(Dispatcher(Scope1), rules=('moo', ))
+
+
+class SchedulerTest(unittest.TestCase):
+    '''Tests priority classes and fair scheduling'''
+
+    def test_priorities(self):
+        '''Scheduler: Priority classes are declared next to the events'''
+        self.assertEqual(Ticket.compile().get_scope('ticket').priorities,
+                         {'approve': 0, 'reindex': 2})
+        loaded = build_scope('ticket', {
+            'initial': 'open', 'events': {'approve': ['open__approved']},
+            'priorities': {'approve': 'interactive'},
+        })
+        self.assertEqual(loaded.compile().get_scope('ticket').priorities, {'approve': 0})
+        with self.assertRaisesRegex(BrokenStateModelException, 'one of: interactive'):
+
+            class Scope2(Scope):
+                class Events:
+                    goo = ['first__second']
+
+                class Priorities:
+                    goo = 'urgent'
+
+        with self.assertRaisesRegex(BrokenStateModelException, 'unknown event gaa'):
+
+            class Scope3(Scope):
+                class Events:
+                    goo = ['first__second']
+
+                class Priorities:
+                    gaa = 'bulk'
+
+    def test_order(self):
+        '''Scheduler: Classes are served weighted round robin, entities take turns'''
+        dispatcher = Dispatcher(Ticket)
+        dispatcher.add('ticket', range(4))
+        scheduler = Scheduler(dispatcher, {'interactive': 2, 'normal': 2, 'bulk': 1})
+        for _ in range(4):
+            scheduler.post('ticket', 0, 'reindex')
+        scheduler.post('ticket', 1, 'reindex')
+        for _ in range(3):
+            scheduler.post('ticket', 0, 'touch')
+        scheduler.post('ticket', 1, 'touch')
+        for key in (1, 2, 3):
+            scheduler.post('ticket', key, 'approve')
+        self.assertEqual(scheduler.pending(), {'interactive': 3, 'normal': 4, 'bulk': 5})
+        self.assertEqual(len(scheduler), 12)
+        results = scheduler.drain(batch=9)
+        self.assertEqual([(res.key, res.event) for res in results], [
+            (1, 'approve'), (2, 'approve'), (0, 'touch'), (1, 'touch'), (0, 'reindex'),
+            (3, 'approve'), (0, 'touch'), (0, 'touch'), (1, 'reindex'),
+        ])
+        # Approved tickets can't be touched or reindexed any more
+        self.assertEqual([res.key for res in results if res.error], [1, 1])
+        self.assertEqual([res.key for res in scheduler.drain()], [0, 0, 0])
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.drain(), [])
+
+    def test_rejected(self):
+        '''Scheduler: Rejections are reported, not raised'''
+        dispatcher = Dispatcher(Ticket)
+        dispatcher.add('ticket', [1])
+        scheduler = Scheduler(dispatcher)
+        scheduler.post('ticket', 1, 'approve')
+        scheduler.post('ticket', 1, 'approve')
+        results = scheduler.drain()
+        self.assertEqual(dispatcher.state('ticket', 1), 'approved')
+        self.assertIsInstance(results[1].error, EventRejectedException)
+
+    def test_weights(self):
+        '''Scheduler: Unknown classes and weights below 1 are refused'''
+        dispatcher = Dispatcher(Ticket)
+        with self.assertRaisesRegex(ValueError, 'urgent'):
+            Scheduler(dispatcher, {'urgent': 2})
+        with self.assertRaisesRegex(ValueError, 'at least 1'):
+            Scheduler(dispatcher, {'bulk': 0})
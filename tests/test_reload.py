@@ -0,0 +1,144 @@
+'''WorkState test hot reload'''
+from __future__ import annotations
+
+import unittest
+
+from tests import books
+from tests.books import Book, BookEngine, Clock
+from workstate.dispatch import Dispatcher
+from workstate.engine import BrokenStateModelException, Engine, Scope
+from workstate.queue import EventQueue
+
+# pylint: disable=C0111,R0903,E1101,R0801,W0238
+
+DAY = 24 * 3600
+
+
+class Chapter(Scope):
+    'A chapter, with a review state and without proposals'
+    initial = 'draft'
+
+    class States:
+        draft = 'The chapter is being written'
+        review = 'The chapter is being reviewed'
+        approved = 'The chapter is approved'
+        canceled = 'The chapter is canceled'
+
+    class Transitions:
+        draft__review = 'Request chapter review'
+        review__draft = 'Chapter declined'
+        review__approved = 'Chapter approved'
+        __canceled = 'Chapter canceled'
+
+    class Events:
+        review = ['draft__review']
+        approve = ['review__approved']
+        reject = ['review__draft']
+        cancel = ['*__canceled']
+
+    class Timers:
+        stale_review = ('reject', 'review', 7 * DAY)
+
+
+class ReviewEngine(BookEngine):
+    scopes = [Book, Chapter]
+
+
+class ReloadTest(unittest.TestCase):
+    '''Tests swapping in a new model at runtime'''
+
+    def dispatcher(self, clock: Clock | None = None) -> Dispatcher:
+        dispatcher = Dispatcher(BookEngine, clock=clock or Clock())
+        dispatcher.add('book', [1])
+        dispatcher.add('chapter', range(4), marked=False, complete=True)
+        dispatcher.link('chapter', range(4), 'book', [1] * 4)
+        dispatcher.event('chapter', 1, 'propose')
+        dispatcher.event('chapter', 2, 'cancel')
+        return dispatcher
+
+    def test_reuse(self):
+        '''Reload: Unchanged scopes of a derived engine are not recompiled'''
+        (old, new) = (BookEngine.compile(), ReviewEngine.compile())
+        self.assertIs(new.scopes['book'], old.scopes['book'])
+        self.assertIsNot(new.scopes['chapter'], old.scopes['chapter'])
+
+    def test_identical(self):
+        '''Reload: Identical scopes of an independently defined engine keep their stores'''
+
+        class Twin(Engine):
+            scopes = [Book, books.Chapter]
+
+        dispatcher = self.dispatcher()
+        dispatcher.reload(Twin)
+        self.assertIs(dispatcher.model, Twin)
+        for scope, cscope in BookEngine.compile().scopes.items():
+            self.assertIs(dispatcher.store(scope).compiled, cscope)
+        self.assertEqual(dispatcher.state('chapter', 1), 'proposed')
+
+    def test_remap(self):
+        '''Reload: Entities keep their state by name, renamed states get moved'''
+        dispatcher = self.dispatcher()
+        book = dispatcher.stores['book']
+        dispatcher.reload(ReviewEngine, {'chapter:proposed': 'review'})
+        self.assertIs(dispatcher.stores['book'], book)
+        self.assertEqual(
+            [dispatcher.state('chapter', key) for key in range(4)],
+            ['draft', 'review', 'canceled', 'draft'],
+        )
+        self.assertEqual(dispatcher.histogram()['chapter'], {
+            'draft': 2, 'review': 1, 'approved': 0, 'canceled': 1,
+        })
+        self.assertEqual(dispatcher.event('chapter', 1, 'approve').state, 'chapter:approved')
+        self.assertEqual(dispatcher.stats.edge_counts('chapter')['chapter:*__canceled'], 1)
+
+    def test_missing_state(self):
+        '''Reload: Entities in removed states need a rename'''
+        dispatcher = self.dispatcher()
+        with self.assertRaisesRegex(BrokenStateModelException, r"\['chapter:proposed'\]"):
+            dispatcher.reload(ReviewEngine)
+        self.assertIs(dispatcher.model, BookEngine)
+        self.assertEqual(dispatcher.state('chapter', 1), 'proposed')
+
+    def test_missing_scope(self):
+        '''Reload: Scopes with entities can't be dropped'''
+
+        class BookOnly(Engine):
+            scopes = [Book]
+
+        dispatcher = self.dispatcher()
+        with self.assertRaisesRegex(BrokenStateModelException, 'Scope chapter has entities'):
+            dispatcher.reload(BookOnly)
+
+    def test_deferred(self):
+        '''Reload: Reloading within a dispatch cycle happens at its end'''
+        dispatcher = self.dispatcher()
+        with dispatcher.cycle():
+            dispatcher.reload(ReviewEngine, {'chapter:proposed': 'review'})
+            self.assertIs(dispatcher.model, BookEngine)
+            dispatcher.event('chapter', 0, 'propose')
+        self.assertIs(dispatcher.model, ReviewEngine)
+        self.assertEqual(dispatcher.state('chapter', 0), 'review')
+
+    def test_timers(self):
+        '''Reload: Added timers get scheduled for entities already in their state'''
+        clock = Clock()
+        dispatcher = self.dispatcher(clock)
+        dispatcher.reload(ReviewEngine, {'chapter:proposed': 'review'})
+        clock.now = 8 * DAY
+        flows = dispatcher.tick()
+        self.assertEqual([flow.events for flow in flows], [
+            [('reject', 'chapter:stale_review', 'chapter:review', 'chapter:draft')],
+        ])
+
+    def test_queue(self):
+        '''Reload: Event queues pick up the new model'''
+        dispatcher = self.dispatcher()
+        queue = EventQueue(dispatcher, rules=('unreachable', 'supersede'))
+        queue.post('chapter', 3, 'propose')
+        queue.drain()
+        dispatcher.reload(ReviewEngine, {'chapter:proposed': 'review'})
+        queue.post('chapter', 0, 'review')
+        queue.post('chapter', 0, 'propose')
+        results = queue.drain()
+        self.assertEqual(dispatcher.state('chapter', 0), 'review')
+        self.assertEqual([result.flow is None for result in results], [False, True])
@@ -0,0 +1,135 @@
+'''WorkState test compiled models in shared memory'''
+import gc
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, Tuple
+
+from tests.books import BookEngine, Clock
+from tests.test_expr import ExprEngine, populate
+from tests.test_timers import DAY, Chapter
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine, Scope
+from workstate.exceptions import BrokenStateModelException
+from workstate.shared import SharedModel, pack
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: nocoverage
+    shared_memory = None  # type: ignore
+
+# pylint: disable=C0111,R0903,E1101
+
+
+def tables(model: Any) -> Dict[str, Tuple]:
+    return {
+        scope: (
+            list(cscope.states), dict(cscope.event_ids), list(cscope.edges),
+            {key: [(cand.target, cand.edge) for cand in cands]
+             for key, cands in cscope.table.items()},
+            dict(cscope.kinds), list(cscope.allowed), list(cscope.reach), list(cscope.fires),
+            [list(targets) for targets in cscope.direct], dict(cscope.watchers),
+            dict(cscope.timers), cscope.priorities,
+        )
+        for scope, cscope in model.compile().scopes.items()
+    }
+
+
+class SharedTest(unittest.TestCase):
+    '''Tests compiled models in shared memory'''
+
+    @unittest.skipIf(shared_memory is None, 'Shared memory needs Python 3.8')
+    def test_attach(self):
+        '''Shared: Attached models have the tables and dispatch of the original'''
+        published = SharedModel.publish(BookEngine)
+        attached = SharedModel.attach(published.name or '')
+        self.assertEqual(tables(attached), tables(BookEngine))
+        self.assertIs(attached.compile().scopes['book'].cls,
+                      BookEngine.compile().scopes['book'].cls)
+        self.assertIs(attached.compile(), attached.compile())
+        table = attached.compile().scopes['chapter'].table
+        self.assertIs(table[next(iter(table))], table[next(iter(table))])
+        self.assertEqual(len(attached.buffer), len(pack(BookEngine.compile())))
+        results = []
+        for model in (BookEngine, attached):
+            dispatcher = Dispatcher(model)
+            dispatcher.add('book', [1])
+            dispatcher.add('chapter', range(2), marked=True, complete=True)
+            dispatcher.link('chapter', range(2), 'book', [1] * 2)
+            dispatcher.event('chapter', 0, 'propose')
+            results.append([
+                dispatcher.event('chapter', 0, 'approve').state,
+                dispatcher.apply('chapter', 'propose').tolist(),
+                dispatcher.apply('chapter', 'approve').tolist(),
+                dispatcher.store('book').state(1),
+            ])
+        self.assertEqual(results[0], results[1])
+        del dispatcher, table
+        gc.collect()
+        attached.close()
+        published.close()
+        published.unlink()
+        with self.assertRaises(FileNotFoundError):
+            SharedModel.attach(published.name or '')
+
+    def test_file(self):
+        '''Shared: Packed models map from files, timers included'''
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'chapter.wsm')
+            SharedModel.save(Chapter, filename)
+            model = SharedModel.open(filename)
+            self.assertIsNone(model.name)
+            clock = Clock()
+            dispatcher = Dispatcher(model, clock=clock)
+            store = dispatcher.add('chapter', range(2))
+            store.event(0, 'propose')
+            clock.now = 8 * DAY
+            self.assertEqual(len(dispatcher.tick()), 1)
+            self.assertEqual(store.state(0), 'draft')
+            del dispatcher, store
+            gc.collect()
+            model.close()
+
+    def test_expressions(self):
+        '''Shared: Expression conditions are packed by value, once compiled too'''
+        original = populate(ExprEngine, 5, 4)
+        original.apply('chapter', 'propose')
+        shared = populate(SharedModel(pack(ExprEngine.compile())), 5, 4)  # type: ignore
+        shared.apply('chapter', 'propose')
+        self.assertEqual(
+            shared.apply('chapter', 'approve').tolist(),
+            original.apply('chapter', 'approve').tolist(),
+        )
+        self.assertEqual(shared.store('book').histogram(),
+                         original.store('book').histogram())
+
+    def test_conditions(self):
+        '''Shared: Conditions that can't be packed are given by name'''
+
+        class Task(Scope):
+            initial = 'open'
+
+            class Transitions:
+                def open__done(self):
+                    return self.ready  # type: ignore
+
+            class Events:
+                finish = ['open__done']
+
+        class TaskEngine(Engine):
+            scopes = [Task]
+
+        data = pack(TaskEngine.compile())
+        with self.assertRaisesRegex(BrokenStateModelException, 'Condition task:open__done'):
+            SharedModel(data).compile()
+        model = SharedModel(
+            data,
+            conditions={'task:open__done': lambda handle: handle.ready},
+            classes={'task': Task},
+        )
+        self.assertIs(model.compile().scopes['task'].cls, Task)
+        dispatcher = Dispatcher(model)
+        dispatcher.add('task', [1, 2], ready=[True, False])
+        self.assertEqual(dispatcher.apply('task', 'finish').tolist(), [1])
+        with self.assertRaisesRegex(BrokenStateModelException, 'not hold'):
+            SharedModel(b'x' * 64)
@@ -0,0 +1,100 @@
+'''WorkState test flow statistics'''
+import unittest
+
+from tests.books import BookEngine, Chapter, Clock
+from workstate.dispatch import Dispatcher
+from workstate.engine import Engine
+from workstate.stats import FlowStats
+
+# pylint: disable=C0111,R0903
+
+
+class ChapterEngine(Engine):
+    scopes = [Chapter]
+
+
+class StatsTest(unittest.TestCase):
+    '''Tests state histograms and edge counters'''
+
+    def setUp(self):
+        self.clock = Clock()
+        self.dispatcher = Dispatcher(BookEngine)
+        self.dispatcher.stats = FlowStats(
+            self.dispatcher.compiled, resolution=60, buckets=10, clock=self.clock
+        )
+        self.dispatcher.add('book', [1, 2])
+        self.dispatcher.add('chapter', range(10), marked=True, complete=True)
+
+    def test_histogram(self):
+        '''Stats: State counts follow transitions'''
+        for key in range(4):
+            self.dispatcher.event('chapter', key, 'propose')
+        self.dispatcher.event('chapter', 0, 'approve')
+        self.dispatcher.event('book', 2, 'cancel')
+        hist = self.dispatcher.histogram()
+        self.assertEqual(hist['chapter'], {'draft': 6, 'proposed': 3, 'approved': 1, 'canceled': 0})
+        self.assertEqual(hist['book'], {'draft': 1, 'published': 0, 'canceled': 1})
+
+    def test_recount(self):
+        '''Stats: Recount reconciles counters with the state column'''
+        store = self.dispatcher.store('chapter')
+        self.dispatcher.event('chapter', 3, 'cancel')
+        expected = store.histogram()
+        store.counts[0] = 99
+        self.assertEqual(self.dispatcher.recount()['chapter'], expected)
+        self.assertEqual(store.histogram(), expected)
+
+    def test_edge_counts(self):
+        '''Stats: Lifetime counts per edge'''
+        self.dispatcher.event('chapter', 1, 'propose')
+        self.dispatcher.event('chapter', 2, 'propose')
+        self.dispatcher.event('chapter', 2, 'cancel')
+        counts = self.dispatcher.stats.edge_counts('chapter')
+        self.assertEqual(counts['chapter:draft__proposed'], 2)
+        self.assertEqual(counts['chapter:*__canceled'], 1)
+        self.assertEqual(counts['chapter:proposed__draft'], 0)
+        self.assertNotIn('book:*__canceled', counts)
+        self.assertIn('book:*__canceled', self.dispatcher.stats.edge_counts())
+
+    def test_recent(self):
+        '''Stats: Windowed counts per edge'''
+        stats = self.dispatcher.stats
+        self.dispatcher.event('chapter', 1, 'propose')
+        self.clock.now = 150
+        self.dispatcher.event('chapter', 2, 'propose')
+        self.assertEqual(stats.recent(60)['chapter:draft__proposed'], 1)
+        self.assertEqual(stats.recent(180)['chapter:draft__proposed'], 2)
+        self.clock.now = 6000
+        self.assertEqual(stats.recent(600, 'chapter'), {})
+        self.dispatcher.event('chapter', 3, 'propose')
+        self.assertEqual(stats.recent(600, 'chapter')['chapter:draft__proposed'], 1)
+        stats.reset()
+        self.assertEqual(stats.recent(600), {})
+        self.assertEqual(set(stats.edge_counts().values()), {0})
+
+    def test_recent_window(self):
+        '''Stats: Windows cover the current bucket and whole buckets before it'''
+        stats = self.dispatcher.stats
+        for key in range(12):
+            self.clock.now = key * 60 + 30
+            stats.record('chapter', 1)
+        for seconds, count in ((0, 1), (60, 1), (90, 1), (120, 2), (300, 5), (6000, 10)):
+            self.assertEqual(stats.recent(seconds, 'chapter')['chapter:draft__proposed'], count)
+
+    def test_reload(self):
+        '''Stats: Recent counts of remaining edges survive reloads dropping scopes'''
+        dispatcher = Dispatcher(BookEngine)
+        dispatcher.stats = FlowStats(dispatcher.compiled, resolution=60, buckets=10,
+                                     clock=self.clock)
+        dispatcher.add('chapter', range(2), complete=True)
+        dispatcher.event('chapter', 0, 'cancel')
+        self.clock.now = 90
+        dispatcher.event('chapter', 1, 'propose')
+        dispatcher.stats.record('book', 0)
+        dispatcher.reload(ChapterEngine)
+        self.assertEqual(dispatcher.stats.recent(600), {
+            'chapter:*__canceled': 1, 'chapter:draft__proposed': 1,
+            'chapter:proposed__approved': 0, 'chapter:proposed__draft': 0,
+        })
+        self.assertEqual(dispatcher.stats.recent(60)['chapter:draft__proposed'], 1)
+        self.assertEqual(dispatcher.stats.edge_counts()['chapter:*__canceled'], 1)
@@ -0,0 +1,124 @@
+'''WorkState test columnar store'''
+import unittest
+from array import array
+
+from tests.books import Book, BookEngine, Chapter
+from workstate.dispatch import Dispatcher
+from workstate.engine import Scope
+from workstate.exceptions import BrokenStateModelException
+from workstate.store import EntityHandle
+
+try:
+    import numpy as np
+except ImportError:  # pragma: nocoverage
+    np = None  # type: ignore
+
+# pylint: disable=C0111,R0903,E1101
+
+
+class StoreTest(unittest.TestCase):
+    '''Tests columnar entity storage'''
+
+    def test_bulk_initial_state(self):
+        '''Store: Bulk added entities start in the initial state'''
+        store = Dispatcher(Chapter).add('chapter', range(1000))
+        self.assertEqual(len(store), 1000)
+        self.assertIsInstance(store.states, array)
+        self.assertEqual(set(store.states), {Chapter.compile().scopes['chapter'].initial})
+        self.assertEqual(store.state(999), 'draft')
+
+    def test_unsorted_keys(self):
+        '''Store: Keys added out of order are still found'''
+        store = Dispatcher(Chapter).add('chapter', [5, 3, 9])
+        store.add([1])
+        self.assertEqual([store.row(key) for key in (5, 3, 9, 1)], [0, 1, 2, 3])
+        with self.assertRaises(KeyError):
+            store.row(4)
+
+    def test_duplicate_keys(self):
+        '''Store: Keys already present are refused, without adding any'''
+        store = Dispatcher(Chapter).add('chapter', [2, 4, 6])
+        for keys in ([8, 4], [8, 8], [6]):
+            with self.assertRaisesRegex(ValueError, 'already exists'):
+                store.add(keys)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sum(store.counts), 3)
+        store.add([1])
+        with self.assertRaisesRegex(ValueError, 'chapter:2 already exists'):
+            store.add([9, 2])
+        store.add([9])
+        self.assertEqual([store.row(key) for key in (2, 4, 6, 1, 9)], [0, 1, 2, 3, 4])
+
+    def test_sorted_keys_missing(self):
+        '''Store: Missing key raises KeyError'''
+        store = Dispatcher(Chapter).add('chapter', [2, 4, 6])
+        with self.assertRaises(KeyError):
+            store.row(5)
+        with self.assertRaises(KeyError):
+            store.row(7)
+
+    def test_attributes(self):
+        '''Store: Scalar and per-row attributes are held in columns'''
+        store = Dispatcher(Chapter).add('chapter', [1, 2], marked=[True, False], complete=True)
+        store.add([3])
+        self.assertEqual(list(store.attributes['marked']), [1, 0, 0])
+        self.assertEqual(list(store.attributes['complete']), [1, 1, 0])
+        store[3].title = 'Intro'
+        self.assertEqual(store.attributes['title'], [None, None, 'Intro'])
+
+    def test_handle(self):
+        '''Store: Handles are views into the columns'''
+        store = Dispatcher(Chapter).add('chapter', [1, 2], complete=True)
+        handle = store[2]
+        self.assertIsInstance(handle, EntityHandle)
+        self.assertEqual((handle.key, handle.state), (2, 'draft'))
+        handle.event('propose')
+        self.assertEqual(store.state(2), 'proposed')
+        self.assertEqual(handle.state, 'proposed')
+        with self.assertRaises(AttributeError):
+            handle.moo  # pylint: disable=W0104
+
+    def test_no_initial(self):
+        '''Store: Scope without initial state can't hold entities'''
+
+        class Scope1(Scope):
+            class Events:
+                goo = ['first__second']
+
+        dispatcher = Dispatcher(Scope1)
+        with self.assertRaisesRegex(BrokenStateModelException, 'no initial state'):
+            dispatcher.add('scope1', [1])
+
+    def test_related(self):
+        '''Store: Linked entities are related in both directions'''
+        dispatcher = Dispatcher(BookEngine)
+        dispatcher.add('book', [1, 2])
+        dispatcher.add('chapter', [10, 11, 12])
+        dispatcher.link('chapter', [10, 11, 12], 'book', [1, 1, 2])
+        book = dispatcher.store('book')[1]
+        self.assertEqual([a.key for a in book.get_chapter()], [10, 11])
+        self.assertEqual([a.key for a in dispatcher.store('chapter')[12].get_book()], [2])
+        self.assertEqual(dispatcher.store('book').related(1, 'chapter'), [2])
+
+    @unittest.skipIf(np is None, 'NumPy not installed')
+    def test_numpy(self):
+        '''Store: NumPy keys and zero-copy columns'''
+        store = Dispatcher(Book).add('book', np.arange(10, 20), score=np.ones(10))
+        self.assertEqual(store.row(15), 5)
+        self.assertEqual(int(store.column().sum()), 0)
+        self.assertEqual(float(store.column('score').sum()), 10.0)
+
+    @unittest.skipIf(np is None, 'NumPy not installed')
+    def test_numpy_types(self):
+        '''Store: NumPy values get typed columns'''
+        store = Dispatcher(Book).add('book', range(3), score=np.ones(3, dtype='f4'),
+                                     count=np.arange(3, dtype='u2'), flag=np.bool_(True))
+        self.assertEqual([store.attributes[name].typecode for name in ('score', 'count', 'flag')],
+                         ['d', 'q', 'b'])
+        self.assertEqual(store.defaults, {'score': 0.0, 'count': 0, 'flag': False})
+        self.assertEqual(list(store.attributes['count']), [0, 1, 2])
+        store.set(1, 'flag', np.bool_(False))
+        store.set(1, 'other', np.int32(4))
+        self.assertEqual(store.attributes['other'].typecode, 'q')
+        self.assertEqual(store[1].other, 4)
+        self.assertFalse(store[1].flag)
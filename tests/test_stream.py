@@ -0,0 +1,110 @@
+'''WorkState test streaming ingestion'''
+import io
+import os
+import tempfile
+import unittest
+from typing import Iterator, Tuple
+
+from tests.books import book_dispatcher
+from workstate.dispatch import Dispatcher
+from workstate.engine import Scope
+from workstate.exceptions import EventRejectedException
+from workstate.stream import ingest, read_jsonl, records
+
+# pylint: disable=C0111,R0903
+
+
+class Lookup(Scope):
+    initial = 'pending'
+
+    class Transitions:
+        def pending__found(self):
+            'Looks the entity up'
+            raise KeyError('moo')
+
+    class Events:
+        find = ['pending__found']
+
+
+LINES = '''{"scope": "chapter", "key": 0, "event": "propose"}
+["chapter", 1, "propose"]
+
+{"key": 0, "event": "approve"}
+[1, "approve"]
+[1, "approve"]
+{"key": 7, "event": "approve"}
+'''
+
+
+class StreamTest(unittest.TestCase):
+    '''Tests streaming event ingestion'''
+
+    def test_records(self):
+        '''Stream: Records with and without scope'''
+        self.assertEqual(list(records([('book', 1, 'cancel'), (2, 'propose')], 'chapter')), [
+            ('book', 1, 'cancel'), ('chapter', 2, 'propose'),
+        ])
+        with self.assertRaisesRegex(ValueError, 'Invalid event record'):
+            list(records([(2, 'propose')]))
+
+    def test_jsonl(self):
+        '''Stream: Results of JSON lines, including the trigger chain and rejections'''
+        dispatcher = book_dispatcher()
+        results = list(ingest(dispatcher, io.StringIO(LINES), scope='chapter', batch=2))
+        self.assertEqual([result.flow.state if result.flow else None for result in results], [
+            'chapter:proposed', 'chapter:proposed', 'chapter:approved', 'book:published',
+            None, None,
+        ])
+        self.assertEqual(results[3].flow.events[-1], (  # type: ignore
+            'all_approved', 'book:publish_book', 'book:draft', 'book:published',
+        ))
+        self.assertIsInstance(results[4].error, EventRejectedException)
+        self.assertIn('not allowed', str(results[4].error))
+        self.assertIn('Unknown entity chapter:7', str(results[5].error))
+
+    def test_file(self):
+        '''Stream: Records read from a file by name'''
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as outf:
+            outf.write(LINES)
+        try:
+            self.assertEqual(len(list(read_jsonl(outf.name, 'chapter'))), 6)
+            results = list(ingest(book_dispatcher(), outf.name, scope='chapter'))
+            self.assertEqual(len(results), 6)
+        finally:
+            os.unlink(outf.name)
+
+    def test_errors(self):
+        '''Stream: Errors other than unknown entities propagate'''
+        dispatcher = Dispatcher(Lookup)
+        dispatcher.add('lookup', [1])
+        with self.assertRaisesRegex(KeyError, 'moo'):
+            list(ingest(dispatcher, [('lookup', 1, 'find')]))
+        self.assertIn('Unknown entity lookup:2',
+                      str(next(ingest(dispatcher, [('lookup', 2, 'find')])).error))
+
+    def test_invalid_line(self):
+        '''Stream: Invalid lines are reported with their line number'''
+        with self.assertRaisesRegex(ValueError, 'Line 2'):
+            list(read_jsonl(io.StringIO('[1, "propose"]\n{"key": 1}\n'), 'chapter'))
+        with self.assertRaisesRegex(ValueError, 'Line 1'):
+            list(read_jsonl(io.StringIO('moo\n')))
+
+    def test_backpressure(self):
+        '''Stream: Source is only read a batch ahead of the consumer'''
+        read = []
+
+        def source() -> Iterator[Tuple[str, int, str]]:
+            for key in range(2):
+                for event in ('propose', 'cancel'):
+                    read.append((key, event))
+                    yield ('chapter', key, event)
+
+        results = ingest(book_dispatcher(), source(), batch=2)
+        self.assertEqual(read, [])
+        self.assertEqual(next(results).flow.state, 'chapter:proposed')  # type: ignore
+        self.assertEqual(len(read), 2)
+        next(results)
+        self.assertEqual(len(read), 2)
+        next(results)
+        self.assertEqual(len(read), 4)
+        self.assertEqual(len(list(results)), 1)
@@ -0,0 +1,79 @@
+'''WorkState test partial graphs'''
+import unittest
+
+from tests.books import BookEngine, Chapter
+from tests.test_engine import clean_dot
+
+# pylint: disable=C0111
+
+
+class SubgraphTest(unittest.TestCase):
+    '''Tests partial dot graphs'''
+
+    def test_neighborhood_state(self):
+        '''Subgraph: Neighborhood of a state follows moves both ways and trigger links'''
+        self.assertEqual(clean_dot(BookEngine.graph_neighborhood('chapter', 'approved')), {
+            'chapter:approved',
+            'chapter:proposed',
+            'book:published',
+            'chapter:proposed -> chapter:approved',
+            'chapter:approved -> book:published',
+        })
+
+    def test_neighborhood_hops(self):
+        '''Subgraph: Neighborhood widens with hops'''
+        dot = clean_dot(Chapter.graph_neighborhood('approved', hops=2))
+        self.assertIn('chapter:draft -> chapter:proposed', dot)
+        self.assertIn('chapter:proposed -> chapter:draft', dot)
+        self.assertNotIn('chapter:canceled', dot)
+
+    def test_neighborhood_event(self):
+        '''Subgraph: Neighborhood of an event, wildcards drawn from an Any node'''
+        self.assertEqual(clean_dot(Chapter.graph_neighborhood(event='cancel', hops=0)), {
+            'chapter:canceled',
+            'chapter:*',
+            'chapter:* -> chapter:canceled',
+        })
+        self.assertEqual(clean_dot(Chapter.graph_neighborhood(event='propose', hops=0)), {
+            'chapter:draft',
+            'chapter:proposed',
+            'chapter:draft -> chapter:proposed',
+            'chapter:proposed -> chapter:draft',
+        })
+        with self.assertRaises(ValueError):
+            Chapter.graph_neighborhood()
+
+    def test_neighborhood_cached(self):
+        '''Subgraph: Neighborhoods re-use the adjacency and links indexed before'''
+        compiled = BookEngine.compile(original=True)
+        BookEngine.graph_neighborhood('chapter', 'approved')
+        (links, adjacency) = (compiled.links, compiled.scopes['chapter'].adjacency)
+        (chapter, book) = (compiled.scopes['chapter'].state_ids, compiled.scopes['book'].state_ids)
+        self.assertEqual(links[('book', book['published'])], [  # type: ignore
+            (('chapter', chapter['approved']), ('book', book['published']), 'publish_book'),
+        ])
+        self.assertEqual(adjacency[chapter['approved']], {chapter['proposed']})
+        BookEngine.graph_neighborhood('chapter', 'draft', hops=3)
+        self.assertIs(compiled.links, links)
+        self.assertIs(compiled.scopes['chapter'].adjacency, adjacency)
+
+    def test_focus(self):
+        '''Subgraph: Single scope with triggers touching it'''
+        self.assertEqual(clean_dot(BookEngine.graph_focus('book')), {
+            'book:draft',
+            'book:published',
+            'book:canceled',
+            'book:*',
+            'book:draft -> book:published',
+            'book:* -> book:canceled',
+            'chapter:approved',
+            'chapter:approved -> book:published',
+        })
+
+    def test_collapsed(self):
+        '''Subgraph: One node per scope'''
+        self.assertEqual(clean_dot(BookEngine.graph_collapsed()), {
+            'book',
+            'chapter',
+            'chapter -> book',
+        })
@@ -0,0 +1,150 @@
+'''WorkState test timers'''
+import random
+import unittest
+
+from tests.books import Clock
+from workstate.dispatch import Dispatcher
+from workstate.engine import BrokenStateModelException, Engine, Scope
+from workstate.timers import TimingWheel
+
+# pylint: disable=C0111,R0903,W0612
+
+DAY = 24 * 3600
+
+
+class Chapter(Scope):
+    initial = 'draft'
+
+    class Events:
+        propose = ['draft__proposed']
+        approve = ['proposed__approved']
+        reject = ['proposed__draft']
+
+    class Timers:
+        stale_proposal = ('reject', 'proposed', 7 * DAY, 'Revert stale proposals')
+
+
+class WheelTest(unittest.TestCase):
+    '''Tests the timing wheel'''
+
+    def test_due(self):
+        '''Wheel: Timers come due at their deadline'''
+        wheel = TimingWheel()
+        wheel.schedule(5, 'a')
+        wheel.schedule(3, 'b')
+        wheel.schedule(3.5, 'c')
+        self.assertEqual(len(wheel), 3)
+        self.assertEqual(wheel.advance(2), [])
+        self.assertEqual(wheel.advance(4), ['b', 'c'])
+        self.assertEqual(wheel.advance(100), ['a'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_past_deadline(self):
+        '''Wheel: Deadlines in the past are due on the next tick'''
+        wheel = TimingWheel(start=50)
+        wheel.schedule(10, 'a')
+        self.assertEqual(wheel.advance(51), ['a'])
+
+    def test_cancel(self):
+        '''Wheel: Cancelled timers never come due'''
+        wheel = TimingWheel(slots=4, levels=2)
+        timers = [wheel.schedule(deadline, deadline) for deadline in (2, 9, 100)]
+        self.assertTrue(all(wheel.cancel(timer) for timer in timers))
+        self.assertFalse(wheel.cancel(timers[0]))
+        self.assertEqual(wheel.advance(1000), [])
+
+    def test_levels_and_overflow(self):
+        '''Wheel: Timers cascade through levels and overflow in deadline order'''
+        wheel = TimingWheel(slots=4, levels=2)
+        rand = random.Random(42)
+        deadlines = [rand.randint(1, 200) for _ in range(500)]
+        for deadline in deadlines:
+            wheel.schedule(deadline, deadline)
+        fired = []
+        for now in range(0, 210, 7):
+            due = wheel.advance(now)
+            self.assertTrue(all(deadline <= now for deadline in due))
+            fired.extend(due)
+        self.assertEqual(fired, sorted(deadlines))
+
+
+class TimedScopeTest(unittest.TestCase):
+    '''Tests timed events on scopes'''
+
+    def test_bad_timer(self):
+        '''Timers: Must be (event, state, seconds)'''
+        with self.assertRaisesRegex(BrokenStateModelException, 'Timers need to be'):
+
+            class Scope1(Scope):
+                initial = 'first'
+
+                class Timers:
+                    moo = ('first', 10)
+
+    def test_timer_event_missing(self):
+        '''Timers: Timer event must exist'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                goo = ['first__second']
+
+            class Timers:
+                moo = ('gaa', 'second', 10)
+
+        with self.assertRaisesRegex(BrokenStateModelException, 'Event gaa contains no'):
+            Scope1.validate()
+
+    def test_timer_fires(self):
+        '''Timers: Event fires after time in state'''
+        clock = Clock()
+        dispatcher = Dispatcher(Chapter, clock=clock)
+        store = dispatcher.add('chapter', range(3))
+        store.event(0, 'propose')
+        clock.now = DAY
+        store.event(1, 'propose')
+        clock.now = 7 * DAY + 10
+        flows = dispatcher.tick()
+        self.assertEqual([flow.events for flow in flows], [
+            [('reject', 'chapter:stale_proposal', 'chapter:proposed', 'chapter:draft')],
+        ])
+        self.assertEqual([store.state(key) for key in range(3)], ['draft', 'proposed', 'draft'])
+        clock.now = 8 * DAY + 10
+        self.assertEqual(len(dispatcher.tick()), 1)
+        self.assertEqual(store.state(1), 'draft')
+
+    def test_timer_cancelled(self):
+        '''Timers: Leaving the state cancels the timer'''
+        clock = Clock()
+        dispatcher = Dispatcher(Chapter, clock=clock)
+        store = dispatcher.add('chapter', [1])
+        store.event(1, 'propose')
+        self.assertEqual(len(dispatcher.wheel), 1)
+        store.event(1, 'approve')
+        self.assertEqual(len(dispatcher.wheel), 0)
+        clock.now = 30 * DAY
+        self.assertEqual(dispatcher.tick(), [])
+        self.assertEqual(store.state(1), 'approved')
+
+    def test_initial_state_timer(self):
+        '''Timers: Entities added in a timed initial state are scheduled'''
+
+        class Scope1(Scope):
+            initial = 'first'
+
+            class Events:
+                goo = ['first__second']
+
+            class Timers:
+                expire = ('goo', 'first', 60)
+
+        class TestEngine(Engine):
+            scopes = [Scope1]
+
+        clock = Clock()
+        dispatcher = Dispatcher(TestEngine, clock=clock)
+        dispatcher.add('scope1', range(100))
+        clock.now = 61
+        self.assertEqual(len(dispatcher.tick()), 100)
+        self.assertEqual(dispatcher.store('scope1').histogram(), {'first': 0, 'second': 100})
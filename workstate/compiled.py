@@ -0,0 +1,509 @@
+'''Compiled (integer indexed) WorkState dispatch tables'''
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Collection, Dict, Iterable, List, NamedTuple, Set, Tuple, Type
+
+from workstate.engine_graph import ConditionFunc, Transition, _Parsed
+from workstate.exceptions import BrokenStateModelException, EventRejectedException
+
+__all__ = (
+    'Candidate', 'CompiledTrigger', 'CompiledTimer', 'CompiledScope', 'CompiledEngine',
+    'compile_parsed', 'UNCONDITIONAL', 'GUARDED', 'MULTIPLE', 'PRIORITIES', 'NORMAL',
+)
+
+#: Kinds of (state, event) table entries: the first candidate has no condition,
+#: a single candidate has a condition, or several candidates are tried in order
+(UNCONDITIONAL, GUARDED, MULTIPLE) = (0, 1, 2)
+
+#: Event priority classes, highest first, as declared in a scope's ``Priorities``
+PRIORITIES = ('interactive', 'normal', 'bulk')
+
+#: Priority level of events without a declared priority class
+NORMAL = PRIORITIES.index('normal')
+
+
+class Candidate(NamedTuple):
+    '''A candidate transition for a (state, event) pair'''
+    target: int
+    condition: ConditionFunc | None
+    edge: int
+
+
+class CompiledTrigger(NamedTuple):
+    '''A trigger bound to the scope that owns its event'''
+    id: int
+    name: str
+    scope: str
+    event: str
+    condition: ConditionFunc | None
+
+
+class CompiledTimer(NamedTuple):
+    '''A timed event, fired a number of seconds after entering a state'''
+    id: int
+    name: str
+    event: str
+    seconds: float
+    condition: ConditionFunc | None = None
+
+
+@dataclass
+class CompiledScope:  # pylint: disable=R0902
+    '''Dispatch tables for a single scope, all states/events/edges are integer ids'''
+    scope: str
+    cls: Type | None
+    initial: int | None
+    states: List[str] = field(default_factory=list)
+    state_ids: Dict[str, int] = field(default_factory=dict)
+    events: List[str] = field(default_factory=list)
+    event_ids: Dict[str, int] = field(default_factory=dict)
+    edges: List[str] = field(default_factory=list)
+    edge_ids: Dict[str, int] = field(default_factory=dict)
+    table: Dict[Tuple[int, int], Tuple[Candidate, ...]] = field(default_factory=dict)
+    watchers: Dict[int, Tuple[CompiledTrigger, ...]] = field(default_factory=dict)
+    timers: Dict[int, Tuple[CompiledTimer, ...]] = field(default_factory=dict)
+    reach: List[int] = field(default_factory=list)
+    fires: List[int] = field(default_factory=list)
+    allowed: List[Tuple[str, ...]] = field(default_factory=list)
+    priorities: Dict[str, int] = field(default_factory=dict)
+    kinds: Dict[Tuple[int, int], int] = field(default_factory=dict)
+    direct: List[array] = field(default_factory=list)
+    direct_edges: List[array] = field(default_factory=list)
+    planners: Dict[bool, Any] = field(default_factory=dict)
+    adjacency: List[Set[int]] = field(default_factory=list)
+    aliases: Dict[str, str] = field(default_factory=dict)
+    fingerprint: Tuple = ()
+
+    @property
+    def typecode(self) -> str:
+        '''Smallest unsigned array typecode that can hold a state id'''
+        if len(self.states) <= 0x100:
+            return 'B'
+        if len(self.states) <= 0x10000:
+            return 'H'
+        return 'L'
+
+    def fullname(self, state_id: int) -> str:
+        '''Returns canonical state name for a state id'''
+        return f'{self.scope}:{self.states[state_id]}'
+
+    def candidates(self, state_id: int, event: str) -> Tuple[Candidate, ...]:
+        '''Returns candidate transitions for an event in given state'''
+        event_id = self.event_ids.get(event, None)
+        if event_id is None:
+            return ()
+        return self.table.get((state_id, event_id), ())
+
+    def rejection(self,
+                  state_id: int,
+                  event: str,
+                  cands: Tuple[Candidate, ...]) -> EventRejectedException:
+        '''Returns the error for an event that found no passing candidate'''
+        if not cands:
+            return EventRejectedException(
+                f'Event {event} not allowed in state {self.fullname(state_id)}'
+            )
+        return EventRejectedException(
+            f'Transition {self.fullname(state_id)} on {event} failing on condition '
+            + ', '.join(getattr(cand.condition, '__name__', '?') for cand in cands)
+        )
+
+    def closure(self, events: Collection[int] | None = None) -> List[int]:
+        '''Reflexive transitive closure of the table (limited to events) as per-state bitsets'''
+        size = len(self.states)
+        succ: List[Set[int]] = [set() for _ in range(size)]
+        for (state_id, event_id), cands in self.table.items():
+            if events is None or event_id in events:
+                succ[state_id].update(cand.target for cand in cands)
+
+        # Tarjan's strongly connected components, which come out sinks first, so
+        # the reach of every successor component is known by the time it's needed
+        index = [-1] * size
+        low = [0] * size
+        component = [-1] * size
+        creach: List[int] = []
+        stack: List[int] = []
+        visited = 0
+        for root in range(size):
+            if index[root] >= 0:
+                continue
+            index[root] = low[root] = visited
+            visited += 1
+            stack.append(root)
+            work = [(root, iter(succ[root]))]
+            while work:
+                (node, children) = work[-1]
+                for child in children:
+                    if index[child] < 0:
+                        index[child] = low[child] = visited
+                        visited += 1
+                        stack.append(child)
+                        work.append((child, iter(succ[child])))
+                        break
+                    if component[child] < 0:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                    if low[node] == index[node]:
+                        members: List[int] = []
+                        while not members or members[-1] != node:
+                            members.append(stack.pop())
+                            component[members[-1]] = len(creach)
+                        bits = 0
+                        for member in members:
+                            bits |= 1 << member
+                            for child in succ[member]:
+                                if component[child] != len(creach):
+                                    bits |= creach[component[child]]
+                        creach.append(bits)
+        return [creach[component[state_id]] for state_id in range(size)]
+
+    def index(self) -> None:
+        '''(Re)builds the reachability index and the entry kinds
+
+        For every event, ``direct`` holds the target of every state with an
+        unconditional entry (-1 for others) and ``direct_edges`` its edge, so
+        entities can be moved by gathering from them.
+        '''
+        self.planners.clear()
+        self.adjacency = []
+        self.reach = self.closure()
+        self.fires = [0] * len(self.events)
+        allowed: List[List[str]] = [[] for _ in self.states]
+        self.kinds = {}
+        self.direct = [array('q', [-1]) * len(self.states) for _ in self.events]
+        self.direct_edges = [array('q', [-1]) * len(self.states) for _ in self.events]
+        for (state_id, event_id), cands in self.table.items():
+            self.fires[event_id] |= 1 << state_id
+            allowed[state_id].append(self.events[event_id])
+            if cands[0].condition is None:
+                self.kinds[(state_id, event_id)] = UNCONDITIONAL
+                self.direct[event_id][state_id] = cands[0].target
+                self.direct_edges[event_id][state_id] = cands[0].edge
+            else:
+                self.kinds[(state_id, event_id)] = GUARDED if len(cands) == 1 else MULTIPLE
+        self.allowed = [tuple(events) for events in allowed]
+
+    def state_id(self, state: int | str) -> int:
+        '''Returns state id of a state name or id'''
+        if isinstance(state, int):
+            return state
+        if ':' in state:
+            state = state.split(':')[1]
+        return self.state_ids[state]
+
+    def can_reach(self, from_state: int | str, to_state: int | str) -> bool:
+        '''Can an entity in from_state ever reach to_state?'''
+        return bool(self.reach[self.state_id(from_state)] >> self.state_id(to_state) & 1)
+
+    def can_fire(self, from_state: int | str, event: str) -> bool:
+        '''Can event still fire on an entity in from_state, now or in any later state?'''
+        event_id = self.event_ids.get(event, None)
+        if event_id is None:
+            return False
+        return bool(self.reach[self.state_id(from_state)] & self.fires[event_id])
+
+    def unreachable(self) -> List[str]:
+        '''Lists canonical names of states that can't be reached from the initial state'''
+        if self.initial is None:
+            return []
+        reach = self.reach[self.initial]
+        return [
+            self.fullname(state_id) for state_id in range(len(self.states))
+            if not reach >> state_id & 1
+        ]
+
+    def allowed_events(self, state_id: int) -> List[str]:
+        '''Lists events that have a candidate transition from given state'''
+        return list(self.allowed[state_id])
+
+    def partition(self) -> List[int]:
+        '''Block number of every state, the same for states that are equivalent
+
+        States are equivalent when they are watched by the same triggers, have
+        the same timers and, for every event, the same conditions in the same
+        order leading to equivalent states. Starting from a partition by the
+        former, blocks are refined Hopcroft style: a block gets split by the
+        states that do and don't reach a splitter block through a transition
+        label, after which only the smaller half needs to serve as a splitter.
+        '''
+        size = len(self.states)
+        # Every candidate is a label (event id, position, condition) with one target
+        labels: Dict[Tuple[int, int, Any], int] = {}
+        inverse: List[Dict[int, List[int]]] = []
+        defined: List[List[int]] = [[] for _ in range(size)]
+        for (state_id, event_id), cands in self.table.items():
+            for pos, cand in enumerate(cands):
+                label = labels.setdefault((event_id, pos, cand.condition), len(labels))
+                if label == len(inverse):
+                    inverse.append({})
+                inverse[label].setdefault(cand.target, []).append(state_id)
+                defined[state_id].append(label)
+
+        groups: Dict[Tuple, Set[int]] = {}
+        for state_id in range(size):
+            key = (
+                tuple(sorted(defined[state_id])),
+                tuple(_trigger.id for _trigger in self.watchers.get(state_id, ())),
+                tuple(
+                    (timer.event, timer.seconds, timer.condition)
+                    for timer in self.timers.get(state_id, ())
+                ),
+            )
+            groups.setdefault(key, set()).add(state_id)
+        blocks = list(groups.values())
+        block = [0] * size
+        for idx, members in enumerate(blocks):
+            for state_id in members:
+                block[state_id] = idx
+
+        pending = {(idx, label) for idx in range(len(blocks)) for label in range(len(labels))}
+        while pending:
+            (splitter, label) = pending.pop()
+            touched: Dict[int, Set[int]] = {}
+            for target in blocks[splitter]:
+                for state_id in inverse[label].get(target, ()):
+                    touched.setdefault(block[state_id], set()).add(state_id)
+            for idx, hit in touched.items():
+                if len(hit) == len(blocks[idx]):
+                    continue
+                blocks[idx] -= hit
+                new = len(blocks)
+                blocks.append(hit)
+                for state_id in hit:
+                    block[state_id] = new
+                smaller = new if len(hit) <= len(blocks[idx]) else idx
+                for _label in range(len(labels)):
+                    pending.add((new if (idx, _label) in pending else smaller, _label))
+        return block
+
+    def minimized(self) -> CompiledScope:
+        '''Returns the dispatch tables with equivalent states merged, see partition()
+
+        Every merged state is named after its first member, the others remain
+        known as aliases: their names resolve to the merged state id, while
+        the merged state reports its own name. Transitions out of a merged
+        state are those of its first member, so flow stats count those edges.
+        Entities moved into a merged state are in that state only, so stores,
+        Flow hops, History and histograms all report the merged state's name
+        rather than the original target; map names through aliases to compare
+        with unminimized tables. Returns the scope itself if no states are
+        equivalent.
+        '''
+        ids: Dict[int, int] = {}
+        mapping = [ids.setdefault(block, len(ids)) for block in self.partition()]
+        if len(ids) == len(self.states):
+            return self
+        first: Dict[int, int] = {}
+        for state_id, new_id in enumerate(mapping):
+            first.setdefault(new_id, state_id)
+        members = list(first.values())
+        cscope = CompiledScope(
+            self.scope, self.cls, self.initial, fingerprint=self.fingerprint,
+            states=[self.states[state_id] for state_id in members],
+            events=list(self.events), event_ids=dict(self.event_ids),
+            edges=list(self.edges), edge_ids=dict(self.edge_ids),
+            priorities=dict(self.priorities),
+        )
+        cscope.state_ids = {state: mapping[state_id] for state, state_id in self.state_ids.items()}
+        cscope.aliases = {
+            state: cscope.states[new_id]
+            for state, new_id in cscope.state_ids.items() if cscope.states[new_id] != state
+        }
+        for (state_id, event_id), cands in self.table.items():
+            if first[mapping[state_id]] == state_id:
+                cscope.table[(mapping[state_id], event_id)] = tuple(
+                    cand._replace(target=mapping[cand.target]) for cand in cands
+                )
+        for state_id in members:
+            if state_id in self.watchers:
+                cscope.watchers[mapping[state_id]] = self.watchers[state_id]
+            if state_id in self.timers:
+                cscope.timers[mapping[state_id]] = self.timers[state_id]
+        cscope.index()
+        return cscope
+
+
+@dataclass
+class CompiledEngine:
+    '''Compiled dispatch tables for all scopes of a model'''
+    scopes: Dict[str, CompiledScope]
+    triggers: List[CompiledTrigger]
+    links: Dict[Tuple[str, int], List[Tuple]] | None = None
+
+    def get_scope(self, scope: str) -> CompiledScope:
+        '''Returns the compiled scope'''
+        try:
+            return self.scopes[scope]
+        except KeyError as exc:
+            raise BrokenStateModelException(f'Scope {scope} is not part of the model') from exc
+
+
+class _ScopeSource(NamedTuple):
+    '''Parsed model items of a single scope, in compile order'''
+    states: List[str]
+    edges: List[Tuple[str, Transition]]
+    events: List[Tuple[str, str]]
+    watchers: List[Tuple[str, CompiledTrigger]]
+    timers: List[Tuple[str, CompiledTimer]]
+
+
+class _Same:  # pylint: disable=R0903
+    '''A condition compared by identity, as expressions overload == to build comparisons'''
+
+    __slots__ = ('condition', )
+
+    def __init__(self, condition: ConditionFunc | None) -> None:
+        self.condition = condition
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, _Same) and self.condition is other.condition
+
+    def __hash__(self) -> int:
+        return id(self.condition)
+
+
+def _fingerprint(cls: Any, initial: str | None, source: _ScopeSource, minimize: bool) -> Tuple:
+    '''What the tables of a scope are compiled from, with conditions compared by identity'''
+    return (
+        cls, initial, tuple(source.states),
+        tuple(
+            (edge, trans.from_state, trans.to_state, _Same(trans.condition), trans.doc)
+            for edge, trans in source.edges
+        ),
+        tuple(source.events),
+        tuple(
+            (state, ctrigger[:-1], _Same(ctrigger.condition))
+            for state, ctrigger in source.watchers
+        ),
+        tuple(
+            (state, ctimer[:-1], _Same(ctimer.condition))
+            for state, ctimer in source.timers
+        ),
+        minimize,
+    )
+
+
+def _compile_scope(scope: str,
+                   cls: Any,
+                   initial: str | None,
+                   source: _ScopeSource) -> CompiledScope:
+    '''Compiles the dispatch tables of a single scope'''
+    cscope = CompiledScope(scope, cls, 0 if initial else None)
+    cscope.priorities = {
+        event: PRIORITIES.index(priority)
+        for event, priority in getattr(cls, '__priorities', {}).items()
+    }
+
+    for state in source.states:
+        cscope.state_ids[state] = len(cscope.states)
+        cscope.states.append(state)
+
+    for edge, _ in source.edges:
+        cscope.edge_ids[edge] = len(cscope.edges)
+        cscope.edges.append(edge)
+
+    transitions = dict(source.edges)
+    wildcards: List[Tuple[int, Candidate]] = []
+    for event, edge in source.events:
+        trans = transitions[edge]
+        if event not in cscope.event_ids:
+            cscope.event_ids[event] = len(cscope.events)
+            cscope.events.append(event)
+        event_id = cscope.event_ids[event]
+        cand = Candidate(cscope.state_ids[trans.to_state], trans.condition, cscope.edge_ids[edge])
+        if trans.from_state == '*':
+            wildcards.append((event_id, cand))
+        else:
+            key = (cscope.state_ids[trans.from_state], event_id)
+            cscope.table[key] = cscope.table.get(key, ()) + (cand, )
+
+    # Wildcard edges apply to every other state, after any explicit edges
+    for event_id, cand in wildcards:
+        for state_id in range(len(cscope.states)):
+            if state_id != cand.target:
+                key = (state_id, event_id)
+                cscope.table[key] = cscope.table.get(key, ()) + (cand, )
+
+    for state, ctrigger in source.watchers:
+        state_id = cscope.state_ids[state]
+        cscope.watchers[state_id] = cscope.watchers.get(state_id, ()) + (ctrigger, )
+
+    for state, ctimer in source.timers:
+        state_id = cscope.state_ids[state]
+        cscope.timers[state_id] = cscope.timers.get(state_id, ()) + (ctimer, )
+
+    cscope.index()
+    return cscope
+
+
+def compile_parsed(parsed: _Parsed,
+                   initials: Dict[str, str | None],
+                   classes: Dict[str, Any],
+                   previous: Iterable[CompiledEngine] = (),
+                   minimize: bool = False) -> CompiledEngine:
+    '''Compiles a parsed model into integer indexed dispatch tables
+
+    Scopes whose parsed model is unchanged from one of the previous compiles
+    are re-used as is, only changed scopes get recompiled. With minimize,
+    equivalent states of every scope are merged.
+    '''
+    reusable: Dict[str, List[CompiledScope]] = {}
+    for _previous in previous:
+        for scope, cscope in _previous.scopes.items():
+            reusable.setdefault(scope, []).append(cscope)
+
+    sources: Dict[str, _ScopeSource] = {}
+
+    for _state in parsed.states.states.values():
+        if _state.scope not in sources:
+            initial = initials.get(_state.scope, None)
+            # Initial state always gets id 0
+            sources[_state.scope] = _ScopeSource([initial] if initial else [], [], [], [], [])
+        if _state.state != initials.get(_state.scope, None):
+            sources[_state.scope].states.append(_state.state)
+
+    for edge, trans in parsed.transitions.transitions.items():
+        sources[trans.scope].edges.append((edge, trans))
+
+    for event in parsed.events.events.values():
+        for _edge in event.transitions:
+            edge = parsed.transitions.fullname(_edge)
+            sources[parsed.transitions.transitions[edge].scope].events.append((event.event, edge))
+
+    triggers: List[CompiledTrigger] = []
+    for _trigger in parsed.triggers.triggers.values():
+        owner = _trigger.name.split(':')[0]
+        ctrigger = CompiledTrigger(
+            len(triggers), _trigger.name, owner, _trigger.event, _trigger.condition
+        )
+        triggers.append(ctrigger)
+        for _state in _trigger.states:
+            (scope, state) = parsed.states.fullname(_state, owner).split(':')
+            if scope in sources and state in sources[scope].states:
+                sources[scope].watchers.append((state, ctrigger))
+
+    for idx, timer in enumerate(parsed.timers.timers.values()):
+        (scope, state) = timer.state.split(':')
+        sources[scope].timers.append(
+            (state, CompiledTimer(idx, timer.name, timer.event, timer.seconds))
+        )
+
+    scopes: Dict[str, CompiledScope] = {}
+    for scope, source in sources.items():
+        (cls, initial) = (classes.get(scope, None), initials.get(scope, None))
+        fingerprint = _fingerprint(cls, initial, source, minimize)
+        for old in reusable.get(scope, ()):
+            if old.fingerprint == fingerprint:
+                scopes[scope] = old
+                break
+        else:
+            cscope = _compile_scope(scope, cls, initial, source)
+            cscope.fingerprint = fingerprint
+            scopes[scope] = cscope.minimized() if minimize else cscope
+
+    return CompiledEngine(scopes, triggers)
@@ -0,0 +1,611 @@
+'''WorkState event dispatcher'''
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Tuple, Type
+
+from workstate.compiled import (GUARDED, UNCONDITIONAL, CompiledEngine, CompiledScope,
+                                CompiledTimer, CompiledTrigger)
+from workstate.exceptions import BrokenStateModelException
+from workstate.expr import Expr
+from workstate.guards import GuardPool, GuardTimeout
+from workstate.history import History, Step, cause
+from workstate.hooks import HOOKS
+from workstate.memo import ConditionCache
+from workstate.stats import FlowStats
+from workstate.store import EntityHandle, ScopeStore, WriteSet
+from workstate.timers import TimingWheel
+
+if TYPE_CHECKING:  # pragma: nocoverage
+    from workstate.shared import SharedModel
+
+try:
+    import numpy as np
+except ImportError:  # pragma: nocoverage
+    np = None  # type: ignore
+
+__all__ = ('Dispatcher', 'Flow')
+
+#: A single hop: (event, trigger name, from state, to state)
+Hop = Tuple[str, 'str | None', str, str]
+
+
+class Flow:
+    '''The transitions that resulted from dispatching a single event'''
+
+    __slots__ = ('events', )
+
+    def __init__(self, events: List[Hop]) -> None:
+        self.events = events
+
+    @property
+    def state(self) -> str | None:
+        '''Final state of the last hop'''
+        return self.events[-1][3] if self.events else None
+
+    def __repr__(self) -> str:
+        return f'<Flow {self.events!r}>'
+
+
+class Dispatcher:  # pylint: disable=R0902
+    '''Applies events to entities held in columnar ScopeStores
+
+    Triggers watching a state fire their event on the same entity, or on the
+    linked entities of the trigger's own scope, whenever that state is entered.
+    Timers are scheduled on entering their state, cancelled on leaving it, and
+    fire from ``tick()``.
+
+    Every event, and every batch run inside ``cycle()``, is a dispatch cycle
+    within which results of conditions with declared dependencies are cached.
+    A new model can be swapped in with ``reload()``, which only ever happens
+    between dispatch cycles.
+
+    Within ``transaction()`` (or for ``event(..., atomic=True)``) transitions
+    are staged in a WriteSet and committed in one batch when the block ends,
+    or rolled back if anything raises, such as a failing guard halfway
+    through a cascade.
+    '''
+
+    #: Maximum number of cascaded trigger hops for a single event
+    max_depth = 64
+
+    def __init__(self,
+                 model: Type | SharedModel,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.model = model
+        self.clock = clock
+        self.compiled: CompiledEngine = model.compile()
+        self.stores: Dict[str, ScopeStore] = {
+            scope: ScopeStore(compiled, self) for scope, compiled in self.compiled.scopes.items()
+        }
+        self.stats = FlowStats(self.compiled, clock=clock)
+        self.wheel = TimingWheel(start=clock())
+        self._timers: Dict[Tuple[str, int], List[int]] = {}
+        self.memo = ConditionCache(self.compiled)
+        self._cycles = 0
+        self._lock = threading.RLock()
+        self._reload: Tuple[Type | SharedModel, Dict[str, str] | None] | None = None
+        self._writes: WriteSet | None = None
+        self.history: History | None = None
+        self.guards: GuardPool | None = None
+
+    def store(self, scope: str) -> ScopeStore:
+        '''Returns the store for scope'''
+        try:
+            return self.stores[scope]
+        except KeyError as exc:
+            raise BrokenStateModelException(f'Scope {scope} is not part of the model') from exc
+
+    def add(self, scope: str, keys: Iterable[int], **attributes: Any) -> ScopeStore:
+        '''Bulk adds entities to a scope in their initial state'''
+        store = self.store(scope)
+        store.add(keys, **attributes)
+        return store
+
+    def link(self,
+             scope: str,
+             keys: Iterable[int],
+             parent_scope: str,
+             parent_keys: Iterable[int]) -> None:
+        '''Links entities to a parent entity in another scope'''
+        store = self.store(scope)
+        parent = self.store(parent_scope)
+        store.link(
+            [store.row(key) for key in keys], parent, [parent.row(key) for key in parent_keys]
+        )
+
+    def added(self, store: ScopeStore, rows: range) -> None:
+        '''Schedules timers of the initial state for newly added rows'''
+        if store.compiled.initial in store.compiled.timers:
+            for row in rows:
+                self._retime(store, row, store.compiled.initial)
+
+    def state(self, scope: str, key: int) -> str:
+        '''Returns state name of entity'''
+        return self.store(scope).state(key)
+
+    def histogram(self) -> Dict[str, Dict[str, int]]:
+        '''Returns number of entities per state of each scope'''
+        return {scope: store.histogram() for scope, store in self.stores.items()}
+
+    def recount(self) -> Dict[str, Dict[str, int]]:
+        '''Recomputes all state counts from the state columns'''
+        return {scope: store.recount() for scope, store in self.stores.items()}
+
+    def changed(self, store: ScopeStore, row: int, attribute: str) -> None:
+        '''Notes that an attribute of an entity was written'''
+        self.memo.changed(store, row, attribute)
+
+    def keep_history(self, capacity: int = 16, max_age: float | None = None) -> History:
+        '''Starts keeping the most recent hops of every entity, see History'''
+        self.history = History(self.compiled, capacity, max_age, clock=self.clock)
+        return self.history
+
+    def guard_pool(self,
+                   workers: int = 4,
+                   conditions: Dict[str, Tuple[float, Any]] | None = None) -> GuardPool:
+        '''Starts running flagged conditions in a bounded thread pool, see GuardPool'''
+        with self._lock:
+            if self.guards is not None:
+                self.guards.close()
+            self.guards = GuardPool(self.compiled, workers, conditions)
+            self.memo = ConditionCache(self.compiled, self.guards)
+        return self.guards
+
+    def timeline(self, scope: str, key: int) -> List[Step]:
+        '''Returns the retained history of an entity, empty if no history is kept'''
+        store = self.store(scope)
+        if self.history is None:
+            return []
+        return self.history.steps(scope, store.row(key))
+
+    @contextmanager
+    def cycle(self) -> Iterator[None]:
+        '''Groups dispatches into a single cycle for condition caching'''
+        with self._lock:
+            self._cycles += 1
+            try:
+                yield
+            finally:
+                self._cycles -= 1
+                if not self._cycles:
+                    self.memo.clear()
+                    if self._reload is not None:
+                        (model, renames) = self._reload
+                        self._reload = None
+                        self.reload(model, renames)
+
+    def reload(self,
+               model: Type | SharedModel,
+               renames: Dict[str, str] | None = None) -> None:
+        '''Swaps in a new model between dispatch cycles
+
+        Scopes whose compiled tables are re-used by the new model, or that
+        compile to the same tables, are left as is; entities of changed scopes
+        get their state ids remapped by state name. Entities in states that no
+        longer exist need to be moved through renames, a mapping of canonical
+        old state names to new state names. If called during a dispatch cycle
+        the reload is deferred to its end.
+        '''
+        with self._lock:
+            if self._cycles:
+                self._reload = (model, renames)
+                return
+
+            compiled: CompiledEngine = model.compile()
+            # Identical scopes of independently defined models keep the live tables
+            same = {
+                scope: self.compiled.scopes[scope] for scope, cscope in compiled.scopes.items()
+                if scope in self.compiled.scopes and cscope.fingerprint
+                and cscope.fingerprint == self.compiled.scopes[scope].fingerprint
+            }
+            if any(cscope is not compiled.scopes[scope] for scope, cscope in same.items()):
+                compiled = CompiledEngine({**compiled.scopes, **same}, compiled.triggers)
+            renames = renames or {}
+            mappings: Dict[str, List[int]] = {}
+            for scope, store in self.stores.items():
+                new = compiled.scopes.get(scope, None)
+                if new is store.compiled:
+                    continue
+                if new is None:
+                    if len(store):
+                        raise BrokenStateModelException(
+                            f'Scope {scope} has entities but is not part of the new model'
+                        )
+                    continue
+                mapping = [
+                    new.state_ids.get(renames.get(f'{scope}:{state}', state), -1)
+                    for state in store.compiled.states
+                ]
+                missing = [
+                    store.compiled.fullname(state_id) for state_id, new_id in enumerate(mapping)
+                    if new_id < 0 and store.counts[state_id]
+                ]
+                if missing:
+                    raise BrokenStateModelException(
+                        f'States {missing} have entities but are not part of the new model'
+                    )
+                mappings[scope] = mapping
+
+            # Everything checks out, swap in the new model
+            previous = self.compiled
+            (self.model, self.compiled) = (model, compiled)
+            self.stores = {
+                scope: self.stores[scope] if scope in self.stores else ScopeStore(cscope, self)
+                for scope, cscope in compiled.scopes.items()
+            }
+            for scope, mapping in mappings.items():
+                self.stores[scope].rebind(compiled.scopes[scope], mapping)
+            self.stats.rebind(compiled)
+            if self.history is not None:
+                self.history.rebind(compiled, renames)
+            if self.guards is not None:
+                self.guards.bind(compiled)
+            self.memo = ConditionCache(compiled, self.guards)
+            for scope in mappings:
+                self._schedule_new_timers(self.stores[scope], previous.scopes[scope])
+
+    def _schedule_new_timers(self, store: ScopeStore, previous: CompiledScope) -> None:
+        '''Schedules timers added by a reload for entities already in their state'''
+        now = self.clock()
+        for state_id, timers in store.compiled.timers.items():
+            old_id = previous.state_ids.get(store.compiled.states[state_id], None)
+            known = {timer.name for timer in previous.timers.get(old_id, ())}  # type: ignore
+            added = [timer for timer in timers if timer.name not in known]
+            if not added or not store.counts[state_id]:
+                continue
+            for row, _state_id in enumerate(store.states):
+                if _state_id == state_id:
+                    self._timers.setdefault((store.scope, row), []).extend(
+                        self.wheel.schedule(now + timer.seconds, (store.scope, row, timer))
+                        for timer in added
+                    )
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        '''Stages all transitions within, committing them together or rolling back on error'''
+        if self._writes is not None:
+            # Nested transactions are part of the outer one
+            yield
+            return
+        with self.cycle():
+            writes = self._writes = WriteSet()
+            try:
+                yield
+            except BaseException:
+                writes.rollback()
+                for store, originals in writes.originals.items():
+                    for row in originals:
+                        self.changed(store, row, 'state')
+                raise
+            finally:
+                self._writes = None
+            if HOOKS.commit:
+                HOOKS.timed('commit', {
+                    'scopes': {store.scope: len(rows) for store, rows in writes.originals.items()},
+                    'hops': len(writes.edges),
+                }, self._commit, writes)
+            else:
+                self._commit(writes)
+
+    def _commit(self, writes: WriteSet) -> None:
+        '''Commits staged transitions: state counts, timers and flow statistics'''
+        for store, originals in writes.originals.items():
+            store.commit(originals)
+            if self._timers or store.compiled.timers:
+                for row in originals:
+                    self._retime(store, row, store.states[row])
+        for scope, edge in writes.edges:
+            self.stats.record(scope, edge)
+        if self.history is not None:
+            for hop in writes.hops:
+                self.history.record(*hop)
+
+    def event(self, scope: str, key: int, event: str, atomic: bool = False) -> Flow:
+        '''Applies event to entity, including any cascaded triggers
+
+        With atomic, the whole cascade is applied as a single transaction.
+        '''
+        store = self.store(scope)
+        hops: List[Hop] = []
+        with self.transaction() if atomic else self.cycle():
+            if HOOKS.dispatch:
+                HOOKS.timed('dispatch', {
+                    'scope': scope, 'key': key, 'event': event,
+                }, self._fire, store, store.row(key), event, None, hops, 0)
+            else:
+                self._fire(store, store.row(key), event, None, hops, 0)
+        return Flow(hops)
+
+    def apply(self, scope: str, event: str, keys: Iterable[int] | None = None) -> Any:
+        '''Applies event to all (or the given) entities of a scope at once
+
+        Guards are evaluated for all entities before any of them moves:
+        expression conditions (see ``workstate.expr``) as NumPy predicates over
+        the store columns, other conditions per entity, while entities in states
+        with an unconditional entry are moved by a single gather of their
+        targets. The moves are written in bulk, after which triggers cascade
+        the same way, a hop at a time over all moved (or related) entities.
+        Entities the event can't move are skipped, and entities given more than
+        once are moved once. Returns the keys of entities moved by the event
+        itself.
+        '''
+        if np is None:  # pragma: nocoverage
+            raise ImportError('Bulk event application requires NumPy')
+        store = self.store(scope)
+        if keys is None:
+            rows = np.arange(len(store))
+        else:
+            rows = np.fromiter((store.row(key) for key in keys), dtype='q')
+            # Repeated rows would be counted (and written) once per occurrence
+            (_, first) = np.unique(rows, return_index=True)
+            if len(first) < len(rows):
+                rows = rows[np.sort(first)]
+        with self.cycle():
+            if HOOKS.dispatch:
+                moved = HOOKS.timed('dispatch', {
+                    'scope': scope, 'entities': len(rows), 'event': event,
+                }, self._bulk, store, rows, event, None, 0)
+            else:
+                moved = self._bulk(store, rows, event, None, 0)
+        return np.frombuffer(store.keys, dtype='q')[moved] if len(store) else moved
+
+    def _passing(self, store: ScopeStore, rows: Any, condition: Any) -> Any:
+        '''Mask of rows passing a condition, vectorized for expression conditions'''
+        if condition is None:
+            return np.ones(len(rows), dtype=bool)
+        if isinstance(condition, Expr):
+            return np.broadcast_to(condition.vector(store, rows), (len(rows), )).astype(bool)
+        return np.fromiter((
+            self._check(condition, store, row) for row in rows.tolist()
+        ), dtype=bool, count=len(rows))
+
+    def _check(self, condition: Any, store: ScopeStore, row: int) -> bool:
+        '''Evaluates a condition for bulk moves, where timing out means not moving'''
+        try:
+            return self.memo.check(condition, store, row, EntityHandle(store, row))
+        except GuardTimeout:
+            return False
+
+    def _bulk(self,  # pylint: disable=R0915
+              store: ScopeStore,
+              rows: Any,
+              event: str,
+              _trigger: CompiledTrigger | None,
+              depth: int) -> Any:
+        '''Fires event on rows at once, returns the rows moved'''
+        compiled = store.compiled
+        event_id = compiled.event_ids.get(event, None)
+        if event_id is None or not rows.size:
+            return rows[:0]
+        states = store.column()[rows]
+        if _trigger is not None:
+            # Triggers only fire on entities the event can move
+            fires = np.asarray([compiled.fires[event_id] >> state_id & 1
+                                for state_id in range(len(compiled.states))], dtype=bool)
+            keep = fires[states]
+            (rows, states) = (rows[keep], states[keep])
+            if rows.size and _trigger.condition is not None:
+                keep = self._passing(store, rows, _trigger.condition)
+                (rows, states) = (rows[keep], states[keep])
+            if not rows.size:
+                return rows
+            if depth > self.max_depth:
+                raise BrokenStateModelException(
+                    f'Trigger cascade exceeded {self.max_depth} hops at {_trigger.name}'
+                )
+            if HOOKS.trigger:
+                HOOKS.emit('trigger', {
+                    'scope': store.scope, 'entities': len(rows), 'trigger': _trigger.name,
+                    'event': event, 'depth': depth,
+                })
+
+        # Moves as (rows, from state ids, target ids, edge ids), starting with
+        # all unconditional entries gathered at once
+        targets = np.frombuffer(compiled.direct[event_id], dtype='q')[states]
+        direct = targets >= 0
+        moves: List[Tuple[Any, Any, Any, Any]] = [(
+            rows[direct], states[direct], targets[direct],
+            np.frombuffer(compiled.direct_edges[event_id], dtype='q')[states[direct]],
+        )]
+        (rows, states) = (rows[~direct], states[~direct])
+        for state_id in np.unique(states).tolist():
+            pending = rows[states == state_id]
+            for cand in compiled.table.get((state_id, event_id), ()):
+                passed = self._passing(store, pending, cand.condition)
+                movers = pending[passed]
+                moves.append((
+                    movers, np.full(movers.size, state_id), np.full(movers.size, cand.target),
+                    np.full(movers.size, cand.edge),
+                ))
+                pending = pending[~passed]
+                if not pending.size:
+                    break
+
+        # All moves are written before any of them cascade
+        size = len(compiled.states)
+        timed = self._writes is None and (self._timers or compiled.timers)
+        for (movers, froms, targets, edges) in moves:
+            if not movers.size:
+                continue
+            if self._writes is None:
+                store.column()[movers] = targets
+                counts = np.frombuffer(store.counts, dtype='q')
+                counts -= np.bincount(froms, minlength=size)
+                counts += np.bincount(targets, minlength=size)
+                for edge, number in enumerate(np.bincount(edges).tolist()):
+                    if number:
+                        self.stats.record(store.scope, edge, number)
+            if self._writes is None and self.history is None and not timed:
+                for row in movers.tolist():
+                    self.changed(store, row, 'state')
+                continue
+            for (row, state_id, target, edge) in zip(
+                    movers.tolist(), froms.tolist(), targets.tolist(), edges.tolist()):
+                if self._writes is not None:
+                    self._writes.stage(store, row, target, edge)
+                self.changed(store, row, 'state')
+                if timed:
+                    self._retime(store, row, target)
+                if self.history is not None:
+                    self._record(store, row, event_id, _trigger, state_id, target)
+
+        for (movers, _, targets, _) in moves:
+            for target in np.unique(targets).tolist():
+                if target in compiled.watchers:
+                    self._watchers(store, movers[targets == target], target, depth)
+
+        return np.concatenate([movers for movers, _, _, _ in moves])
+
+    def _watchers(self, store: ScopeStore, movers: Any, target: int, depth: int) -> None:
+        '''Fires the triggers watching a state on all rows that entered it at once'''
+        for watcher in store.compiled.watchers[target]:
+            if watcher.scope == store.scope:
+                self._bulk(store, movers, watcher.event, watcher, depth + 1)
+                continue
+            other = self.stores[watcher.scope]
+            if other.scope in store.parents:
+                related = np.frombuffer(store.parents[other.scope], dtype='q')[movers]
+                related = np.unique(related[related >= 0])
+            else:
+                related = np.unique(np.fromiter((
+                    _row for row in movers.tolist() for _row in store.related(row, other.scope)
+                ), dtype='q'))
+            self._bulk(other, related, watcher.event, watcher, depth + 1)
+
+    def tick(self, now: float | None = None) -> List[Flow]:
+        '''Fires all timed events that are due, returns their flows'''
+        flows: List[Flow] = []
+        with self.cycle():
+            for scope, row, timer in self.wheel.advance(self.clock() if now is None else now):
+                store = self.stores[scope]
+                # The model may have been reloaded since the timer was scheduled
+                current = store.compiled.timers.get(store.states[row], ())
+                if timer not in current:
+                    timer = next((_timer for _timer in current if _timer.name == timer.name), None)
+                    if timer is None:
+                        continue
+                hops: List[Hop] = []
+                self._fire(store, row, timer.event, timer, hops, 0)
+                if hops:
+                    flows.append(Flow(hops))
+        return flows
+
+    def _retime(self, store: ScopeStore, row: int, state_id: int) -> None:
+        '''Cancels timers of the state left, and schedules those of the state entered'''
+        key = (store.scope, row)
+        for timer_id in self._timers.pop(key, ()):
+            self.wheel.cancel(timer_id)
+        timers = store.compiled.timers.get(state_id, None)
+        if timers:
+            now = self.clock()
+            self._timers[key] = [
+                self.wheel.schedule(now + timer.seconds, (store.scope, row, timer))
+                for timer in timers
+            ]
+
+    def _fire(self,
+              store: ScopeStore,
+              row: int,
+              event: str,
+              _trigger: CompiledTrigger | CompiledTimer | None,
+              hops: List[Hop],
+              depth: int) -> bool:
+        '''Fires event on a row, returns False if a trigger could not fire'''
+        compiled = store.compiled
+        state_id = store.states[row]
+        event_id = compiled.event_ids.get(event, -1)
+        kind = compiled.kinds.get((state_id, event_id), None)
+
+        try:
+            if _trigger is not None:
+                if kind is None:
+                    return False
+                if _trigger.condition is not None and not self.memo.check(
+                        _trigger.condition, store, row, EntityHandle(store, row)):
+                    return False
+                if depth > self.max_depth:
+                    raise BrokenStateModelException(
+                        f'Trigger cascade exceeded {self.max_depth} hops at {_trigger.name}'
+                    )
+                if HOOKS.trigger:
+                    HOOKS.emit('trigger', {
+                        'scope': store.scope, 'key': store.keys[row], 'trigger': _trigger.name,
+                        'event': event, 'depth': depth,
+                    })
+
+            # Unconditional entries move without creating a handle or calling anything
+            cands = compiled.table.get((state_id, event_id), ())
+            cand = cands[0] if cands else None
+            if kind == GUARDED:
+                handle = EntityHandle(store, row)
+                if not self.memo.check(cands[0].condition, store, row, handle):  # type: ignore
+                    cand = None
+            elif kind != UNCONDITIONAL:
+                handle = EntityHandle(store, row)
+                cand = next((
+                    _cand for _cand in cands
+                    if _cand.condition is None
+                    or self.memo.check(_cand.condition, store, row, handle)
+                ), None)
+        except GuardTimeout:
+            if _trigger is None:
+                raise
+            # Earlier hops are written already, a trigger timing out just doesn't fire
+            return False
+        if cand is None:
+            if _trigger is not None:
+                return False
+            raise compiled.rejection(state_id, event, cands)
+
+        if self._writes is None:
+            store.move(row, cand.target)
+            self.stats.record(store.scope, cand.edge)
+        else:
+            self._writes.stage(store, row, cand.target, cand.edge)
+        self.changed(store, row, 'state')
+        if self._writes is None and (self._timers or compiled.timers):
+            self._retime(store, row, cand.target)
+        hops.append((
+            event,
+            _trigger.name if _trigger else None,
+            compiled.fullname(state_id),
+            compiled.fullname(cand.target),
+        ))
+        if self.history is not None:
+            self._record(store, row, event_id, _trigger, state_id, cand.target)
+
+        for watcher in compiled.watchers.get(cand.target, ()):
+            if watcher.scope == store.scope:
+                self._fire(store, row, watcher.event, watcher, hops, depth + 1)
+            else:
+                self._cascade(store, row, watcher, hops, depth + 1)
+
+        return True
+
+    def _record(self,  # pylint: disable=R0917
+                store: ScopeStore,
+                row: int,
+                event_id: int,
+                _trigger: CompiledTrigger | CompiledTimer | None,
+                from_id: int,
+                to_id: int) -> None:
+        '''Records a hop in the history, or stages it with the transaction'''
+        hop = (store.scope, row, event_id, cause(_trigger), from_id, to_id)
+        if self._writes is None:
+            self.history.record(*hop)  # type: ignore
+        else:
+            self._writes.hops.append(hop)
+
+    def _cascade(self,
+                 store: ScopeStore,
+                 row: int,
+                 watcher: CompiledTrigger,
+                 hops: List[Hop],
+                 depth: int) -> None:
+        '''Fires a cross-scope trigger on the related entities of its own scope'''
+        other = self.stores[watcher.scope]
+        for other_row in store.related(row, watcher.scope):
+            self._fire(other, other_row, watcher.event, watcher, hops, depth)
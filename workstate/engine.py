@@ -1,15 +1,20 @@
 '''WorkState engine'''
 from __future__ import annotations
 
-from typing import Callable, Dict, List
+from typing import Any, Callable, Dict, List
 
+from workstate.compiled import CompiledEngine, compile_parsed
 from workstate.docgen import FGCOLORS, Digraph
-from workstate.engine_graph import ConditionType, Events, States, Transitions, Triggers, _Parsed
+from workstate.engine_graph import ConditionType, _Parsed, share_parsed
+from workstate.entity import Entity
 from workstate.exceptions import BrokenStateModelException
+from workstate.hooks import HOOKS
+from workstate.planner import get_planner
 from workstate.scope import Scope
-from workstate.utils import check_edges, mark_states
+from workstate.subgraph import collapsed, neighborhood, scope_graph
+from workstate.utils import check_edges
 
-__all__ = ['Engine', 'Scope', 'BrokenStateModelException', 'trigger']
+__all__ = ['Engine', 'Scope', 'BrokenStateModelException', 'trigger', 'depends', 'isolate']
 
 # pylint: disable=R0801
 
@@ -27,29 +32,19 @@ class EngineMeta(type):
 
             _scopes: List[Scope] = dct['scopes']
             scopes: Dict[str, str | None] = {}
-            states = States(None)
-            transs = Transitions(None, states)
-            events = Events(transs)
-            triggers = Triggers(events, states)
 
-            dct['__parsed'] = _Parsed(scopes, states, transs, events, triggers)
-
-            for scope in _scopes:
-                spar = scope.get_parsed()
-
-                for state in spar.states.states.values():
-                    states.merge_state(state)
-
-                for trans in spar.transitions.transitions.values():
-                    transs.merge_transition(trans)
-
-                for event in spar.events.events.values():
-                    events.merge_event(event)
-
-                for _trigger in spar.triggers.triggers.values():
-                    triggers.merge_trigger(_trigger)
-
-            scopenames = {a.scope for a in states.states.values()}
+            # Scope models are shared by identity, only cross-scope glue is engine-local
+            if HOOKS.engine_merge:
+                parsed = HOOKS.timed(
+                    'engine_merge',
+                    {'engine': name, 'scopes': [scope.get_scope() for scope in _scopes]},
+                    share_parsed, scopes, [scope.get_parsed() for scope in _scopes],
+                )
+            else:
+                parsed = share_parsed(scopes, [scope.get_parsed() for scope in _scopes])
+            dct['__parsed'] = parsed
+
+            scopenames = {a.scope for a in parsed.states.states.values()}
             for _name in scopenames:
                 try:
                     scopes[_name] = [a.get_initial() for a in _scopes if a.get_scope() == _name][0]
@@ -60,7 +55,10 @@ class EngineMeta(type):
         cls: Engine = type.__new__(mcs, name, parents, dct)  # type: ignore
         if '__the_base_class__' not in dct:
             # Validate the Engine to ensure it is sane
-            cls.validate()
+            if HOOKS.engine_validate:
+                HOOKS.timed('engine_validate', {'engine': name}, cls.validate)
+            else:
+                cls.validate()
         return cls  # type: ignore
 
 
@@ -69,6 +67,10 @@ class Engine(metaclass=EngineMeta):
 
     __the_base_class__ = True
 
+    #: Merge equivalent states of every scope when compiling, see CompiledScope.minimized().
+    #: Entities in merged states report the merged state's name at runtime.
+    minimize = False
+
     @classmethod
     def get_parsed(cls) -> _Parsed:
         '''returns the parsed translation lookup'''
@@ -94,6 +96,41 @@ class Engine(metaclass=EngineMeta):
 
         return events
 
+    @classmethod
+    def compile(cls, original: bool = False) -> CompiledEngine:
+        '''Returns the compiled dispatch tables, compiling them on first use
+
+        Compiled tables of scopes that are unchanged from the parent Engine,
+        if any, or from the scopes' own compiles are re-used. With original,
+        returns the tables without equivalent states merged (see minimize).
+        '''
+        key = '__original' if original and cls.minimize else '__compiled'
+        if key not in cls.__dict__:
+            previous = [
+                base.__dict__[key] for base in cls.__mro__[1:] if key in base.__dict__
+            ][:1]
+            previous.extend(
+                scope.__dict__['__compiled'] for scope in cls.get_scopes()
+                if '__compiled' in scope.__dict__
+            )
+            minimize = cls.minimize and not original
+            args = (
+                cls.get_parsed(),
+                cls.get_parsed().scopes,
+                {scope.get_scope(): scope for scope in cls.get_scopes()},
+                previous,
+                minimize,
+            )
+            if HOOKS.compile:
+                compiled = HOOKS.timed('compile', {
+                    'model': cls.__name__, 'scopes': list(cls.get_parsed().scopes),
+                    'minimize': minimize,
+                }, compile_parsed, *args)
+            else:
+                compiled = compile_parsed(*args)
+            setattr(cls, key, compiled)
+        return cls.__dict__[key]  # type: ignore
+
     @classmethod
     def graph(cls) -> Digraph:
         '''Generates dot graph for whole engine'''
@@ -111,6 +148,34 @@ class Engine(metaclass=EngineMeta):
 
         return dot
 
+    @classmethod
+    def graph_neighborhood(cls,
+                           scope: str,
+                           state: str | None = None,
+                           event: str | None = None,
+                           hops: int = 1) -> Digraph:
+        '''Generates dot graph of the states within hops of a state or event of scope'''
+        return neighborhood(cls.compile(original=True), scope, state, event, hops)
+
+    @classmethod
+    def graph_focus(cls, scope: str) -> Digraph:
+        '''Generates dot graph of a single scope, plus any triggers touching it'''
+        return scope_graph(cls.compile(original=True), scope)
+
+    @classmethod
+    def graph_collapsed(cls) -> Digraph:
+        '''Generates dot graph with a single node per scope, linked by triggers'''
+        return collapsed(cls.compile(original=True))
+
+    @classmethod
+    def instantiate(cls,
+                    scope: str,
+                    obj: Any = None,
+                    key: Any = None,
+                    state: str | None = None) -> Entity:
+        '''Returns an entity of scope, in the initial state unless given'''
+        return Entity(cls.compile().get_scope(scope), key, state, obj)
+
     @classmethod
     def validate(cls) -> None:
         '''Validates the WorkState Engine'''
@@ -122,8 +187,6 @@ class Engine(metaclass=EngineMeta):
 
         # TODO: Validate triggers
 
-        _scopes = cls.get_parsed().scopes
-        _states = cls.get_parsed().states.states
         _transitions = cls.get_parsed().transitions
         _events = cls.get_parsed().events.events
         events = cls.get_event_map()
@@ -131,17 +194,26 @@ class Engine(metaclass=EngineMeta):
         check_edges(_transitions, events, _events)
 
         # Check that all states are connected
-        for scope, initial in _scopes.items():
-            if initial:
-                pool = {a for a, b in _states.items() if b.scope == scope}
-                order: List[str] = []
+        for scope, compiled in cls.compile(original=True).scopes.items():
+            pool = compiled.unreachable()
+            if pool:
+                raise BrokenStateModelException(
+                    f"States {pool} not reachable from initial state in scope {scope}"
+                )
 
-                mark_states(_states, _transitions, f'{scope}:{initial}', pool, order, events)
+    @classmethod
+    def can_reach(cls, scope: str, from_state: str, to_state: str) -> bool:
+        '''Can an entity of scope in from_state ever reach to_state?'''
+        return cls.compile().get_scope(scope).can_reach(from_state, to_state)
 
-                if pool:
-                    raise BrokenStateModelException(
-                        f"States {list(pool)} not reachable from initial state in scope {scope}"
-                    )
+    @classmethod
+    def plan(cls,
+             scope: str,
+             from_state: str,
+             to_state: str,
+             guarded: bool = False) -> List[str] | None:
+        '''Returns the shortest sequence of events from one state to another in scope'''
+        return get_planner(cls.compile().get_scope(scope), guarded).plan(from_state, to_state)
 
 
 def trigger(event: str, states: List[str]) -> Callable[[ConditionType], ConditionType]:
@@ -153,3 +225,24 @@ def trigger(event: str, states: List[str]) -> Callable[[ConditionType], Conditio
         return fun
 
     return _wrap
+
+
+def depends(*attributes: str,
+            scopes: List[str] | None = None) -> Callable[[ConditionType], ConditionType]:
+    '''Annotates the condition function with the attributes and related scopes it reads'''
+
+    def _wrap(fun: ConditionType) -> ConditionType:
+        fun.depends = (tuple(attributes), tuple(scopes or ()))  # type: ignore
+        return fun
+
+    return _wrap
+
+
+def isolate(timeout: float, default: Any = False) -> Callable[[ConditionType], ConditionType]:
+    '''Flags the condition function to run in a GuardPool, with a deadline and timeout result'''
+
+    def _wrap(fun: ConditionType) -> ConditionType:
+        fun.isolate = (timeout, default)  # type: ignore
+        return fun
+
+    return _wrap
@@ -1,21 +1,57 @@
 '''WorkState engine'''
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, TypeVar
+from collections import ChainMap
+from dataclasses import dataclass, replace
+from typing import (AbstractSet, Any, Callable, Dict, Iterable, Iterator, List, MutableMapping,
+                    MutableSet, TypeVar)
 
 ConditionFunc = Callable[[Any], bool]
 ConditionType = TypeVar('ConditionType', bound=ConditionFunc)  # pylint: disable=C0103
 
 
+class OrderedSet(MutableSet[str]):
+    '''An insertion-ordered set of names'''
+
+    __slots__ = ('items', )
+
+    def __init__(self, items: Iterable[str] = ()) -> None:
+        self.items: Dict[str, None] = dict.fromkeys(items)
+
+    def __contains__(self, item: object) -> bool:
+        return item in self.items
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, value: str) -> None:
+        self.items[value] = None
+
+    def discard(self, value: str) -> None:
+        self.items.pop(value, None)
+
+    def update(self, values: Iterable[str]) -> None:
+        '''Adds all values not yet in the set, in order'''
+        self.items.update(dict.fromkeys(values))
+
+    def __or__(self, other: AbstractSet[Any]) -> OrderedSet:
+        return OrderedSet([*self.items, *other])
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({list(self.items)!r})'
+
+
 @dataclass
 class State:
     '''A State'''
     scope: str
     state: str
-    source_edges: List[str]
-    dest_edges: List[str]
-    triggers: List[str]
+    source_edges: OrderedSet
+    dest_edges: OrderedSet
+    triggers: OrderedSet
     doc: str | None
 
 
@@ -38,8 +74,8 @@ class Transition:
 class Event:
     '''An Event'''
     event: str
-    transitions: List[str]
-    triggers: List[str]
+    transitions: OrderedSet
+    triggers: OrderedSet
     doc: str | None
 
 
@@ -53,6 +89,16 @@ class Trigger:
     doc: str | None
 
 
+@dataclass
+class Timer:
+    '''A Timer'''
+    name: str
+    event: str
+    state: str
+    seconds: float
+    doc: str | None
+
+
 @dataclass
 class _Parsed:
     '''Internal Parsed representation'''
@@ -61,6 +107,7 @@ class _Parsed:
     transitions: Transitions
     events: Events
     triggers: Triggers
+    timers: Timers
 
 
 class States:
@@ -68,7 +115,7 @@ class States:
 
     def __init__(self, scope: str | None) -> None:
         self.scope = scope
-        self.states: Dict[str, State] = {}
+        self.states: MutableMapping[str, State] = {}
 
     def fullname(self, name: str, scope: str | None = None) -> str:
         '''Returns canonical name'''
@@ -82,7 +129,7 @@ class States:
 
         if fqsn not in self.states:
             (scope, state) = fqsn.split(':')
-            self.states[fqsn] = State(scope, state, [], [], [], doc)
+            self.states[fqsn] = State(scope, state, OrderedSet(), OrderedSet(), OrderedSet(), doc)
 
         return self.states[fqsn]
 
@@ -104,7 +151,7 @@ class Transitions:
     def __init__(self, scope: str | None, states: States) -> None:
         self.scope = scope
         self.states = states
-        self.transitions: Dict[str, Transition] = {}
+        self.transitions: MutableMapping[str, Transition] = {}
 
     def fullname(self, name: str) -> str:
         '''Return canonical name'''
@@ -127,9 +174,9 @@ class Transitions:
             (from_state, to_state) = edge.split('__')
             if from_state != '*':
                 fstate = self.states.ensure_state(f'{scope}:{from_state}')
-                fstate.dest_edges.append(fqsn)
+                fstate.dest_edges.add(fqsn)
             tstate = self.states.ensure_state(f'{scope}:{to_state}')
-            tstate.source_edges.append(fqsn)
+            tstate.source_edges.add(fqsn)
             self.transitions[fqsn] = Transition(scope, from_state, to_state, condition, doc)
 
         return fqsn
@@ -147,18 +194,19 @@ class Events:
 
     def __init__(self, transs: Transitions) -> None:
         self.transs = transs
-        self.events: Dict[str, Event] = {}
-
-    def update_event(self, name: str, transitions: List[str], doc: str | None = None) -> Event:
-        '''Create/Update event with provided transitions'''
-        _transitions = []
-        for tran in transitions:
-            _transitions.append(self.transs.ensure_transition(tran))
+        self.events: MutableMapping[str, Event] = {}
+
+    def update_event(self,
+                     name: str,
+                     transitions: Iterable[str],
+                     doc: str | None = None) -> Event:
+        '''Create/Update event with provided transitions, ignoring those it already has'''
+        _transitions = OrderedSet(self.transs.ensure_transition(tran) for tran in transitions)
         if name in self.events:
             event = self.events[name]
-            event.transitions.extend(_transitions)
+            event.transitions.update(_transitions)
         else:
-            event = self.events[name] = Event(name, _transitions, [], doc)
+            event = self.events[name] = Event(name, _transitions, OrderedSet(), doc)
 
         return event
 
@@ -176,7 +224,7 @@ class Triggers:
     def __init__(self, events: Events, states: States) -> None:
         self.events = events
         self.states = states
-        self.triggers: Dict[str, Trigger] = {}
+        self.triggers: MutableMapping[str, Trigger] = {}
 
     def add_trigger(self,
                     name: str,
@@ -191,12 +239,12 @@ class Triggers:
         self.triggers[name] = _trigger
         self.events.update_event(event, [])
         _event = self.events.events[event]
-        _event.triggers.append(name)
+        _event.triggers.add(name)
 
         for state in states:
             try:
                 _state = self.states.get_state(state, scope)
-                _state.triggers.append(name)
+                _state.triggers.add(name)
             except KeyError:
                 pass
 
@@ -206,3 +254,122 @@ class Triggers:
 
     def __repr__(self) -> str:
         return repr(self.triggers)
+
+
+class Timers:
+    '''Timer container'''
+
+    def __init__(self, events: Events, states: States) -> None:
+        self.events = events
+        self.states = states
+        self.timers: MutableMapping[str, Timer] = {}
+
+    def add_timer(self,
+                  name: str,
+                  event: str,
+                  state: str,
+                  seconds: float,
+                  doc: str | None = None) -> None:
+        '''Add a timed event'''
+        name = self.states.fullname(name)
+        scope = name.split(':')[0]
+        state = self.states.fullname(state, scope)
+        self.timers[name] = Timer(name, event, state, seconds, doc)
+        self.events.update_event(event, [])
+        self.states.ensure_state(state)
+
+    def merge_timer(self, obj: Timer) -> None:
+        '''Merge a Timer into this one'''
+        self.add_timer(obj.name, obj.event, obj.state, obj.seconds, obj.doc)
+
+    def __repr__(self) -> str:
+        return repr(self.timers)
+
+
+class _ScopedChainMap(ChainMap):
+    '''ChainMap over per-scope layers that routes canonical names to their own scope's layer'''
+
+    def __init__(self, local: Dict[str, Any], layers: Dict[str, MutableMapping[str, Any]]) -> None:
+        # A ChainMap iterates its maps last to first, so keep declaration order by reversing them
+        super().__init__(local, *reversed(list(layers.values())))
+        self.layers = layers
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.maps[0]:
+            return self.maps[0][key]
+        layer = self.layers.get(key.split(':', 1)[0], None)
+        if layer is not None and key in layer:
+            return layer[key]
+        return super().__getitem__(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.maps[0]:
+            return True
+        layer = self.layers.get(str(key).split(':', 1)[0], None)
+        return (layer is not None and key in layer) or super().__contains__(key)
+
+
+def _merged(maps: List[MutableMapping[str, Any]]) -> MutableMapping[str, Any]:
+    '''Single layer for the containers of scopes sharing a name, later ones taking precedence'''
+    return maps[0] if len(maps) == 1 else ChainMap({}, *maps[::-1])
+
+
+def share_parsed(scopes: Dict[str, str | None], parsed: List[_Parsed]) -> _Parsed:
+    '''Builds a model spanning several scopes that shares the parsed scope models
+
+    Every container is a layered view over the containers of the scopes, which
+    are never modified. Only cross-scope glue is held in an engine-local layer
+    on top: events defined by more than one scope get a merged copy, and states
+    watched by a trigger of another scope get a copy that lists the trigger.
+    '''
+    states = States(None)
+    transs = Transitions(None, states)
+    events = Events(transs)
+    triggers = Triggers(events, states)
+    timers = Timers(events, states)
+
+    layers: Dict[str, List[_Parsed]] = {}
+    for spar in parsed:
+        layers.setdefault(spar.states.scope or '', []).append(spar)
+    states.states = _ScopedChainMap({}, {
+        scope: _merged([spar.states.states for spar in group]) for scope, group in layers.items()
+    })
+    transs.transitions = _ScopedChainMap({}, {
+        scope: _merged([spar.transitions.transitions for spar in group])
+        for scope, group in layers.items()
+    })
+    triggers.triggers = _ScopedChainMap({}, {
+        scope: _merged([spar.triggers.triggers for spar in group])
+        for scope, group in layers.items()
+    })
+    timers.timers = _ScopedChainMap({}, {
+        scope: _merged([spar.timers.timers for spar in group]) for scope, group in layers.items()
+    })
+    # Event names are not scoped, so those are looked up through every layer
+    events.events = ChainMap({}, *[spar.events.events for spar in parsed[::-1]])
+
+    _events: Dict[str, List[Event]] = {}
+    for spar in parsed:
+        for event in spar.events.events.values():
+            _events.setdefault(event.event, []).append(event)
+    for name, merge in _events.items():
+        if len(merge) > 1:
+            events.events[name] = Event(
+                name,
+                OrderedSet(edge for event in merge for edge in event.transitions),
+                OrderedSet(_trigger for event in merge for _trigger in event.triggers),
+                merge[0].doc,
+            )
+
+    for spar in parsed:
+        for _trigger in spar.triggers.triggers.values():
+            scope = _trigger.name.split(':')[0]
+            for state in _trigger.states:
+                fqsn = states.fullname(state, scope)
+                if fqsn.split(':')[0] != scope and fqsn in states.states:
+                    _state = states.states[fqsn]
+                    states.states[fqsn] = replace(
+                        _state, triggers=_state.triggers | {_trigger.name}
+                    )
+
+    return _Parsed(scopes, states, transs, events, triggers, timers)
@@ -0,0 +1,138 @@
+'''Free-standing entities that share their compiled model'''
+from __future__ import annotations
+
+from types import FunctionType, MethodType
+from typing import Any, Callable, List, Mapping
+
+from workstate.compiled import CompiledScope, CompiledTrigger
+from workstate.dispatch import Flow, Hop
+from workstate.exceptions import BrokenStateModelException
+
+__all__ = ('Entity', )
+
+
+class Entity:
+    '''A single entity outside of any store
+
+    Holds just the entity key, its current state id and a reference to the
+    shared compiled scope, plus the (not copied) data object that conditions
+    read attributes from. State names, allowed events and transitions are all
+    resolved through the compiled tables, so the model itself is never copied.
+    Event names can be called as methods, e.g. ``entity.propose()``.
+
+    Same-scope triggers cascade as with a Dispatcher. Cross-scope triggers and
+    timers need related entities and a clock, so are left to a Dispatcher.
+    '''
+
+    __slots__ = ('compiled', 'key', 'state_id', 'obj')
+    compiled: CompiledScope
+    key: Any
+    state_id: int
+    obj: Any
+
+    #: Maximum number of cascaded trigger hops for a single event
+    max_depth = 64
+
+    def __init__(self,
+                 compiled: CompiledScope,
+                 key: Any = None,
+                 state: int | str | None = None,
+                 obj: Any = None) -> None:
+        if state is None:
+            if compiled.initial is None:
+                raise BrokenStateModelException(f'Scope {compiled.scope} has no initial state')
+            state = compiled.initial
+        self.compiled = compiled
+        self.key = key
+        self.state_id = compiled.state_id(state)
+        self.obj = obj
+
+    @property
+    def scope(self) -> str:
+        '''Scope name'''
+        return self.compiled.scope
+
+    @property
+    def state(self) -> str:
+        '''Current state name'''
+        return self.compiled.states[self.state_id]
+
+    def allowed(self) -> List[str]:
+        '''Lists events that have a candidate transition from the current state'''
+        return list(self.compiled.allowed[self.state_id])
+
+    def event(self, event: str) -> Flow:
+        '''Applies event to this entity, including any cascaded same-scope triggers'''
+        hops: List[Hop] = []
+        self._fire(event, None, hops, 0)
+        return Flow(hops)
+
+    def _fire(self,
+              event: str,
+              _trigger: CompiledTrigger | None,
+              hops: List[Hop],
+              depth: int) -> bool:
+        '''Fires event, returns False if a trigger could not fire'''
+        compiled = self.compiled
+        state_id = self.state_id
+        cands = compiled.candidates(state_id, event)
+
+        if _trigger is not None:
+            if not cands:
+                return False
+            if _trigger.condition is not None and not _trigger.condition(self):
+                return False
+            if depth > self.max_depth:
+                raise BrokenStateModelException(
+                    f'Trigger cascade exceeded {self.max_depth} hops at {_trigger.name}'
+                )
+
+        for cand in cands:
+            if cand.condition is None or cand.condition(self):
+                break
+        else:
+            if _trigger is not None:
+                return False
+            raise compiled.rejection(state_id, event, cands)
+
+        self.state_id = cand.target
+        hops.append((
+            event,
+            _trigger.name if _trigger else None,
+            compiled.fullname(state_id),
+            compiled.fullname(cand.target),
+        ))
+
+        for watcher in compiled.watchers.get(cand.target, ()):
+            if watcher.scope == compiled.scope:
+                self._fire(watcher.event, watcher, hops, depth + 1)
+
+        return True
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for names that aren't set slots or class attributes
+        if name in Entity.__slots__ or name.startswith('__'):
+            raise AttributeError(name)
+        obj = self.obj
+        if obj is not None:
+            if isinstance(obj, Mapping):
+                if name in obj:
+                    return obj[name]
+            elif hasattr(obj, name):
+                return getattr(obj, name)
+        compiled = self.compiled
+        if name in compiled.event_ids:
+            return self._caller(name)
+        if compiled.cls is not None and hasattr(compiled.cls, name):
+            val = getattr(compiled.cls, name)
+            if isinstance(val, FunctionType):
+                return MethodType(val, self)
+            return val
+        raise AttributeError(f'{compiled.scope} entity has no attribute {name}')
+
+    def _caller(self, event: str) -> Callable[[], Flow]:
+        '''Returns a callable applying event to this entity'''
+        return lambda: self.event(event)
+
+    def __repr__(self) -> str:
+        return f'<{self.compiled.scope}:{self.state} key={self.key!r}>'
@@ -3,3 +3,7 @@
 
 class BrokenStateModelException(Exception):
     '''State model is broken'''
+
+
+class EventRejectedException(Exception):
+    '''Event could not be applied to an entity'''
@@ -0,0 +1,354 @@
+'''Declarative condition expressions, evaluated per entity or vectorized over a store'''
+from __future__ import annotations
+
+import abc
+import operator
+from typing import TYPE_CHECKING, Any, Callable, Dict, Tuple
+
+if TYPE_CHECKING:  # pragma: nocoverage
+    from workstate.store import ScopeStore
+
+try:
+    import numpy as np
+except ImportError:  # pragma: nocoverage
+    np = None  # type: ignore
+
+__all__ = ('Expr', 'attr', 'count', 'in_state')
+
+#: A compiled predicate, evaluating an expression for the given rows of a store
+#: (all rows if None)
+Predicate = Callable[['ScopeStore', Any], Any]
+
+#: Comparison operators: symbol, Python operator
+COMPARISONS: Dict[str, Callable[[Any, Any], Any]] = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def _wrap(value: Any) -> Expr:
+    '''Wraps plain values as constant expressions'''
+    return value if isinstance(value, Expr) else _Const(value)
+
+
+class Expr(abc.ABC):
+    '''A condition expression over entity attributes, states and related entities
+
+    Expressions are built from ``attr()``, ``in_state()`` and ``count()``,
+    compared with ``== != < <= > >=`` and combined with ``&``, ``|`` and ``~``.
+    They can be used wherever a condition callable can, as a transition
+    guard or (through ``@trigger``) as a trigger condition. Called with an
+    entity they evaluate as plain Python, while ``vector()`` evaluates them
+    for rows of a ScopeStore at once as compiled NumPy predicates. The
+    attributes and scopes read are declared for condition caching.
+    '''
+
+    def __init__(self) -> None:
+        self.__name__ = type(self).__name__.lower().strip('_')
+        self.__doc__ = None
+        self._predicate: Predicate | None = None
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.__name__ = name
+        if self.__doc__ is None:
+            self.__doc__ = str(self)
+
+    def describe(self, doc: str) -> Expr:
+        '''Sets the documentation of the expression, as a docstring would for a function'''
+        self.__doc__ = doc
+        return self
+
+    def __call__(self, entity: Any) -> bool:
+        return bool(self.evaluate(entity))
+
+    @abc.abstractmethod
+    def evaluate(self, entity: Any) -> Any:
+        '''Evaluates the expression for a single entity'''
+
+    @abc.abstractmethod
+    def compile(self) -> Predicate:
+        '''Compiles the expression into a NumPy predicate'''
+
+    def vector(self, store: ScopeStore, rows: Any = None) -> Any:
+        '''Evaluates the expression for rows of a store (by default all), as a NumPy array
+
+        The result may be a scalar for expressions not reading the entities.
+        '''
+        if np is None:  # pragma: nocoverage
+            raise ImportError('Vectorized expressions require NumPy')
+        if self._predicate is None:
+            self._predicate = self.compile()
+        return self._predicate(store, rows)
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        '''Attributes and related scopes read by the expression'''
+        return ((), ())
+
+    def __getstate__(self) -> Dict[str, Any]:
+        '''Pickles the expression without its compiled predicate'''
+        return {**self.__dict__, '_predicate': None}
+
+    def __eq__(self, other: Any) -> Expr:  # type: ignore
+        return _Compare('==', self, _wrap(other))
+
+    def __ne__(self, other: Any) -> Expr:  # type: ignore
+        return _Compare('!=', self, _wrap(other))
+
+    def __lt__(self, other: Any) -> Expr:
+        return _Compare('<', self, _wrap(other))
+
+    def __le__(self, other: Any) -> Expr:
+        return _Compare('<=', self, _wrap(other))
+
+    def __gt__(self, other: Any) -> Expr:
+        return _Compare('>', self, _wrap(other))
+
+    def __ge__(self, other: Any) -> Expr:
+        return _Compare('>=', self, _wrap(other))
+
+    def __and__(self, other: Any) -> Expr:
+        return _Bool('&', self, _wrap(other))
+
+    def __rand__(self, other: Any) -> Expr:
+        return _Bool('&', _wrap(other), self)
+
+    def __or__(self, other: Any) -> Expr:
+        return _Bool('|', self, _wrap(other))
+
+    def __ror__(self, other: Any) -> Expr:
+        return _Bool('|', _wrap(other), self)
+
+    def __invert__(self) -> Expr:
+        return _Not(self)
+
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f'<Expr {self}>'
+
+
+class _Const(Expr):
+    '''A constant value'''
+
+    def __init__(self, value: Any) -> None:
+        super().__init__()
+        self.value = value
+
+    def evaluate(self, entity: Any) -> Any:
+        return self.value
+
+    def compile(self) -> Predicate:
+        value = self.value
+        return lambda store, rows: value
+
+    def __str__(self) -> str:
+        return repr(self.value)
+
+
+class _Attr(Expr):
+    '''An entity attribute'''
+
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+    def evaluate(self, entity: Any) -> Any:
+        return getattr(entity, self.name)
+
+    def compile(self) -> Predicate:
+        name = self.name
+        return lambda store, rows: _take(store.column(name), rows)
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        return ((self.name, ), ())
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class _InState(Expr):
+    '''Is the entity in one of the states?'''
+
+    def __init__(self, states: Tuple[str, ...]) -> None:
+        super().__init__()
+        self.names = states
+
+    def evaluate(self, entity: Any) -> Any:
+        return entity.state in self.names
+
+    def compile(self) -> Predicate:
+        names = self.names
+
+        def predicate(store: ScopeStore, rows: Any) -> Any:
+            ids = [store.compiled.state_ids[state] for state in names]
+            return np.isin(_take(store.column(), rows), ids)
+
+        return predicate
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        return (('state', ), ())
+
+    def __str__(self) -> str:
+        return f'in_state({", ".join(self.names)})'
+
+
+class _Count(Expr):
+    '''Number of related entities of a scope, optionally only those in given states'''
+
+    def __init__(self, scope: str, states: Tuple[str, ...]) -> None:
+        super().__init__()
+        self.scope = scope
+        self.names = states
+
+    def evaluate(self, entity: Any) -> Any:
+        related = getattr(entity, f'get_{self.scope}')()
+        if not self.names:
+            return len(related)
+        return sum(1 for other in related if other.state in self.names)
+
+    def compile(self) -> Predicate:
+        (scope, names) = (self.scope, self.names)
+
+        def predicate(store: ScopeStore, rows: Any) -> Any:
+            other = store.dispatcher.store(scope)
+            # Related through the other entities' parent column, or our own
+            if store.scope in other.parents:
+                links = np.frombuffer(other.parents[store.scope], dtype='q')
+                mask = links >= 0
+                if names:
+                    ids = [other.compiled.state_ids[state] for state in names]
+                    mask &= np.isin(other.column(), ids)
+                return _take(np.bincount(links[mask], minlength=len(store)), rows)
+            if scope in store.parents:
+                links = _take(np.frombuffer(store.parents[scope], dtype='q'), rows)
+                result = links >= 0
+                if names:
+                    ids = [other.compiled.state_ids[state] for state in names]
+                    result[result] = np.isin(other.column()[links[result]], ids)
+                return result.astype('q')
+            return np.zeros(len(store) if rows is None else len(rows), dtype='q')
+
+        return predicate
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        return ((), (self.scope, ))
+
+    def __str__(self) -> str:
+        if not self.names:
+            return f'count({self.scope})'
+        return f'count({self.scope}: {", ".join(self.names)})'
+
+
+class _Compare(Expr):
+    '''A comparison of two expressions'''
+
+    def __init__(self, symbol: str, left: Expr, right: Expr) -> None:
+        super().__init__()
+        (self.symbol, self.left, self.right) = (symbol, left, right)
+
+    def evaluate(self, entity: Any) -> Any:
+        return COMPARISONS[self.symbol](self.left.evaluate(entity), self.right.evaluate(entity))
+
+    def compile(self) -> Predicate:
+        (func, left, right) = (COMPARISONS[self.symbol], self.left.compile(), self.right.compile())
+        return lambda store, rows: func(left(store, rows), right(store, rows))
+
+    def __bool__(self) -> bool:
+        raise TypeError('Expressions have no truth value, combine them with & | ~')
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        return _merge(self.left, self.right)
+
+    def __str__(self) -> str:
+        return f'{self.left} {self.symbol} {self.right}'
+
+
+class _Bool(Expr):
+    '''A boolean and (``&``) or or (``|``) of two expressions'''
+
+    def __init__(self, symbol: str, left: Expr, right: Expr) -> None:
+        super().__init__()
+        (self.symbol, self.left, self.right) = (symbol, left, right)
+
+    def evaluate(self, entity: Any) -> Any:
+        if self.symbol == '&':
+            return self.left.evaluate(entity) and self.right.evaluate(entity)
+        return self.left.evaluate(entity) or self.right.evaluate(entity)
+
+    def compile(self) -> Predicate:
+        func = np.logical_and if self.symbol == '&' else np.logical_or
+        (left, right) = (self.left.compile(), self.right.compile())
+        return lambda store, rows: func(left(store, rows), right(store, rows))
+
+    def __bool__(self) -> bool:
+        raise TypeError('Expressions have no truth value, combine them with & | ~')
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        return _merge(self.left, self.right)
+
+    def __str__(self) -> str:
+        return f'({self.left} {self.symbol} {self.right})'
+
+
+class _Not(Expr):
+    '''Negation of an expression'''
+
+    def __init__(self, expr: Expr) -> None:
+        super().__init__()
+        self.expr = expr
+
+    def evaluate(self, entity: Any) -> Any:
+        return not self.expr.evaluate(entity)
+
+    def compile(self) -> Predicate:
+        expr = self.expr.compile()
+        return lambda store, rows: np.logical_not(expr(store, rows))
+
+    def __bool__(self) -> bool:
+        raise TypeError('Expressions have no truth value, combine them with & | ~')
+
+    @property
+    def depends(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        return self.expr.depends
+
+    def __str__(self) -> str:
+        return f'~{self.expr}'
+
+
+def _take(column: Any, rows: Any) -> Any:
+    '''Values of a column at rows, all of them if None'''
+    return column if rows is None else column[rows]
+
+
+def _merge(left: Expr, right: Expr) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    '''Union of the dependencies of two expressions'''
+    (lattrs, lscopes) = left.depends
+    (rattrs, rscopes) = right.depends
+    return (
+        tuple(dict.fromkeys(lattrs + rattrs)), tuple(dict.fromkeys(lscopes + rscopes))
+    )
+
+
+def attr(name: str) -> Expr:
+    '''An attribute of the entity'''
+    return _Attr(name)
+
+
+def in_state(*states: str) -> Expr:
+    '''Is the entity in one of the given states?'''
+    return _InState(states)
+
+
+def count(scope: str, *states: str) -> Expr:
+    '''Number of related entities in scope, limited to those in the given states if any'''
+    return _Count(scope, states)
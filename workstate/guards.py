@@ -0,0 +1,110 @@
+'''Isolated evaluation of slow conditions in a bounded thread pool'''
+from __future__ import annotations
+
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, Set, Tuple
+
+from workstate.compiled import CompiledEngine
+from workstate.engine_graph import ConditionFunc
+from workstate.exceptions import EventRejectedException
+
+__all__ = ('GuardPool', 'GuardTimeout', 'REJECT')
+
+
+class _Reject:  # pylint: disable=R0903
+    '''Timeout result that rejects the event instead of passing a result'''
+
+    def __repr__(self) -> str:
+        return 'REJECT'
+
+
+#: Rejects the event when an isolated condition times out
+REJECT = _Reject()
+
+
+class GuardTimeout(EventRejectedException):
+    '''An isolated condition missed its deadline
+
+    Result is its timeout result, unless reject is set: then it rejects the
+    event being dispatched, while triggers and timers just don't fire.
+    '''
+
+    def __init__(self, name: str, timeout: float, default: Any) -> None:
+        super().__init__(f'Condition {name} timed out after {timeout}s')
+        self.reject = default is REJECT
+        self.result = False if self.reject else bool(default)
+
+
+#: Isolation policy of a condition: (fully qualified name, timeout in seconds, timeout result)
+Policy = Tuple[str, float, Any]
+
+
+class GuardPool:
+    '''Runs flagged conditions in a bounded thread pool, each call with a deadline
+
+    Conditions are flagged with ``@isolate(timeout, default)`` or by fully
+    qualified name (``scope:from__to`` for transition guards, ``scope:name``
+    for triggers) through ``conditions``, which takes precedence. A condition
+    that misses its deadline results in its default, or rejects the event
+    with ``REJECT``, and the timeout gets counted under its name. The call
+    itself can't be interrupted, it keeps its pool thread until it returns.
+    '''
+
+    def __init__(self,
+                 compiled: CompiledEngine,
+                 workers: int = 4,
+                 conditions: Dict[str, Tuple[float, Any]] | None = None) -> None:
+        self.workers = workers
+        self.conditions = dict(conditions or {})
+        self.calls: Counter = Counter()
+        self.timeouts: Counter = Counter()
+        self.policies: Dict[ConditionFunc, Policy] = {}
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='workstate-guard')
+        self._pending: Set[Future] = set()
+        self.bind(compiled)
+
+    def bind(self, compiled: CompiledEngine) -> None:
+        '''Finds the flagged conditions of a (re)compiled model'''
+        named: Dict[ConditionFunc, str] = {
+            _trigger.condition: _trigger.name
+            for _trigger in compiled.triggers if _trigger.condition is not None
+        }
+        for cscope in compiled.scopes.values():
+            for cands in cscope.table.values():
+                for cand in cands:
+                    if cand.condition is not None:
+                        named.setdefault(cand.condition, cscope.edges[cand.edge])
+        self.policies = {}
+        for condition, name in named.items():
+            policy = self.conditions.get(name, getattr(condition, 'isolate', None))
+            if policy is not None:
+                self.policies[condition] = (name, *policy)
+
+    def run(self, condition: ConditionFunc, handle: Any) -> bool:
+        '''Evaluates a flagged condition within its deadline
+
+        A timeout raises GuardTimeout carrying the timeout result, so it isn't
+        mistaken for (and cached as) a result of the condition itself, and
+        callers can tell a rejecting timeout apart from any other rejection.
+        '''
+        (name, timeout, default) = self.policies[condition]
+        self.calls[name] += 1
+        future = self._executor.submit(condition, handle)
+        self._pending.add(future)
+        try:
+            return bool(future.result(timeout))
+        except FutureTimeout as exc:
+            future.cancel()
+            self.timeouts[name] += 1
+            raise GuardTimeout(name, timeout, default) from exc
+        finally:
+            self._pending.discard(future)
+
+    def close(self) -> None:
+        '''Shuts the pool down, without waiting for calls still running'''
+        # Calls queued behind busy workers never start
+        for future in list(self._pending):
+            future.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,208 @@
+'''Compact per-entity transition history'''
+from __future__ import annotations
+
+import time
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from workstate.compiled import CompiledEngine, CompiledScope, CompiledTimer, CompiledTrigger
+from workstate.exceptions import BrokenStateModelException
+
+__all__ = ('History', 'Step')
+
+#: Id field value of anything that no longer exists after a reload
+UNKNOWN = 0xFFFF
+
+#: Cause field flag marking a timer (otherwise trigger id + 1, or 0 for a posted event)
+TIMER = 0x8000
+
+
+class Step(NamedTuple):
+    '''A decoded history record'''
+    time: float
+    event: str
+    trigger: str | None
+    from_state: str
+    to_state: str
+
+
+def cause(_trigger: CompiledTrigger | CompiledTimer | None) -> int:
+    '''Encodes what fired an event: nothing (posted), a trigger or a timer'''
+    if _trigger is None:
+        return 0
+    if isinstance(_trigger, CompiledTimer):
+        return TIMER | _trigger.id
+    return _trigger.id + 1
+
+
+class History:
+    '''Per-entity ring buffers of the most recent hops
+
+    Every hop is packed into two unsigned 64 bit words: the event id, cause
+    (trigger or timer), from and to state ids as 16 bit fields, and the time
+    in milliseconds since the history was started. An entity's ring is
+    allocated on its first hop, and grows up to capacity records after which
+    the oldest record gets overwritten. Records older than max_age seconds
+    are no longer returned, ``prune()`` releases rings holding only those.
+    On reload recorded ids are translated by name, anything no longer part
+    of the model decodes as ``?``.
+    '''
+
+    def __init__(self,
+                 compiled: CompiledEngine,
+                 capacity: int = 16,
+                 max_age: float | None = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        if capacity < 1:
+            raise ValueError('History capacity needs to be at least 1')
+        self.capacity = capacity
+        self.max_age = max_age
+        self.clock = clock
+        self.epoch = clock()
+        self.compiled = self._check(compiled)
+        self.rings: Dict[str, Dict[int, array]] = {scope: {} for scope in compiled.scopes}
+        self._causes: Dict[int, str] = {}
+        self._index_causes()
+
+    @staticmethod
+    def _check(compiled: CompiledEngine) -> CompiledEngine:
+        '''Ensures all ids fit into the record fields'''
+        for scope, cscope in compiled.scopes.items():
+            if max(len(cscope.states), len(cscope.events)) >= UNKNOWN:
+                raise BrokenStateModelException(f'Scope {scope} is too large to keep history of')
+        if len(compiled.triggers) >= TIMER - 1:
+            raise BrokenStateModelException('Model has too many triggers to keep history of')
+        timer_ids = [
+            timer.id for cscope in compiled.scopes.values()
+            for timers in cscope.timers.values() for timer in timers
+        ]
+        if timer_ids and max(timer_ids) >= TIMER - 1:
+            raise BrokenStateModelException('Model has too many timers to keep history of')
+        return compiled
+
+    def _index_causes(self) -> None:
+        '''Maps encoded causes to trigger and timer names'''
+        self._causes = {cause(_trigger): _trigger.name for _trigger in self.compiled.triggers}
+        for cscope in self.compiled.scopes.values():
+            for timers in cscope.timers.values():
+                self._causes.update((cause(timer), timer.name) for timer in timers)
+
+    def record(self,
+               scope: str,
+               row: int,
+               event_id: int,
+               _cause: int,
+               from_id: int,
+               to_id: int) -> None:
+        '''Records a hop of an entity'''
+        rings = self.rings[scope]
+        ring = rings.get(row, None)
+        if ring is None:
+            # Word 0 counts all records ever written to the ring
+            ring = rings[row] = array('Q', [0])
+        word = event_id | _cause << 16 | from_id << 32 | to_id << 48
+        stamp = max(0, int((self.clock() - self.epoch) * 1000))
+        written = ring[0]
+        if len(ring) < 1 + 2 * self.capacity:
+            ring.append(word)
+            ring.append(stamp)
+        else:
+            slot = 1 + 2 * (written % self.capacity)
+            ring[slot] = word
+            ring[slot + 1] = stamp
+        ring[0] = written + 1
+
+    def raw(self, scope: str, row: int) -> List[Tuple[int, int, int, int, int]]:
+        '''Retained records of an entity, oldest first, as integer tuples
+
+        Each is (event id, cause, from state id, to state id, milliseconds).
+        '''
+        ring = self.rings[scope].get(row, None)
+        if ring is None:
+            return []
+        size = (len(ring) - 1) // 2
+        start = ring[0] % size if ring[0] > size else 0
+        oldest = -1
+        if self.max_age is not None:
+            oldest = int((self.clock() - self.max_age - self.epoch) * 1000)
+        records = []
+        for idx in range(size):
+            slot = 1 + 2 * ((start + idx) % size)
+            (word, stamp) = (ring[slot], ring[slot + 1])
+            if stamp < oldest:
+                continue
+            records.append((
+                word & 0xFFFF, word >> 16 & 0xFFFF, word >> 32 & 0xFFFF, word >> 48, stamp,
+            ))
+        return records
+
+    def steps(self, scope: str, row: int) -> List[Step]:
+        '''Retained records of an entity, oldest first, decoded to names'''
+        cscope = self.compiled.scopes[scope]
+        return [
+            Step(
+                self.epoch + stamp / 1000,
+                cscope.events[event_id] if event_id != UNKNOWN else '?',
+                self._causes.get(_cause, '?') if _cause else None,
+                self._state(cscope, from_id),
+                self._state(cscope, to_id),
+            )
+            for (event_id, _cause, from_id, to_id, stamp) in self.raw(scope, row)
+        ]
+
+    @staticmethod
+    def _state(cscope: CompiledScope, state_id: int) -> str:
+        '''Canonical name of a recorded state'''
+        return cscope.fullname(state_id) if state_id != UNKNOWN else f'{cscope.scope}:?'
+
+    def prune(self) -> int:
+        '''Releases rings without any records within max_age, returns how many'''
+        if self.max_age is None:
+            return 0
+        oldest = int((self.clock() - self.max_age - self.epoch) * 1000)
+        released = 0
+        for rings in self.rings.values():
+            for row in [row for row, ring in rings.items() if max(ring[2::2]) < oldest]:
+                del rings[row]
+                released += 1
+        return released
+
+    def rebind(self, compiled: CompiledEngine, renames: Dict[str, str] | None = None) -> None:
+        '''Switches over to a recompiled model, translating recorded ids by name'''
+        renames = renames or {}
+        previous = self.compiled
+        self.compiled = self._check(compiled)
+        triggers = {_trigger.name: cause(_trigger) for _trigger in compiled.triggers}
+        for cscope in compiled.scopes.values():
+            for timers in cscope.timers.values():
+                triggers.update((timer.name, cause(timer)) for timer in timers)
+        causes = {
+            old: triggers.get(name, UNKNOWN) for old, name in self._causes.items()
+        }
+        self._index_causes()
+
+        # Trigger ids are model wide, so any change affects all scopes
+        moved = any(old != new for old, new in causes.items())
+        rings = {scope: self.rings.get(scope, {}) for scope in compiled.scopes}
+        for scope, _rings in rings.items():
+            (old, new) = (previous.scopes.get(scope, None), compiled.scopes[scope])
+            if (old is new and not moved) or old is None or not _rings:
+                continue
+            events = [new.event_ids.get(event, UNKNOWN) for event in old.events]
+            states = [
+                new.state_ids.get(renames.get(f'{scope}:{state}', state), UNKNOWN)
+                for state in old.states
+            ]
+            for ring in _rings.values():
+                for slot in range(1, len(ring), 2):
+                    word = ring[slot]
+                    (event_id, _cause, from_id, to_id) = (
+                        word & 0xFFFF, word >> 16 & 0xFFFF, word >> 32 & 0xFFFF, word >> 48
+                    )
+                    ring[slot] = (
+                        (events[event_id] if event_id != UNKNOWN else UNKNOWN)
+                        | (causes.get(_cause, UNKNOWN) if _cause else 0) << 16
+                        | (states[from_id] if from_id != UNKNOWN else UNKNOWN) << 32
+                        | (states[to_id] if to_id != UNKNOWN else UNKNOWN) << 48
+                    )
+        self.rings = rings
@@ -0,0 +1,108 @@
+'''Profiling hooks into model building and dispatch'''
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+__all__ = ('HOOKS', 'Hooks', 'PHASES')
+
+#: Phases callbacks can be registered for
+PHASES = (
+    'scope_parse', 'engine_merge', 'engine_validate', 'compile',
+    'dispatch_start', 'dispatch_end', 'guard', 'trigger', 'commit',
+)
+
+#: A callback, called with the phase and its context
+Hook = Callable[[str, Dict[str, Any]], None]
+
+
+class Hooks:
+    '''Registry of profiling callbacks, by phase
+
+    Callbacks are called with the phase and a context dict of the names and
+    ids involved. Timed phases add ``seconds`` and either the ``result`` or
+    the ``error`` raised, ``dispatch_start`` is called before the dispatch
+    that ``dispatch_end`` reports on.
+
+    Every hook point is an attribute holding the callbacks of its phases,
+    an empty tuple while there are none, so that the hook points cost a
+    single branch when not in use::
+
+        if HOOKS.guard:
+            result = HOOKS.timed('guard', context, condition, handle)
+
+    Scopes and Engines are parsed when their classes are defined, register
+    callbacks for those phases before importing the models.
+    '''
+
+    scope_parse: Tuple[Hook, ...] = ()
+    engine_merge: Tuple[Hook, ...] = ()
+    engine_validate: Tuple[Hook, ...] = ()
+    compile: Tuple[Hook, ...] = ()
+    dispatch: Tuple[Hook, ...] = ()
+    guard: Tuple[Hook, ...] = ()
+    trigger: Tuple[Hook, ...] = ()
+    commit: Tuple[Hook, ...] = ()
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock
+        self.callbacks: Dict[str, Tuple[Hook, ...]] = {phase: () for phase in PHASES}
+
+    def register(self, phase: str, callback: Hook) -> Hook:
+        '''Adds a callback for a phase, returns the callback'''
+        if phase not in self.callbacks:
+            raise ValueError(f'Unknown hook phase {phase}, needs to be one of: {", ".join(PHASES)}')
+        self.callbacks[phase] += (callback, )
+        self._update()
+        return callback
+
+    def unregister(self, phase: str, callback: Hook) -> None:
+        '''Removes a callback from a phase'''
+        self.callbacks[phase] = tuple(_callback for _callback in self.callbacks[phase]
+                                      if _callback is not callback)
+        self._update()
+
+    @contextmanager
+    def registered(self, phase: str, callback: Hook) -> Iterator[Hook]:
+        '''Registers a callback for the duration of a block'''
+        self.register(phase, callback)
+        try:
+            yield callback
+        finally:
+            self.unregister(phase, callback)
+
+    def clear(self) -> None:
+        '''Removes all callbacks'''
+        self.callbacks = {phase: () for phase in PHASES}
+        self._update()
+
+    def _update(self) -> None:
+        '''Refreshes the callbacks of the hook points'''
+        for phase, callbacks in self.callbacks.items():
+            if not phase.startswith('dispatch_'):
+                setattr(self, phase, callbacks)
+        self.dispatch = self.callbacks['dispatch_start'] + self.callbacks['dispatch_end']
+
+    def emit(self, phase: str, context: Dict[str, Any]) -> None:
+        '''Calls the callbacks of a phase'''
+        for callback in self.callbacks[phase]:
+            callback(phase, context)
+
+    def timed(self, point: str, context: Dict[str, Any], func: Callable, *args: Any) -> Any:
+        '''Calls func, reporting the time taken to the callbacks of a hook point'''
+        if point == 'dispatch':
+            self.emit('dispatch_start', context)
+            point = 'dispatch_end'
+        start = self.clock()
+        try:
+            result = func(*args)
+        except BaseException as exc:
+            self.emit(point, {**context, 'seconds': self.clock() - start, 'error': exc})
+            raise
+        self.emit(point, {**context, 'seconds': self.clock() - start, 'result': result})
+        return result
+
+
+#: Callbacks of this process
+HOOKS = Hooks()
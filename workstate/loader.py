@@ -0,0 +1,204 @@
+'''Loads WorkState models from JSON or YAML descriptions'''
+from __future__ import annotations
+
+import json
+from importlib import import_module
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple, Type
+
+from workstate.engine import Engine, Scope
+from workstate.engine_graph import (Event, Events, OrderedSet, State, States, Timer, Timers,
+                                    Transition, Transitions, Trigger, Triggers, _Parsed)
+from workstate.exceptions import BrokenStateModelException
+
+try:
+    import yaml
+except ImportError:  # pragma: nocoverage
+    yaml = None
+
+__all__ = ('load', 'loads', 'build_engine', 'build_scope', 'resolve')
+
+
+def resolve(path: str) -> Callable[[Any], bool]:
+    '''Resolves a dotted path (``package.module.function``) to a callable'''
+    parts = path.split('.')
+    for idx in range(len(parts) - 1, 0, -1):
+        module = '.'.join(parts[:idx])
+        try:
+            obj = import_module(module)
+        except ImportError as exc:
+            # Only a missing module of the path itself means trying a shorter one
+            if exc.name is None or not f'{module}.'.startswith(f'{exc.name}.'):
+                raise
+            continue
+        try:
+            for part in parts[idx:]:
+                obj = getattr(obj, part)
+        except AttributeError:
+            break
+        if callable(obj):
+            return obj  # type: ignore
+        break
+    raise BrokenStateModelException(f'Cannot resolve {path} to a callable')
+
+
+def _items(spec: Mapping[str, Any], key: str) -> Iterable[Tuple[str, Any]]:
+    '''Returns (name, value) pairs of a section, which may be a mapping or a list of names'''
+    section = spec.get(key, None) or {}
+    if isinstance(section, list):
+        return ((name, None) for name in section)
+    if isinstance(section, dict):
+        return section.items()
+    raise BrokenStateModelException(f'{key} needs to be a mapping or a list')
+
+
+def _parse(scope: str, spec: Mapping[str, Any]) -> _Parsed:  # pylint: disable=R0915
+    '''Builds the parsed containers of a scope in bulk'''
+    states = States(scope)
+    transs = Transitions(scope, states)
+    events = Events(transs)
+    triggers = Triggers(events, states)
+    timers = Timers(events, states)
+    (_states, _transs, _events) = (states.states, transs.transitions, events.events)
+
+    def _state(name: str, doc: str | None = None) -> State:
+        fqsn = f'{scope}:{name}'
+        if fqsn not in _states:
+            _states[fqsn] = State(scope, name, OrderedSet(), OrderedSet(), OrderedSet(), doc)
+        return _states[fqsn]
+
+    def _transition(name: str, condition: Callable | None = None, doc: str | None = None) -> str:
+        if ':' in name:
+            (_scope, name) = name.split(':')
+            if _scope != scope:
+                raise BrokenStateModelException(f'Transition {_scope}:{name} not in scope {scope}')
+        try:
+            (from_state, to_state) = name.split('__')
+        except ValueError as exc:
+            raise BrokenStateModelException(f'Invalid transition {name}') from exc
+        from_state = from_state or '*'
+        fqsn = f'{scope}:{from_state}__{to_state}'
+        if fqsn not in _transs:
+            if from_state != '*':
+                _state(from_state).dest_edges.add(fqsn)
+            _state(to_state).source_edges.add(fqsn)
+            _transs[fqsn] = Transition(scope, from_state, to_state, condition, doc)
+        return fqsn
+
+    def _event(name: str) -> Event:
+        if name not in _events:
+            _events[name] = Event(name, OrderedSet(), OrderedSet(), None)
+        return _events[name]
+
+    for name, doc in _items(spec, 'states'):
+        _state(name, doc)
+
+    if spec.get('initial', None):
+        _state(spec['initial'])
+
+    for name, val in _items(spec, 'transitions'):
+        if isinstance(val, dict):
+            condition = resolve(val['condition']) if val.get('condition', None) else None
+            _transition(name, condition, val.get('doc', None))
+        else:
+            _transition(name, doc=val)
+
+    for name, val in _items(spec, 'events'):
+        if isinstance(val, dict):
+            (edges, doc) = (val.get('transitions', None) or [], val.get('doc', None))
+        elif isinstance(val, list):
+            (edges, doc) = (val, None)
+        else:
+            raise BrokenStateModelException(
+                'Events need to be one of: [], {"transitions": [], "doc": ""}'
+            )
+        event = _event(name)
+        event.doc = event.doc or doc
+        # Edges mostly name transitions declared above, which need no parsing again
+        event.transitions.update(
+            f'{scope}:{edge}' if f'{scope}:{edge}' in _transs else _transition(edge)
+            for edge in edges
+        )
+
+    for name, val in _items(spec, 'triggers'):
+        if not isinstance(val, dict) or 'event' not in val:
+            raise BrokenStateModelException(
+                'Triggers need to be: {"event": "", "states": [], "condition": "", "doc": ""}'
+            )
+        fqtn = f'{scope}:{name}'
+        condition = resolve(val['condition']) if val.get('condition', None) else None
+        watched: List[str] = list(val.get('states', None) or [])
+        doc = val.get('doc', None) or getattr(condition, '__doc__', None)
+        triggers.triggers[fqtn] = Trigger(fqtn, val['event'], watched, condition, doc)
+        _event(val['event']).triggers.add(fqtn)
+        for state in watched:
+            fqsn = state if ':' in state else f'{scope}:{state}'
+            if fqsn in _states:
+                _states[fqsn].triggers.add(fqtn)
+
+    for name, val in _items(spec, 'timers'):
+        if isinstance(val, dict):
+            val = [val.get('event', None), val.get('state', None), val.get('seconds', None),
+                   val.get('doc', None)]
+        if not isinstance(val, list) or len(val) not in (3, 4) or None in val[:3]:
+            raise BrokenStateModelException(
+                'Timers need to be one of: [event, state, seconds], [event, state, seconds, ""]'
+            )
+        fqtn = f'{scope}:{name}'
+        state = val[1] if ':' in val[1] else f'{scope}:{val[1]}'
+        timers.timers[fqtn] = Timer(
+            fqtn, val[0], state, float(val[2]), val[3] if len(val) > 3 else None
+        )
+        _event(val[0])
+        _state(state.split(':')[1])
+
+    return _Parsed(scope, states, transs, events, triggers, timers)  # type: ignore
+
+
+def build_scope(scope: str, spec: Mapping[str, Any]) -> Type[Scope]:
+    '''Builds a Scope from its description, bypassing per-item class parsing'''
+    dct: Dict[str, Any] = {
+        'scope': scope,
+        '__parsed': _parse(scope, spec),
+        '__doc__': spec.get('doc', None),
+        '__module__': __name__,
+    }
+    if spec.get('initial', None):
+        dct['initial'] = spec['initial']
+    if spec.get('priorities', None):
+        dct['Priorities'] = type('Priorities', (), dict(_items(spec, 'priorities')))
+    name = spec.get('name', None) or scope.replace('_', ' ').title().replace(' ', '')
+    return type(Scope)(name, (Scope, ), dct)  # type: ignore
+
+
+def build_engine(document: Mapping[str, Any]) -> Type[Engine]:
+    '''Builds an Engine, and its scopes, from a model description
+
+    The description is a mapping with an optional engine ``name`` and a
+    ``scopes`` mapping of scope name to a scope description, which holds an
+    optional ``initial`` state and ``states``, ``transitions``, ``events``,
+    ``triggers``, ``timers`` and ``priorities`` sections. Conditions are given
+    as dotted paths to callables.
+    '''
+    if not isinstance(document.get('scopes', None), dict) or not document['scopes']:
+        raise BrokenStateModelException('Model needs scopes defined as a mapping')
+    scopes = [build_scope(scope, spec or {}) for scope, spec in document['scopes'].items()]
+    dct = {'scopes': scopes, '__doc__': document.get('doc', None), '__module__': __name__}
+    name = document.get('name', None) or 'LoadedEngine'
+    return type(Engine)(name, (Engine, ), dct)  # type: ignore
+
+
+def loads(text: str, fmt: str = 'json') -> Type[Engine]:
+    '''Builds an Engine from a JSON or YAML model description'''
+    if fmt == 'json':
+        return build_engine(json.loads(text))
+    if fmt in ('yaml', 'yml'):
+        if yaml is None:  # pragma: nocoverage
+            raise ImportError('Loading YAML models requires PyYAML')
+        return build_engine(yaml.safe_load(text))
+    raise ValueError(f'Unknown model format {fmt}')
+
+
+def load(filename: str) -> Type[Engine]:
+    '''Builds an Engine from a .json, .yaml or .yml model description file'''
+    with open(filename, encoding='utf-8') as inf:
+        return loads(inf.read(), filename.rsplit('.', 1)[-1].lower())
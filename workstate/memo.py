@@ -0,0 +1,113 @@
+'''Memoization of condition results within a dispatch cycle'''
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, List, Set, Tuple
+
+from workstate.compiled import CompiledEngine
+from workstate.engine_graph import ConditionFunc
+from workstate.guards import GuardPool, GuardTimeout
+from workstate.hooks import HOOKS
+
+if TYPE_CHECKING:  # pragma: nocoverage
+    from workstate.store import ScopeStore
+
+__all__ = ('ConditionCache', )
+
+
+class ConditionCache:
+    '''Caches results of conditions that declare their dependencies
+
+    Conditions annotated with ``@depends(...)`` are evaluated at most once per
+    entity within a dispatch cycle. A result is dropped when one of the
+    declared attributes of the entity is written, when the entity changes
+    state and ``state`` is a declared attribute, or when a linked entity of a
+    declared scope changes state or attributes. Conditions without declared
+    dependencies are always evaluated.
+
+    Conditions flagged for isolation are evaluated through the GuardPool.
+    '''
+
+    def __init__(self, compiled: CompiledEngine, pool: GuardPool | None = None) -> None:
+        self.pool = pool
+        self.results: Dict[Tuple[ConditionFunc, str, int], bool] = {}
+        self.attributes: Dict[str, Set[Tuple[ConditionFunc, str]]] = {}
+        self.scopes: Dict[str, Set[Tuple[ConditionFunc, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+        conditions: List[Tuple[Any, str]] = [
+            (_trigger.condition, _trigger.scope) for _trigger in compiled.triggers
+        ]
+        for scope, cscope in compiled.scopes.items():
+            conditions.extend(
+                (cand.condition, scope) for cands in cscope.table.values() for cand in cands
+            )
+        for condition, owner in conditions:
+            depends = getattr(condition, 'depends', None)
+            if depends is None:
+                continue
+            (attributes, scopes) = depends
+            for attribute in attributes:
+                self.attributes.setdefault(attribute, set()).add((condition, owner))
+            for scope in scopes:
+                self.scopes.setdefault(scope, set()).add((condition, owner))
+
+        self.cacheable = {
+            condition
+            for deps in (self.attributes, self.scopes) for conds in deps.values()
+            for condition, _ in conds
+        }
+
+    def check(self, condition: ConditionFunc, store: ScopeStore, row: int, handle: Any) -> bool:
+        '''Evaluates condition against an entity, re-using a cached result if still valid'''
+        key = None
+        if condition in self.cacheable:
+            key = (condition, store.scope, row)
+            try:
+                result = self.results[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return result
+        try:
+            if HOOKS.guard:
+                result = HOOKS.timed('guard', {
+                    'scope': store.scope, 'key': store.keys[row],
+                    'condition': getattr(condition, '__name__', repr(condition)),
+                }, self.evaluate, condition, handle)
+            elif self.pool is not None and condition in self.pool.policies:
+                result = self.pool.run(condition, handle)
+            else:
+                result = bool(condition(handle))
+        except GuardTimeout as exc:
+            if exc.reject:
+                raise
+            # A timeout result stands in for this call only
+            return exc.result
+        if key is not None:
+            self.results[key] = result
+        return result
+
+    def evaluate(self, condition: ConditionFunc, handle: Any) -> bool:
+        '''Evaluates condition against an entity, through the GuardPool if isolated'''
+        if self.pool is not None and condition in self.pool.policies:
+            return self.pool.run(condition, handle)
+        return bool(condition(handle))
+
+    def changed(self, store: ScopeStore, row: int, attribute: str) -> None:
+        '''Invalidates results depending on an attribute (or ``state``) of an entity'''
+        if not self.results:
+            return
+        for condition, _ in self.attributes.get(attribute, ()):
+            self.results.pop((condition, store.scope, row), None)
+        for condition, owner in self.scopes.get(store.scope, ()):
+            if owner == store.scope:
+                self.results.pop((condition, owner, row), None)
+                continue
+            for related in store.related(row, owner):
+                self.results.pop((condition, owner, related), None)
+
+    def clear(self) -> None:
+        '''Ends a dispatch cycle, forgetting all results'''
+        self.results.clear()
@@ -0,0 +1,406 @@
+'''Multi-process dispatch over entities partitioned by consistent hashing'''
+from __future__ import annotations
+
+import multiprocessing
+import os
+import time
+from bisect import bisect
+from hashlib import blake2b
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Set, Tuple, Type
+
+from workstate.compiled import CompiledTrigger
+from workstate.dispatch import Dispatcher, Flow, Hop
+from workstate.exceptions import BrokenStateModelException, EventRejectedException
+from workstate.queue import Result
+from workstate.store import ScopeStore, _is_sequence
+
+__all__ = ('HashRing', 'PartitionedDispatcher')
+
+#: A message to a partition: (kind, *arguments)
+Op = Tuple[Any, ...]
+
+#: Identifies a batch of messages: (sending partition or -1, sequence number)
+BatchId = Tuple[int, int]
+
+
+def _hash(value: str) -> int:
+    '''Stable 64-bit hash, the same in every process'''
+    return int.from_bytes(blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:  # pylint: disable=R0903
+    '''Consistent hash ring mapping entity keys to partitions
+
+    Every partition owns a number of virtual points on the ring, a key belongs
+    to the partition of the first point at or after its hash. Growing the ring
+    by one partition only moves about 1/n of the keys.
+    '''
+
+    def __init__(self, partitions: int, replicas: int = 64) -> None:
+        self.partitions = partitions
+        ring = sorted(
+            (_hash(f'{partition}-{replica}'), partition)
+            for partition in range(partitions) for replica in range(replicas)
+        )
+        self.points = [point for point, _ in ring]
+        self.owners = [partition for _, partition in ring]
+
+    def __call__(self, key: int) -> int:
+        '''Returns the partition owning key'''
+        idx = bisect(self.points, _hash(str(key)))
+        return self.owners[idx % len(self.owners)]
+
+
+class _PartitionDispatcher(Dispatcher):
+    '''Dispatcher of a single partition
+
+    Entities linked to an entity of another partition get a read-only ghost
+    copy, which the owning partition keeps current by mirroring state and
+    attribute writes, so conditions can read related entities locally.
+    Triggers cascading onto a ghost are routed to the partition owning it,
+    after any mirrored writes, so they are seen in order.
+    '''
+
+    def __init__(self,
+                 model: Type,
+                 partition: int,
+                 ring: HashRing,
+                 clock: Callable[[], float] = time.time) -> None:
+        super().__init__(model, clock)
+        self.partition = partition
+        self.ring = ring
+        self.ghosts: Dict[str, Set[int]] = {}
+        self.subscribers: Dict[Tuple[str, int], Set[int]] = {}
+        self.outbox: Dict[int, List[Op]] = {}
+        self.triggers = {_trigger.name: _trigger for _trigger in self.compiled.triggers}
+        self._ghosting = False
+
+    def added(self, store: ScopeStore, rows: range) -> None:
+        '''Schedules timers of new rows, but never of ghosts'''
+        if not self._ghosting:
+            super().added(store, rows)
+
+    def ghost(self, scope: str, key: int) -> int:
+        '''Returns row of the ghost of a remote entity, adding it if needed'''
+        store = self.stores[scope]
+        try:
+            return store.row(key)
+        except KeyError:
+            pass
+        self._ghosting = True
+        try:
+            row = store.add([key])[0]
+        finally:
+            self._ghosting = False
+        self.ghosts.setdefault(scope, set()).add(row)
+        return row
+
+    def subscribe(self, store: ScopeStore, row: int, partition: int) -> None:
+        '''Mirrors an entity to another partition, starting with a full copy'''
+        self.subscribers.setdefault((store.scope, row), set()).add(partition)
+        attributes = {name: column[row] for name, column in store.attributes.items()}
+        self.outbox.setdefault(partition, []).append(
+            ('mirror', store.scope, store.keys[row], store.states[row], attributes)
+        )
+
+    def changed(self, store: ScopeStore, row: int, attribute: str) -> None:
+        super().changed(store, row, attribute)
+        partitions = self.subscribers.get((store.scope, row), None)
+        if partitions:
+            attributes = {} if attribute == 'state' else {
+                attribute: store.attributes[attribute][row]
+            }
+            for partition in partitions:
+                self.outbox.setdefault(partition, []).append(
+                    ('mirror', store.scope, store.keys[row], store.states[row], attributes)
+                )
+
+    def _cascade(self,
+                 store: ScopeStore,
+                 row: int,
+                 watcher: CompiledTrigger,
+                 hops: List[Hop],
+                 depth: int) -> None:
+        other = self.stores[watcher.scope]
+        ghosts = self.ghosts.get(watcher.scope, ())
+        for other_row in store.related(row, watcher.scope):
+            if other_row in ghosts:
+                key = other.keys[other_row]
+                self.outbox.setdefault(self.ring(key), []).append(
+                    ('trigger', watcher.scope, key, watcher.name, depth)
+                )
+            else:
+                self._fire(other, other_row, watcher.event, watcher, hops, depth)
+
+    def link_keys(self,
+                  scope: str,
+                  keys: Sequence[int],
+                  parent_scope: str,
+                  parent_keys: Sequence[int]) -> None:
+        '''Links entities to parents, either of which may live on another partition'''
+        (store, parent) = (self.store(scope), self.store(parent_scope))
+        for key, parent_key in zip(keys, parent_keys):
+            (owner, parent_owner) = (self.ring(key), self.ring(parent_key))
+            if self.partition not in (owner, parent_owner):
+                continue
+            row = store.row(key) if owner == self.partition else self.ghost(scope, key)
+            parent_row = (
+                parent.row(parent_key) if parent_owner == self.partition
+                else self.ghost(parent_scope, parent_key)
+            )
+            store.link([row], parent, [parent_row])
+            if owner != parent_owner:
+                if owner == self.partition:
+                    self.subscribe(store, row, parent_owner)
+                else:
+                    self.subscribe(parent, parent_row, owner)
+
+    def mirror(self, scope: str, key: int, state_id: int, attributes: Dict[str, Any]) -> None:
+        '''Applies writes to the ghost of a remote entity'''
+        row = self.ghost(scope, key)
+        store = self.stores[scope]
+        if store.states[row] != state_id:
+            store.move(row, state_id)
+            self.memo.changed(store, row, 'state')
+        for name, value in attributes.items():
+            store.set(row, name, value)
+
+    def owned_histogram(self) -> Dict[str, Dict[str, int]]:
+        '''Returns number of owned (non-ghost) entities per state of each scope'''
+        histograms = {}
+        for scope, store in self.stores.items():
+            counts = list(store.counts)
+            for row in self.ghosts.get(scope, ()):
+                counts[store.states[row]] -= 1
+            histograms[scope] = dict(zip(store.compiled.states, counts))
+        return histograms
+
+    def perform(self, op: Op, results: List[Result], answers: List[Any]) -> None:
+        '''Applies a single message'''
+        kind = op[0]
+        if kind == 'event':
+            (_, scope, key, event) = op
+            try:
+                results.append(Result(scope, key, event, self.event(scope, key, event), None))
+            except EventRejectedException as exc:
+                results.append(Result(scope, key, event, None, exc))
+        elif kind == 'trigger':
+            (_, scope, key, name, depth) = op
+            _trigger = self.triggers[name]
+            store = self.stores[scope]
+            hops: List[Hop] = []
+            self._fire(store, store.row(key), _trigger.event, _trigger, hops, depth)
+            if hops:
+                results.append(Result(scope, key, _trigger.event, Flow(hops), None))
+        elif kind == 'mirror':
+            self.mirror(*op[1:])
+        elif kind == 'add':
+            (_, scope, keys, attributes) = op
+            self.add(scope, keys, **attributes)
+        elif kind == 'link':
+            self.link_keys(*op[1:])
+        elif kind == 'tick':
+            answers.extend(self.tick(op[1]))
+        elif kind == 'state':
+            answers.append(self.state(op[1], op[2]))
+        elif kind == 'histogram':
+            answers.append(self.owned_histogram())
+        else:
+            raise BrokenStateModelException(f'Unknown partition message {kind}')
+
+
+def _work(model: Type,  # pylint: disable=R0917
+          partition: int,
+          ring: HashRing,
+          inboxes: List[Any],
+          done: Any,
+          clock: Callable[[], float]) -> None:
+    '''Worker process loop: applies message batches from its inbox'''
+    dispatcher = _PartitionDispatcher(model, partition, ring, clock)
+    inbox = inboxes[partition]
+    sequence = 0
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            break
+        (batch_id, ops) = batch
+        results: List[Result] = []
+        answers: List[Any] = []
+        error = None
+        try:
+            with dispatcher.cycle():
+                for op in ops:
+                    dispatcher.perform(op, results, answers)
+        except Exception as exc:  # pylint: disable=W0703
+            error = exc
+        # Messages to other partitions are sent once the batch is done, in order
+        spawned: List[BatchId] = []
+        for other, messages in dispatcher.outbox.items():
+            sequence += 1
+            spawned.append((partition, sequence))
+            inboxes[other].put((spawned[-1], messages))
+        dispatcher.outbox = {}
+        done.put((batch_id, results, answers, spawned, error))
+
+
+class PartitionedDispatcher:  # pylint: disable=R0902
+    '''Dispatches events over worker processes, each owning a partition of entities
+
+    Entities are assigned to partitions by consistent hashing of their key,
+    every worker holds its own compiled copy of the model. Events for an
+    entity are always applied by the same worker, in the order posted.
+    Cross-scope trigger cascades onto an entity of another partition are sent
+    there as messages, their flows are reported as separate results.
+
+    Attributes of linked entities on other partitions can be read, but only
+    the owning partition writes them.
+    '''
+
+    def __init__(self,
+                 model: Type,
+                 partitions: int | None = None,
+                 replicas: int = 64,
+                 batch: int = 1024,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.model = model
+        self.ring = HashRing(partitions or os.cpu_count() or 1, replicas)
+        self.batch = batch
+        self.clock = clock
+        self._sequence = 0
+        model.compile()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.inboxes = [context.Queue() for _ in range(self.ring.partitions)]
+        self.done = context.Queue()
+        self.workers = [
+            context.Process(
+                target=_work,
+                args=(model, partition, self.ring, self.inboxes, self.done, clock),
+                daemon=True,
+            )
+            for partition in range(self.ring.partitions)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def __enter__(self) -> PartitionedDispatcher:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        '''Stops all workers'''
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def _run(self, ops: Dict[int, List[Op]]) -> Tuple[List[Result], List[Any]]:
+        '''Sends messages to partitions, waiting for them and any cascades to finish
+
+        A batch may be reported done before the batch that spawned it, so
+        pending counts per batch can briefly go negative.
+        '''
+        pending: Dict[BatchId, int] = {}
+        for partition, messages in ops.items():
+            for start in range(0, len(messages), self.batch):
+                self._sequence += 1
+                pending[(-1, self._sequence)] = 1
+                self.inboxes[partition].put(
+                    ((-1, self._sequence), messages[start:start + self.batch])
+                )
+        results: List[Result] = []
+        answers: List[Any] = []
+        errors = []
+        while pending:
+            (batch_id, _results, _answers, spawned, error) = self.done.get()
+            for _batch_id, count in [(batch_id, -1)] + [(_id, 1) for _id in spawned]:
+                pending[_batch_id] = pending.get(_batch_id, 0) + count
+                if not pending[_batch_id]:
+                    del pending[_batch_id]
+            results.extend(_results)
+            answers.extend(_answers)
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return (results, answers)
+
+    def add(self, scope: str, keys: Iterable[int], **attributes: Any) -> None:
+        '''Bulk adds entities to a scope in their initial state'''
+        keys = list(keys)
+        rows: Dict[int, List[int]] = {}
+        for idx, key in enumerate(keys):
+            rows.setdefault(self.ring(key), []).append(idx)
+        ops = {}
+        for partition, idxs in rows.items():
+            _attributes = {
+                name: [value[idx] for idx in idxs] if _is_sequence(value) else value
+                for name, value in attributes.items()
+            }
+            ops[partition] = [('add', scope, [keys[idx] for idx in idxs], _attributes)]
+        self._run(ops)
+
+    def link(self,
+             scope: str,
+             keys: Iterable[int],
+             parent_scope: str,
+             parent_keys: Iterable[int]) -> None:
+        '''Links entities to a parent entity in another scope'''
+        pairs: Dict[int, Tuple[List[int], List[int]]] = {}
+        for key, parent_key in zip(keys, parent_keys):
+            for partition in sorted({self.ring(key), self.ring(parent_key)}):
+                pair = pairs.setdefault(partition, ([], []))
+                pair[0].append(key)
+                pair[1].append(parent_key)
+        self._run({
+            partition: [('link', scope, _keys, parent_scope, _parent_keys)]
+            for partition, (_keys, _parent_keys) in pairs.items()
+        })
+
+    def dispatch(self, events: Iterable[Tuple[str, int, str]]) -> List[Result]:
+        '''Applies (scope, key, event) tuples, returns results of all partitions
+
+        Results of a partition come in the order its events were given, with
+        those of cascades from other partitions interleaved.
+        '''
+        ops: Dict[int, List[Op]] = {}
+        for scope, key, event in events:
+            ops.setdefault(self.ring(key), []).append(('event', scope, key, event))
+        return self._run(ops)[0]
+
+    def event(self, scope: str, key: int, event: str) -> Flow:
+        '''Applies event to entity, returning the flow on the owning partition'''
+        for result in self.dispatch([(scope, key, event)]):
+            if (result.scope, result.key, result.event) == (scope, key, event):
+                if result.error is not None:
+                    raise result.error
+                if result.flow is not None:
+                    return result.flow
+        raise BrokenStateModelException(  # pragma: nocoverage
+            f'No result for {event} on {scope}:{key}'
+        )
+
+    def tick(self, now: float | None = None) -> List[Flow]:
+        '''Fires all timed events that are due on every partition'''
+        now = self.clock() if now is None else now
+        return self._run({
+            partition: [('tick', now)] for partition in range(self.ring.partitions)
+        })[1]
+
+    def state(self, scope: str, key: int) -> str:
+        '''Returns state name of entity'''
+        return self._run({self.ring(key): [('state', scope, key)]})[1][0]  # type: ignore
+
+    def histogram(self) -> Dict[str, Dict[str, int]]:
+        '''Returns number of entities per state of each scope, over all partitions'''
+        total: Dict[str, Dict[str, int]] = {}
+        for histogram in self._run({
+            partition: [('histogram', )] for partition in range(self.ring.partitions)
+        })[1]:
+            for scope, counts in histogram.items():
+                _total = total.setdefault(scope, {})
+                for state, count in counts.items():
+                    _total[state] = _total.get(state, 0) + count
+        return total
@@ -0,0 +1,91 @@
+'''Shortest event-path planning over compiled scopes'''
+from __future__ import annotations
+
+from array import array
+from collections import deque
+from typing import List, Tuple
+
+from workstate.compiled import CompiledScope
+
+__all__ = ('Planner', 'get_planner')
+
+
+class Planner:
+    '''All-pairs shortest event paths within a scope
+
+    Paths are found by a breadth-first search from every state over the
+    compiled transition table, wildcard edges included. Only the next hop
+    (event and resulting state) towards every destination is kept, so memory
+    is two small-integer tables of states x states, and a next hop lookup is
+    constant time.
+
+    By default only moves that are certain are used, that is where the first
+    candidate transition for an event has no condition. With ``guarded`` any
+    candidate transition is assumed to be able to pass its guard. Triggers
+    that may fire along the way are not taken into account.
+    '''
+
+    def __init__(self, compiled: CompiledScope, guarded: bool = False) -> None:
+        self.compiled = compiled
+        self.guarded = guarded
+        size = len(compiled.states)
+
+        moves: List[List[Tuple[int, int]]] = [[] for _ in range(size)]
+        for (state_id, event_id), cands in compiled.table.items():
+            if guarded:
+                moves[state_id].extend((event_id, cand.target) for cand in cands)
+            elif cands[0].condition is None:
+                moves[state_id].append((event_id, cands[0].target))
+
+        typecode = 'h' if max(size, len(compiled.events)) < 0x7fff else 'l'
+        self.next_event: List[array] = []
+        self.next_state: List[array] = []
+        for source in range(size):
+            next_event = array(typecode, [-1]) * size
+            next_state = array(typecode, [-1]) * size
+            next_state[source] = source
+            todo = deque([source])
+            while todo:
+                state_id = todo.popleft()
+                for event_id, target in moves[state_id]:
+                    if next_state[target] < 0:
+                        # The first hop is inherited from the state we came through
+                        if state_id == source:
+                            next_event[target] = event_id
+                            next_state[target] = target
+                        else:
+                            next_event[target] = next_event[state_id]
+                            next_state[target] = next_state[state_id]
+                        todo.append(target)
+            self.next_event.append(next_event)
+            self.next_state.append(next_state)
+
+    def next_hop(self, from_state: int | str, to_state: int | str) -> Tuple[str, str] | None:
+        '''Returns first (event, state) on the shortest path, None if there is no path'''
+        (source, dest) = (self.compiled.state_id(from_state), self.compiled.state_id(to_state))
+        event_id = self.next_event[source][dest]
+        if event_id < 0:
+            return None
+        return (self.compiled.events[event_id], self.compiled.states[self.next_state[source][dest]])
+
+    def plan(self, from_state: int | str, to_state: int | str) -> List[str] | None:
+        '''Returns the shortest sequence of events from one state to another
+
+        Returns None if there is no such path.
+        '''
+        (source, dest) = (self.compiled.state_id(from_state), self.compiled.state_id(to_state))
+        events: List[str] = []
+        while source != dest:
+            event_id = self.next_event[source][dest]
+            if event_id < 0:
+                return None
+            events.append(self.compiled.events[event_id])
+            source = self.next_state[source][dest]
+        return events
+
+
+def get_planner(compiled: CompiledScope, guarded: bool = False) -> Planner:
+    '''Returns the planner of a compiled scope, building it on first use'''
+    if guarded not in compiled.planners:
+        compiled.planners[guarded] = Planner(compiled, guarded)
+    return compiled.planners[guarded]  # type: ignore
@@ -0,0 +1,274 @@
+'''Per-entity event queues with coalescing, and a fair priority scheduler'''
+from __future__ import annotations
+
+import threading
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, FrozenSet, Iterable, List, NamedTuple, Set, Tuple
+
+from workstate.compiled import NORMAL, PRIORITIES, CompiledScope
+from workstate.dispatch import Dispatcher, Flow
+from workstate.exceptions import EventRejectedException
+
+__all__ = ('EventQueue', 'Scheduler', 'Result', 'COALESCE_RULES', 'WEIGHTS')
+
+#: Known coalescing rules
+COALESCE_RULES = ('unreachable', 'supersede')
+
+#: Default number of events per scheduling round of every priority class
+WEIGHTS = {'interactive': 16, 'normal': 4, 'bulk': 1}
+
+
+class Result(NamedTuple):
+    '''Outcome of a queued event, flow and error are both None if coalesced away'''
+    scope: str
+    key: int
+    event: str
+    flow: Flow | None
+    error: Exception | None
+
+
+class EventQueue:  # pylint: disable=R0902
+    '''Per-entity FIFO event queues, drained in batches through a Dispatcher
+
+    Entities are drained in the order they first received an event, with all
+    events queued for an entity handled together. A batch ending part way
+    through an entity's events leaves the rest queued, to be drained first
+    next time. Coalescing rules drop
+    queued events before they cost any guard evaluations or store writes:
+
+    ``unreachable``
+        Drops events that can't fire from any state the entity could still
+        be in by the time the event is reached, taking unconditional moves
+        of earlier queued events and any trigger or timer events of the
+        scope into account.
+    ``supersede``
+        An event that moves the entity from every state unconditionally to
+        the same target (e.g. a ``*__canceled`` wildcard) discards the events
+        queued before it.
+
+    Dropped events are still reported when drained, as results without flow
+    or error.
+    '''
+
+    def __init__(self, dispatcher: Dispatcher, rules: Iterable[str] = ('unreachable', )) -> None:
+        self.dispatcher = dispatcher
+        self.rules = frozenset(rules)
+        unknown = self.rules - set(COALESCE_RULES)
+        if unknown:
+            raise ValueError(f'Unknown coalescing rules {sorted(unknown)}')
+        self.queues: Dict[Tuple[str, int], Deque[str]] = {}
+        self.superseded: Dict[Tuple[str, int], int] = {}
+        self.coalesced = 0
+        self._spontaneous: Dict[str, List[int]] = {}
+        self._superseding: Dict[str, FrozenSet[str]] = {}
+        self._compiled = dispatcher.compiled
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values()) - sum(self.superseded.values())
+
+    def post(self, scope: str, key: int, event: str) -> None:
+        '''Queues an event for an entity'''
+        self._sync()
+        queue = self.queues.get((scope, key), None)
+        if queue is None:
+            self.dispatcher.store(scope)
+            queue = self.queues[(scope, key)] = deque()
+        elif 'supersede' in self.rules and event in self.superseding(scope):
+            # Kept at the front of the queue until drained, to report them
+            self.superseded[(scope, key)] = len(queue)
+        queue.append(event)
+
+    def drain(self, batch: int | None = None) -> List[Result]:
+        '''Dispatches up to batch queued events, entity by entity'''
+        results: List[Result] = []
+        self._sync()
+        with self.dispatcher.cycle():
+            while self.queues and (batch is None or len(results) < batch):
+                (scope, key) = next(iter(self.queues))
+                events = self.queues[(scope, key)]
+                room = len(events) if batch is None else min(len(events), batch - len(results))
+                skip = self.superseded.pop((scope, key), 0)
+                keep = [False] * min(skip, room) + self.coalesce(
+                    scope, key, islice(events, skip, room)
+                )
+                if skip > room:
+                    self.superseded[(scope, key)] = skip - room
+                for kept in keep:
+                    event = events.popleft()
+                    if not kept:
+                        self.coalesced += 1
+                        results.append(Result(scope, key, event, None, None))
+                        continue
+                    try:
+                        flow = self.dispatcher.event(scope, key, event)
+                    except EventRejectedException as exc:
+                        results.append(Result(scope, key, event, None, exc))
+                    else:
+                        results.append(Result(scope, key, event, flow, None))
+                if not events:
+                    del self.queues[(scope, key)]
+        return results
+
+    def _sync(self) -> None:
+        '''Forgets anything derived from the model if the dispatcher got reloaded'''
+        if self._compiled is not self.dispatcher.compiled:
+            self._spontaneous.clear()
+            self._superseding.clear()
+            self._compiled = self.dispatcher.compiled
+
+    def coalesce(self, scope: str, key: int, events: Iterable[str]) -> List[bool]:
+        '''Decides which of the queued events of an entity are still worth dispatching'''
+        if 'unreachable' not in self.rules:
+            return [True for _ in events]
+        store = self.dispatcher.store(scope)
+        compiled = store.compiled
+        state_id = store.states[store.row(key)]
+        possible = self.settle(compiled, {state_id})
+        keep = []
+        for event in events:
+            event_id = compiled.event_ids.get(event, None)
+            # Without candidates from any possible state it can't fire, whatever the guards
+            moves = [
+                compiled.table.get((possible_id, event_id), ()) for possible_id in possible
+            ] if event_id is not None else []
+            keep.append(any(moves))
+            if any(moves):
+                after: Set[int] = set()
+                for possible_id, cands in zip(possible, moves):
+                    if not cands or cands[0].condition is not None:
+                        after.add(possible_id)
+                    after.update(cand.target for cand in cands)
+                possible = self.settle(compiled, after)
+        return keep
+
+    def settle(self, compiled: CompiledScope, possible: Set[int]) -> Set[int]:
+        '''Extends possible states with those reachable through trigger or timer events'''
+        reach = self.spontaneous(compiled)
+        bits = 0
+        for state_id in possible:
+            bits |= reach[state_id]
+        return {state_id for state_id in range(len(compiled.states)) if bits >> state_id & 1}
+
+    def spontaneous(self, compiled: CompiledScope) -> List[int]:
+        '''Reachability bitsets of a scope, over events that can fire without being posted'''
+        if compiled.scope not in self._spontaneous:
+            events = {
+                _trigger.event for _trigger in self.dispatcher.compiled.triggers
+                if _trigger.scope == compiled.scope
+            }
+            events.update(timer.event for timers in compiled.timers.values() for timer in timers)
+            self._spontaneous[compiled.scope] = compiled.closure(
+                {compiled.event_ids[event] for event in events if event in compiled.event_ids}
+            )
+        return self._spontaneous[compiled.scope]
+
+    def superseding(self, scope: str) -> FrozenSet[str]:
+        '''Events that move an entity from every state unconditionally to the same target'''
+        if scope not in self._superseding:
+            compiled = self.dispatcher.store(scope).compiled
+            events = set()
+            for event, event_id in compiled.event_ids.items():
+                moves = {
+                    state_id: compiled.table.get((state_id, event_id), ())[:1]
+                    for state_id in range(len(compiled.states))
+                }
+                targets = {
+                    cands[0].target for cands in moves.values()
+                    if cands and cands[0].condition is None
+                }
+                if len(targets) != 1:
+                    continue
+                target = targets.pop()
+                # Every state other than the target needs an unconditional move
+                if all(
+                    state_id == target or (cands and cands[0].condition is None)
+                    for state_id, cands in moves.items()
+                ):
+                    events.add(event)
+            self._superseding[scope] = frozenset(events)
+        return self._superseding[scope]
+
+
+class Scheduler:
+    '''Priority class queues with fair per-entity queues, drained through a Dispatcher
+
+    Every posted event goes into the queue of its entity within the priority
+    class declared for it in the scope's ``Priorities`` (``normal`` if none).
+    Classes are served weighted round robin, highest first: in every round a
+    class dispatches up to its weight in events, so interactive events go
+    ahead of a backlog while bulk events keep a guaranteed share. Within a
+    class, entities take turns one event at a time, so a single busy entity
+    can't hold up the others. Events of an entity keep their order within a
+    class, but may be overtaken by its events of a higher class.
+
+    Events can be posted from any thread, also while another one drains.
+    '''
+
+    def __init__(self, dispatcher: Dispatcher, weights: Dict[str, int] | None = None) -> None:
+        self.dispatcher = dispatcher
+        weights = {**WEIGHTS, **(weights or {})}
+        unknown = set(weights) - set(PRIORITIES)
+        if unknown:
+            raise ValueError(f'Unknown priority classes {sorted(unknown)}')
+        if min(weights.values()) < 1:
+            raise ValueError('Priority class weights need to be at least 1')
+        self.weights = [weights[priority] for priority in PRIORITIES]
+        self.lanes: List[Dict[Tuple[str, int], Deque[str]]] = [{} for _ in PRIORITIES]
+        self.sizes = [0 for _ in PRIORITIES]
+        self._credits = list(self.weights)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(self.sizes)
+
+    def pending(self) -> Dict[str, int]:
+        '''Number of queued events per priority class'''
+        return dict(zip(PRIORITIES, self.sizes))
+
+    def post(self, scope: str, key: int, event: str) -> None:
+        '''Queues an event for an entity, in the priority class of the event'''
+        level = self.dispatcher.store(scope).compiled.priorities.get(event, NORMAL)
+        with self._lock:
+            lane = self.lanes[level]
+            queue = lane.get((scope, key), None)
+            if queue is None:
+                queue = lane[(scope, key)] = deque()
+            queue.append(event)
+            self.sizes[level] += 1
+
+    def take(self) -> Tuple[str, int, str] | None:
+        '''Takes the next event to dispatch off its queue, None if there are none'''
+        with self._lock:
+            for _ in range(2):
+                for level, lane in enumerate(self.lanes):
+                    if lane and self._credits[level]:
+                        self._credits[level] -= 1
+                        self.sizes[level] -= 1
+                        entity = next(iter(lane))
+                        queue = lane.pop(entity)
+                        event = queue.popleft()
+                        if queue:
+                            # Back of the line for the entity's next event
+                            lane[entity] = queue
+                        return (entity[0], entity[1], event)
+                # Every class with events queued used up its share, start a new round
+                self._credits = list(self.weights)
+        return None
+
+    def drain(self, batch: int | None = None) -> List[Result]:
+        '''Dispatches up to batch queued events in scheduling order'''
+        results: List[Result] = []
+        with self.dispatcher.cycle():
+            while batch is None or len(results) < batch:
+                item = self.take()
+                if item is None:
+                    break
+                (scope, key, event) = item
+                try:
+                    flow = self.dispatcher.event(scope, key, event)
+                except EventRejectedException as exc:
+                    results.append(Result(scope, key, event, None, exc))
+                else:
+                    results.append(Result(scope, key, event, flow, None))
+        return results
@@ -1,78 +1,123 @@
 '''WorkState engine'''
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import Any, Dict, List, Mapping
 
+from workstate.compiled import PRIORITIES, CompiledEngine, compile_parsed
 from workstate.docgen import BGCOLORS, FGCOLORS, Digraph
-from workstate.engine_graph import Events, State, States, Transitions, Triggers, _Parsed
+from workstate.engine_graph import Events, State, States, Timers, Transitions, Triggers, _Parsed
+from workstate.entity import Entity
 from workstate.exceptions import BrokenStateModelException
+from workstate.hooks import HOOKS
+from workstate.planner import get_planner
+from workstate.subgraph import neighborhood
 from workstate.utils import check_edges, mark_states
 
 
+def _parse_scope(name: str, dct: dict) -> None:  # pylint: disable=R0915
+    '''Parses the nested States, Transitions, Events, Triggers and Timers of a Scope class'''
+    # create a class_id if it's not specified
+    if 'scope' not in dct:
+        dct['scope'] = name.lower()
+    scope = dct['scope']
+
+    states = States(scope)
+    transs = Transitions(scope, states)
+    events = Events(transs)
+    triggers = Triggers(events, states)
+    timers = Timers(events, states)
+
+    dct['__parsed'] = _Parsed(dct['scope'], states, transs, events, triggers, timers)
+
+    if 'States' in dct:
+        dct_states = dct['States']
+        statekeys = [key for key in dir(dct_states) if not key.startswith('__')]
+        for key in statekeys:
+            states.ensure_state(key, doc=getattr(dct_states, key))
+
+    if 'initial' in dct:
+        states.ensure_state(f"{scope}:{dct['initial']}")
+
+    if 'Transitions' in dct:
+        dct_transs = dct['Transitions']
+        transkeys = [key for key in dir(dct_transs) if not key.startswith('__')]
+        for key in transkeys:
+            item = getattr(dct_transs, key)
+            # mkey = key.
+            if callable(item):
+                transs.ensure_transition(key, condition=item, doc=item.__doc__)
+            else:
+                transs.ensure_transition(key, doc=item)
+
+    if 'Events' in dct:
+        dct_events = dct['Events']
+        eventkeys = [key for key in dir(dct_events) if not key.startswith('__')]
+        for key in eventkeys:
+            val = getattr(dct_events, key)
+            if isinstance(val, list):
+                events.update_event(key, val)
+            elif isinstance(val, tuple):
+                try:
+                    if len(val) != 2:
+                        raise IndexError
+                    edges = [a for a in val if isinstance(a, list)][0]
+                    doc = [a for a in val if isinstance(a, str)][0]
+                except IndexError as exc:
+                    raise BrokenStateModelException(
+                        'Events need to be one of: [], ("",[]), ([],"")'
+                    ) from exc
+                events.update_event(key, edges, doc)
+
+    if 'Triggers' in dct:
+        dct_trigrs = dct['Triggers']
+        tri_funs = [key for key in dir(dct_trigrs) if not key.startswith('__')]
+        for _tf in tri_funs:
+            tri_fun = getattr(dct_trigrs, _tf)
+            triggers.add_trigger(
+                tri_fun.__name__, tri_fun.event, tri_fun.states, tri_fun, tri_fun.__doc__
+            )
+
+    if 'Timers' in dct:
+        dct_timers = dct['Timers']
+        timerkeys = [key for key in dir(dct_timers) if not key.startswith('__')]
+        for key in timerkeys:
+            val = getattr(dct_timers, key)
+            if not isinstance(val, tuple) or len(val) not in (3, 4):
+                raise BrokenStateModelException(
+                    'Timers need to be one of: (event, state, seconds), '
+                    '(event, state, seconds, "")'
+                )
+            timers.add_timer(key, *val)
+
+
 class ScopeMeta(type):
     '''Meta-Class for Scope'''
 
     def __new__(mcs, name: str, parents: tuple, dct: dict) -> type:
+        # A pre-built parsed model (e.g. from workstate.loader) skips class parsing
+        if '__the_base_class__' not in dct and '__parsed' not in dct:
+            if HOOKS.scope_parse:
+                HOOKS.timed(
+                    'scope_parse', {'scope': dct.get('scope', name.lower()), 'class': name},
+                    _parse_scope, name, dct,
+                )
+            else:
+                _parse_scope(name, dct)
+
         if '__the_base_class__' not in dct:
-            # create a class_id if it's not specified
-            if 'scope' not in dct:
-                dct['scope'] = name.lower()
-            scope = dct['scope']
-
-            states = States(scope)
-            transs = Transitions(scope, states)
-            events = Events(transs)
-            triggers = Triggers(events, states)
-
-            dct['__parsed'] = _Parsed(dct['scope'], states, transs, events, triggers)
-
-            if 'States' in dct:
-                dct_states = dct['States']
-                statekeys = [key for key in dir(dct_states) if not key.startswith('__')]
-                for key in statekeys:
-                    states.ensure_state(key, doc=getattr(dct_states, key))
-
-            if 'initial' in dct:
-                states.ensure_state(f"{scope}:{dct['initial']}")
-
-            if 'Transitions' in dct:
-                dct_transs = dct['Transitions']
-                transkeys = [key for key in dir(dct_transs) if not key.startswith('__')]
-                for key in transkeys:
-                    item = getattr(dct_transs, key)
-                    # mkey = key.
-                    if callable(item):
-                        transs.ensure_transition(key, condition=item, doc=item.__doc__)
-                    else:
-                        transs.ensure_transition(key, doc=item)
-
-            if 'Events' in dct:
-                dct_events = dct['Events']
-                eventkeys = [key for key in dir(dct_events) if not key.startswith('__')]
-                for key in eventkeys:
-                    val = getattr(dct_events, key)
-                    if isinstance(val, list):
-                        events.update_event(key, val)
-                    elif isinstance(val, tuple):
-                        try:
-                            if len(val) != 2:
-                                raise IndexError
-                            edges = [a for a in val if isinstance(a, list)][0]
-                            doc = [a for a in val if isinstance(a, str)][0]
-                        except IndexError as exc:
-                            raise BrokenStateModelException(
-                                'Events need to be one of: [], ("",[]), ([],"")'
-                            ) from exc
-                        events.update_event(key, edges, doc)
-
-            if 'Triggers' in dct:
-                dct_trigrs = dct['Triggers']
-                tri_funs = [key for key in dir(dct_trigrs) if not key.startswith('__')]
-                for _tf in tri_funs:
-                    tri_fun = getattr(dct_trigrs, _tf)
-                    triggers.add_trigger(
-                        tri_fun.__name__, tri_fun.event, tri_fun.states, tri_fun, tri_fun.__doc__
-                    )
+            dct['__priorities'] = {}
+            if 'Priorities' in dct:
+                dct_prios = dct['Priorities']
+                events = dct['__parsed'].events
+                for key in [key for key in dir(dct_prios) if not key.startswith('__')]:
+                    val = getattr(dct_prios, key)
+                    if val not in PRIORITIES:
+                        raise BrokenStateModelException(
+                            f'Priority of {key} needs to be one of: {", ".join(PRIORITIES)}'
+                        )
+                    if key not in events.events:
+                        raise BrokenStateModelException(f'Priority given for unknown event {key}')
+                    dct['__priorities'][key] = val
 
         # we need to call type.__new__ to complete the initialization
         return type.__new__(mcs, name, parents, dct)
@@ -113,35 +158,56 @@ class Scope(metaclass=ScopeMeta):
 
         return events
 
+    @classmethod
+    def compile(cls) -> CompiledEngine:
+        '''Returns the compiled dispatch tables, compiling them on first use'''
+        if '__compiled' not in cls.__dict__:
+            args = (cls.get_parsed(), {cls.get_scope(): cls.get_initial()}, {cls.get_scope(): cls})
+            if HOOKS.compile:
+                compiled = HOOKS.timed('compile', {
+                    'model': cls.__name__, 'scopes': [cls.get_scope()], 'minimize': False,
+                }, compile_parsed, *args)
+            else:
+                compiled = compile_parsed(*args)
+            setattr(cls, '__compiled', compiled)
+        return cls.__dict__['__compiled']  # type: ignore
+
+    @classmethod
+    def instantiate(cls, obj: Any = None, key: Any = None, state: str | None = None) -> Entity:
+        '''Returns an entity of this scope, in the initial state unless given'''
+        return Entity(cls.compile().get_scope(cls.get_scope()), key, state, obj)
+
     @classmethod
     def validate(cls) -> None:
         '''Validates the Scope'''
         scope = cls.get_scope()
-        _states = cls.get_parsed().states.states
         _transitions = cls.get_parsed().transitions
         _events = cls.get_parsed().events.events
         events = cls.get_event_map()
 
         check_edges(_transitions, events, _events)
 
-        # Check that all states are connected
-        initial = cls.get_initial()
-        if initial:
-            # Only check the local scope
-            pool = {_state for _state in _states.keys() if _state.startswith(f'{scope}:')}
-            order: List[str] = []
+        # Check that all states are connected, only in the local scope
+        compiled = cls.compile().scopes.get(scope, None)
+        pool = compiled.unreachable() if compiled else []
+        if pool:
+            raise BrokenStateModelException(f"States {pool} not reachable from initial state")
 
-            mark_states(_states, _transitions, f'{scope}:{initial}', pool, order, events)
+    @classmethod
+    def can_reach(cls, from_state: str, to_state: str) -> bool:
+        '''Can an entity in from_state ever reach to_state?'''
+        return cls.compile().get_scope(cls.get_scope()).can_reach(from_state, to_state)
 
-            if pool:
-                raise BrokenStateModelException(
-                    f"States {list(pool)} not reachable from initial state"
-                )
+    @classmethod
+    def plan(cls, from_state: str, to_state: str, guarded: bool = False) -> List[str] | None:
+        '''Returns the shortest sequence of events from one state to another'''
+        compiled = cls.compile().get_scope(cls.get_scope())
+        return get_planner(compiled, guarded).plan(from_state, to_state)
 
     @classmethod
     def order_states(cls) -> List[str]:
         '''Orders states from initial to end-states if initial is set'''
-        states: Dict[str, State] = cls.get_parsed().states.states
+        states: Mapping[str, State] = cls.get_parsed().states.states
         initial = cls.get_initial()
 
         if initial is None:
@@ -284,6 +350,14 @@ class Scope(metaclass=ScopeMeta):
 
         return dot
 
+    @classmethod
+    def graph_neighborhood(cls,
+                           state: str | None = None,
+                           event: str | None = None,
+                           hops: int = 1) -> Digraph:
+        '''Generates dot graph of the states within hops of a state or event'''
+        return neighborhood(cls.compile(), cls.get_scope(), state, event, hops)
+
     @classmethod
     def graph(cls,
               dot: Digraph | None = None,
@@ -0,0 +1,661 @@
+'''Compiled models in shared memory, laid out as flat arrays plus a string table'''
+from __future__ import annotations
+
+import json
+import mmap
+import pickle
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple, Type, TypeVar
+
+from workstate.compiled import (GUARDED, MULTIPLE, UNCONDITIONAL, Candidate, CompiledEngine,
+                                CompiledScope, CompiledTimer, CompiledTrigger)
+from workstate.engine_graph import ConditionFunc
+from workstate.exceptions import BrokenStateModelException
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: nocoverage
+    shared_memory = None  # type: ignore
+
+__all__ = ('SharedModel', 'pack')
+
+#: Leads every packed model, followed by the header length as 8 bytes
+MAGIC = b'WSMODEL1'
+
+#: Array reference in the header: (byte offset past the header, number of items)
+Ref = Tuple[int, int]
+
+T = TypeVar('T')
+
+
+class _Packer:
+    '''Collects the arrays and strings of a packed model'''
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.strings: Dict[bytes, int] = {}
+        self.conditions: Dict[int, int] = {}
+        self.funcs: List[Any] = []
+        self.names: List[str] = []
+
+    def array(self, typecode: str, values: Any) -> Ref:
+        '''Appends an array, 8 byte aligned'''
+        data = array(typecode, values).tobytes()
+        offset = self.size
+        self.chunks.append(data + bytes(-len(data) % 8))
+        self.size += len(self.chunks[-1])
+        return (offset, len(data) // array(typecode).itemsize)
+
+    def string(self, text: str | bytes) -> int:
+        '''String table id of a string (or raw bytes)'''
+        data = text.encode() if isinstance(text, str) else text
+        return self.strings.setdefault(data, len(self.strings))
+
+    def lookup(self, names: Mapping[str, int]) -> Dict[str, Ref]:
+        '''Name to id mapping, sorted by name for binary search'''
+        ordered = sorted(names.items(), key=lambda item: item[0].encode())
+        return {
+            'names': self.array('q', [self.string(name) for name, _ in ordered]),
+            'ids': self.array('q', [value for _, value in ordered]),
+        }
+
+    def condition(self, condition: Any, name: str) -> int:
+        '''Condition table index of a condition, named by its first use, -1 for None'''
+        if condition is None:
+            return -1
+        if id(condition) not in self.conditions:
+            self.conditions[id(condition)] = len(self.funcs)
+            self.funcs.append(condition)
+            self.names.append(name)
+        return self.conditions[id(condition)]
+
+
+def _blob(obj: Any) -> bytes:
+    '''Pickles a condition or class by reference (or an expression by value), if possible'''
+    try:
+        return pickle.dumps(obj)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return b''
+
+
+def _pack_scope(packer: _Packer, cscope: CompiledScope) -> Dict[str, Any]:
+    '''Lays out the tables of a scope'''
+    (size, events) = (len(cscope.states), len(cscope.events))
+    slots = [0]
+    (targets, conds, edges) = ([], [], [])
+    for state_id in range(size):
+        for event_id in range(events):
+            for cand in cscope.table.get((state_id, event_id), ()):
+                targets.append(cand.target)
+                edges.append(cand.edge)
+                conds.append(packer.condition(cand.condition, cscope.edges[cand.edge]))
+            slots.append(len(targets))
+
+    timers = [timer for state_id in range(size) for timer in cscope.timers.get(state_id, ())]
+    width = (size + 7) // 8
+    return {
+        'scope': cscope.scope,
+        'cls': packer.string(_blob(cscope.cls) if cscope.cls is not None else b''),
+        'initial': cscope.initial,
+        'states': packer.array('q', [packer.string(state) for state in cscope.states]),
+        'state_ids': packer.lookup(cscope.state_ids),
+        'events': packer.array('q', [packer.string(event) for event in cscope.events]),
+        'event_ids': packer.lookup(cscope.event_ids),
+        'edges': packer.array('q', [packer.string(edge) for edge in cscope.edges]),
+        'edge_ids': packer.lookup(cscope.edge_ids),
+        'entries': sum(1 for idx in range(len(slots) - 1) if slots[idx + 1] > slots[idx]),
+        'slots': packer.array('q', slots),
+        'targets': packer.array('q', targets),
+        'conditions': packer.array('q', conds),
+        'cand_edges': packer.array('q', edges),
+        'watch_slots': packer.array('q', _slots(
+            len(cscope.watchers.get(state_id, ())) for state_id in range(size)
+        )),
+        'watchers': packer.array('q', [
+            watcher.id for state_id in range(size) for watcher in cscope.watchers.get(state_id, ())
+        ]),
+        'timer_slots': packer.array('q', _slots(
+            len(cscope.timers.get(state_id, ())) for state_id in range(size)
+        )),
+        'timer_ids': packer.array('q', [timer.id for timer in timers]),
+        'timer_names': packer.array('q', [packer.string(timer.name) for timer in timers]),
+        'timer_events': packer.array('q', [packer.string(timer.event) for timer in timers]),
+        'timer_seconds': packer.array('d', [timer.seconds for timer in timers]),
+        'timer_conditions': packer.array('q', [
+            packer.condition(timer.condition, timer.name) for timer in timers
+        ]),
+        'allowed_slots': packer.array('q', _slots(len(events) for events in cscope.allowed)),
+        'allowed': packer.array('q', [
+            cscope.event_ids[event] for events in cscope.allowed for event in events
+        ]),
+        'reach': packer.array('B', b''.join(
+            bits.to_bytes(width, 'little') for bits in cscope.reach
+        )),
+        'fires': packer.array('B', b''.join(
+            bits.to_bytes(width, 'little') for bits in cscope.fires
+        )),
+        'direct': packer.array('q', [target for targets in cscope.direct for target in targets]),
+        'direct_edges': packer.array('q', [
+            edge for _edges in cscope.direct_edges for edge in _edges
+        ]),
+        'priorities': cscope.priorities,
+        'aliases': cscope.aliases,
+    }
+
+
+def _slots(counts: Any) -> List[int]:
+    '''Start offsets of consecutive groups of given sizes, plus the end'''
+    slots = [0]
+    for count in counts:
+        slots.append(slots[-1] + count)
+    return slots
+
+
+def pack(compiled: CompiledEngine) -> bytes:
+    '''Lays out a compiled model as flat arrays plus a string table
+
+    Conditions and scope classes are pickled by reference (expressions by
+    value) into the string table. Those that can't be pickled, such as
+    lambdas, need to be given by name when attaching.
+    '''
+    packer = _Packer()
+    triggers = {
+        field: packer.array('q', [
+            packer.string(getattr(_trigger, field[:-1])) for _trigger in compiled.triggers
+        ])
+        for field in ('names', 'scopes', 'events')
+    }
+    triggers['conditions'] = packer.array('q', [
+        packer.condition(_trigger.condition, _trigger.name) for _trigger in compiled.triggers
+    ])
+    scopes = [_pack_scope(packer, cscope) for cscope in compiled.scopes.values()]
+    header = {
+        'triggers': triggers,
+        'scopes': scopes,
+        'condition_names': packer.array('q', [packer.string(name) for name in packer.names]),
+        'condition_blobs': packer.array('q', [
+            packer.string(_blob(func)) for func in packer.funcs
+        ]),
+    }
+    strings = list(packer.strings)
+    header['string_offsets'] = packer.array('q', _slots(len(data) for data in strings))
+    header['string_blob'] = packer.array('B', b''.join(strings))
+
+    text = json.dumps(header).encode()
+    text += b' ' * (-len(text) % 8)
+    return MAGIC + len(text).to_bytes(8, 'little') + text + b''.join(packer.chunks)
+
+
+class _Strings(Sequence[str]):
+    '''Strings from the string table, by position, decoded on first use'''
+
+    __slots__ = ('table', 'ids', 'cache')
+
+    def __init__(self, table: _StringTable, ids: memoryview) -> None:
+        self.table = table
+        self.ids = ids
+        self.cache: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, idx: Any) -> Any:
+        if isinstance(idx, slice):
+            return [self[_idx] for _idx in range(len(self))[idx]]
+        try:
+            return self.cache[idx]
+        except KeyError:
+            text = self.cache[idx] = self.table.text(self.ids[idx])
+            return text
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class _StringTable:
+    '''Offsets into a blob of UTF-8 strings'''
+
+    __slots__ = ('offsets', 'blob')
+
+    def __init__(self, offsets: memoryview, blob: memoryview) -> None:
+        self.offsets = offsets
+        self.blob = blob
+
+    def raw(self, sid: int) -> bytes:
+        '''Bytes of a string'''
+        return bytes(self.blob[self.offsets[sid]:self.offsets[sid + 1]])
+
+    def text(self, sid: int) -> str:
+        '''A string'''
+        return str(self.blob[self.offsets[sid]:self.offsets[sid + 1]], 'utf-8')
+
+
+class _Lookup(Mapping[str, int]):
+    '''Name to id mapping, by binary search over the names in byte order
+
+    Names found are remembered, so the memory taken per process grows with
+    the names in use rather than with the model.
+    '''
+
+    __slots__ = ('table', 'names', 'ids', 'cache')
+
+    def __init__(self, table: _StringTable, names: memoryview, ids: memoryview) -> None:
+        self.table = table
+        self.names = names
+        self.ids = ids
+        self.cache: Dict[str, int] = {}
+
+    def _find(self, name: Any) -> int:
+        '''Position of name, -1 if not there'''
+        if not isinstance(name, str):
+            return -1
+        key = name.encode()
+        (low, high) = (0, len(self.names))
+        while low < high:
+            mid = (low + high) // 2
+            if self.table.raw(self.names[mid]) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self.names) and self.table.raw(self.names[low]) == key:
+            return low
+        return -1
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            return self.cache[key]
+        except (KeyError, TypeError):
+            pos = self._find(key)
+            if pos < 0:
+                return default
+            value = self.cache[key] = self.ids[pos]
+            return value
+
+    def __getitem__(self, key: str) -> int:
+        value = self.get(key, -1)
+        if value < 0:
+            raise KeyError(key)
+        return value  # type: ignore
+
+    def __contains__(self, key: object) -> bool:
+        return bool(self.get(key, -1) >= 0)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.table.text(sid) for sid in self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class _Table(Mapping[Tuple[int, int], Tuple[Candidate, ...]]):  # pylint: disable=R0902
+    '''Candidates of (state, event) entries, from flat arrays indexed by slot offsets
+
+    Candidates are decoded on first use of their entry and remembered.
+    '''
+
+    __slots__ = ('events', 'entries', 'slots', 'targets', 'conditions', 'edges', 'funcs', 'cache')
+
+    def __init__(self, layout: Dict[str, Any], view: Any, funcs: List[Any]) -> None:
+        self.events = len(view(layout['events']))
+        self.entries = layout['entries']
+        self.slots = view(layout['slots'])
+        self.targets = view(layout['targets'])
+        self.conditions = view(layout['conditions'])
+        self.edges = view(layout['cand_edges'])
+        self.funcs = funcs
+        self.cache: Dict[int, Tuple[Candidate, ...]] = {}
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        (state_id, event_id) = key
+        if not 0 <= event_id < self.events:
+            return default
+        slot = state_id * self.events + event_id
+        try:
+            return self.cache[slot]
+        except KeyError:
+            pass
+        (start, end) = (self.slots[slot], self.slots[slot + 1])
+        if start == end:
+            return default
+        cands = self.cache[slot] = tuple(
+            Candidate(
+                self.targets[idx],
+                self.funcs[self.conditions[idx]] if self.conditions[idx] >= 0 else None,
+                self.edges[idx],
+            )
+            for idx in range(start, end)
+        )
+        return cands
+
+    def __getitem__(self, key: Tuple[int, int]) -> Tuple[Candidate, ...]:
+        cands = self.get(key, None)
+        if cands is None:
+            raise KeyError(key)
+        return cands  # type: ignore
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        slots = self.slots
+        for slot in range(len(slots) - 1):
+            if slots[slot + 1] > slots[slot]:
+                yield divmod(slot, self.events)
+
+    def __len__(self) -> int:
+        return self.entries  # type: ignore
+
+
+class _Kinds(Mapping[Tuple[int, int], int]):
+    '''Kinds of (state, event) entries, derived from the candidate arrays'''
+
+    __slots__ = ('table', )
+
+    def __init__(self, table: _Table) -> None:
+        self.table = table
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        (state_id, event_id) = key
+        table = self.table
+        if not 0 <= event_id < table.events:
+            return default
+        slot = state_id * table.events + event_id
+        (start, end) = (table.slots[slot], table.slots[slot + 1])
+        if start == end:
+            return default
+        if table.conditions[start] < 0:
+            return UNCONDITIONAL
+        return GUARDED if end - start == 1 else MULTIPLE
+
+    def __getitem__(self, key: Tuple[int, int]) -> int:
+        kind = self.get(key, None)
+        if kind is None:
+            raise KeyError(key)
+        return kind  # type: ignore
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(self.table)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+class _Grouped(Mapping[int, Tuple[T, ...]]):
+    '''Per-state groups of items (triggers or timers), from slot offsets'''
+
+    __slots__ = ('slots', 'members', 'size')
+
+    def __init__(self, slots: memoryview, members: List[T]) -> None:
+        self.slots = slots
+        self.members = members
+        self.size = sum(1 for idx in range(len(slots) - 1) if slots[idx + 1] > slots[idx])
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if not isinstance(key, int) or not 0 <= key < len(self.slots) - 1:
+            return default
+        (start, end) = (self.slots[key], self.slots[key + 1])
+        return tuple(self.members[start:end]) if end > start else default
+
+    def __getitem__(self, key: int) -> Tuple[T, ...]:
+        group = self.get(key, None)
+        if group is None:
+            raise KeyError(key)
+        return group  # type: ignore
+
+    def __iter__(self) -> Iterator[int]:
+        slots = self.slots
+        return (idx for idx in range(len(slots) - 1) if slots[idx + 1] > slots[idx])
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class _Bits(Sequence[int]):
+    '''Per-row bitsets stored as fixed width little endian bytes'''
+
+    __slots__ = ('data', 'width')
+
+    def __init__(self, data: memoryview, width: int) -> None:
+        self.data = data
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.data) // self.width if self.width else 0
+
+    def __getitem__(self, idx: Any) -> Any:
+        if isinstance(idx, slice):
+            return [self[_idx] for _idx in range(len(self))[idx]]
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return int.from_bytes(self.data[idx * self.width:(idx + 1) * self.width], 'little')
+
+
+class _Allowed(Sequence[Tuple[str, ...]]):
+    '''Events with an entry, per state'''
+
+    __slots__ = ('slots', 'event_ids', 'events')
+
+    def __init__(self, slots: memoryview, event_ids: memoryview, events: Sequence[str]) -> None:
+        self.slots = slots
+        self.event_ids = event_ids
+        self.events = events
+
+    def __len__(self) -> int:
+        return len(self.slots) - 1
+
+    def __getitem__(self, idx: Any) -> Any:
+        if isinstance(idx, slice):
+            return [self[_idx] for _idx in range(len(self))[idx]]
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return tuple(
+            self.events[event_id]
+            for event_id in self.event_ids[self.slots[idx]:self.slots[idx + 1]]
+        )
+
+
+class SharedModel:  # pylint: disable=R0902
+    '''A packed compiled model in a shared memory segment or memory mapped file
+
+    ``publish()`` packs the compiled tables of an Engine into a new shared
+    memory segment, ``attach()`` opens it by name in another process, and
+    ``save()``/``open()`` do the same through a file. ``compile()`` returns a
+    CompiledEngine whose tables are read-only views into the buffer, so the
+    tables take no memory per process and nothing gets parsed: use it in
+    place of the Engine, as in ``Dispatcher(SharedModel.attach(name))``.
+
+    That holds for models loaded from descriptions, whose conditions are
+    expressions. Conditions and classes of Python scopes are pickled by
+    reference, and unpickling them imports their module, which defines and
+    so parses the scopes again in workers started by spawn. Fork the
+    workers, or import the module before, to attach without parsing.
+
+    Conditions and scope classes that couldn't be packed, or should be
+    replaced, are given by name through ``conditions`` (``scope:from__to``
+    for transitions, trigger and timer names) and ``classes`` (by scope).
+
+    Shared memory segments need Python 3.8 or later, files work on any.
+    Lookups through the views are slower than through compiled dicts, and the
+    views keep the buffer in use, so close the model only once done with all
+    Dispatchers. Conditions are unpickled from the buffer, attach only to
+    segments of your own deployment.
+    '''
+
+    def __init__(self,
+                 buffer: Any,
+                 handle: Any = None,
+                 conditions: Mapping[str, ConditionFunc] | None = None,
+                 classes: Mapping[str, Type] | None = None) -> None:
+        self.buffer = memoryview(buffer)
+        self.handle = handle
+        self.conditions = dict(conditions or {})
+        self.classes = dict(classes or {})
+        if bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            raise BrokenStateModelException('Buffer does not hold a packed WorkState model')
+        length = int.from_bytes(self.buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self.buffer[start:start + length]))
+        self.base = start + length
+        self.strings = _StringTable(
+            self._view(self.header['string_offsets']),
+            self._view(self.header['string_blob'], 'B'),
+        )
+        self._compiled: CompiledEngine | None = None
+
+    @property
+    def name(self) -> str | None:
+        '''Name of the shared memory segment, None if not in one'''
+        return getattr(self.handle, 'name', None)
+
+    @classmethod
+    def publish(cls, model: Any, name: str | None = None) -> SharedModel:
+        '''Packs the compiled tables of an Engine (or CompiledEngine) into a new segment'''
+        if shared_memory is None:  # pragma: nocoverage
+            raise ImportError('Shared memory segments require Python 3.8 or later')
+        data = pack(model if isinstance(model, CompiledEngine) else model.compile())
+        segment = shared_memory.SharedMemory(name, create=True, size=len(data))
+        buffer: Any = segment.buf
+        buffer[:len(data)] = data
+        return cls(buffer[:len(data)], segment)
+
+    @classmethod
+    def attach(cls, name: str, **overrides: Any) -> SharedModel:
+        '''Attaches to a segment published by another process
+
+        Before Python 3.13 attaching registers the segment with the resource
+        tracker of the process, which removes it once that process and its
+        children exit: attach from processes started by the publisher.
+        '''
+        if shared_memory is None:  # pragma: nocoverage
+            raise ImportError('Shared memory segments require Python 3.8 or later')
+        options = {'track': False} if sys.version_info >= (3, 13) else {}
+        segment = shared_memory.SharedMemory(name, **options)
+        return cls(segment.buf, segment, **overrides)
+
+    @staticmethod
+    def save(model: Any, filename: str) -> None:
+        '''Packs the compiled tables of an Engine (or CompiledEngine) into a file'''
+        with open(filename, 'wb') as outf:
+            outf.write(pack(model if isinstance(model, CompiledEngine) else model.compile()))
+
+    @classmethod
+    def open(cls, filename: str, **overrides: Any) -> SharedModel:
+        '''Maps a packed model file into memory, read-only'''
+        with open(filename, 'rb') as inf:
+            mapped = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, mapped, **overrides)
+
+    def close(self) -> None:
+        '''Releases the buffer, compiled models returned before need to be gone'''
+        self._compiled = None
+        self.strings.offsets.release()
+        self.strings.blob.release()
+        self.buffer.release()
+        if self.handle is not None:
+            self.handle.close()
+
+    def unlink(self) -> None:
+        '''Removes the shared memory segment, once every process closed it'''
+        if shared_memory is not None and isinstance(self.handle, shared_memory.SharedMemory):
+            self.handle.unlink()
+
+    def _view(self, ref: Ref, typecode: str = 'q') -> Any:
+        '''Typed read-only view of an array'''
+        offset = self.base + ref[0]
+        size = ref[1] * array(typecode).itemsize
+        view = self.buffer[offset:offset + size]
+        if not view.readonly:
+            # Only segments are writable, and those need Python 3.8 anyway
+            view = view.toreadonly()
+        return view.cast(typecode)  # type: ignore
+
+    def _names(self, ref: Ref) -> _Strings:
+        return _Strings(self.strings, self._view(ref))
+
+    def _lookup(self, layout: Dict[str, Ref]) -> _Lookup:
+        return _Lookup(self.strings, self._view(layout['names']), self._view(layout['ids']))
+
+    def compile(self) -> CompiledEngine:
+        '''Returns the compiled model backed by the buffer, built on first use'''
+        if self._compiled is None:
+            self._compiled = self._build()
+        return self._compiled
+
+    def _build(self) -> CompiledEngine:
+        '''Builds a CompiledEngine over the buffer'''
+        header = self.header
+        funcs: List[Any] = []
+        names = self._names(header['condition_names'])
+        for name, sid in zip(names, self._view(header['condition_blobs'])):
+            if name in self.conditions:
+                funcs.append(self.conditions[name])
+                continue
+            blob = self.strings.raw(sid)
+            if not blob:
+                raise BrokenStateModelException(
+                    f'Condition {name} could not be packed, it needs to be given by name'
+                )
+            funcs.append(pickle.loads(blob))
+
+        layout = header['triggers']
+        triggers = [
+            CompiledTrigger(idx, name, scope, event, funcs[cond] if cond >= 0 else None)
+            for idx, (name, scope, event, cond) in enumerate(zip(
+                self._names(layout['names']), self._names(layout['scopes']),
+                self._names(layout['events']), self._view(layout['conditions']),
+            ))
+        ]
+        scopes = {
+            layout['scope']: self._scope(layout, funcs, triggers)
+            for layout in header['scopes']
+        }
+        return CompiledEngine(scopes, triggers)
+
+    def _scope(self,
+               layout: Dict[str, Any],
+               funcs: List[Any],
+               triggers: List[CompiledTrigger]) -> CompiledScope:
+        '''Builds a CompiledScope over the buffer'''
+        scope = layout['scope']
+        cls = self.classes.get(scope, None)
+        if cls is None and self.strings.raw(layout['cls']):
+            cls = pickle.loads(self.strings.raw(layout['cls']))
+        cscope = CompiledScope(scope, cls, layout['initial'])
+        cscope.states = self._names(layout['states'])  # type: ignore
+        cscope.state_ids = self._lookup(layout['state_ids'])  # type: ignore
+        cscope.events = self._names(layout['events'])  # type: ignore
+        cscope.event_ids = self._lookup(layout['event_ids'])  # type: ignore
+        cscope.edges = self._names(layout['edges'])  # type: ignore
+        cscope.edge_ids = self._lookup(layout['edge_ids'])  # type: ignore
+        table = _Table(layout, self._view, funcs)
+        cscope.table = table  # type: ignore
+        cscope.kinds = _Kinds(table)  # type: ignore
+        cscope.allowed = _Allowed(  # type: ignore
+            self._view(layout['allowed_slots']), self._view(layout['allowed']), cscope.events
+        )
+        cscope.watchers = _Grouped(  # type: ignore
+            self._view(layout['watch_slots']),
+            [triggers[idx] for idx in self._view(layout['watchers'])],
+        )
+        cscope.timers = _Grouped(self._view(layout['timer_slots']), [  # type: ignore
+            CompiledTimer(idx, name, event, seconds, funcs[cond] if cond >= 0 else None)
+            for idx, name, event, seconds, cond in zip(
+                self._view(layout['timer_ids']), self._names(layout['timer_names']),
+                self._names(layout['timer_events']), self._view(layout['timer_seconds'], 'd'),
+                self._view(layout['timer_conditions']),
+            )
+        ])
+        width = (len(cscope.states) + 7) // 8
+        cscope.reach = _Bits(self._view(layout['reach'], 'B'), width)  # type: ignore
+        cscope.fires = _Bits(self._view(layout['fires'], 'B'), width)  # type: ignore
+        (size, direct, edges) = (
+            len(cscope.states), self._view(layout['direct']), self._view(layout['direct_edges'])
+        )
+        cscope.direct = [
+            direct[idx * size:(idx + 1) * size] for idx in range(len(cscope.events))
+        ]
+        cscope.direct_edges = [
+            edges[idx * size:(idx + 1) * size] for idx in range(len(cscope.events))
+        ]
+        cscope.priorities = dict(layout['priorities'])
+        cscope.aliases = dict(layout['aliases'])
+        return cscope
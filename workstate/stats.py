@@ -0,0 +1,109 @@
+'''State distribution and flow statistics'''
+from __future__ import annotations
+
+import time
+from array import array
+from typing import Callable, Dict, List
+
+from workstate.compiled import CompiledEngine
+
+__all__ = ('FlowStats', )
+
+
+class FlowStats:
+    '''Incrementally updated per-edge transition counters
+
+    Keeps lifetime totals per edge, and a ring of ``buckets`` time buckets of
+    ``resolution`` seconds each, so that recent flow can be read without
+    walking any entities.
+    '''
+
+    def __init__(self,
+                 compiled: CompiledEngine,
+                 resolution: float = 60.0,
+                 buckets: int = 60,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.compiled = compiled
+        self.resolution = resolution
+        self.clock = clock
+        self.totals: Dict[str, array] = {
+            scope: array('q', [0]) * len(cscope.edges) for scope, cscope in compiled.scopes.items()
+        }
+        self._epochs = array('q', [-1]) * buckets
+        self._ring: List[Dict[str, array]] = [
+            {scope: array('q') for scope in compiled.scopes} for _ in range(buckets)
+        ]
+
+    def record(self, scope: str, edge: int, count: int = 1) -> None:
+        '''Records a number of transitions over an edge'''
+        self.totals[scope][edge] += count
+        epoch = int(self.clock() // self.resolution)
+        slot = epoch % len(self._epochs)
+        bucket = self._ring[slot]
+        if self._epochs[slot] != epoch:
+            # Bucket is stale, re-use it for the current epoch
+            self._epochs[slot] = epoch
+            for _scope, cscope in self.compiled.scopes.items():
+                bucket[_scope] = array('q', [0]) * len(cscope.edges)
+        bucket[scope][edge] += count
+
+    def edge_counts(self, scope: str | None = None) -> Dict[str, int]:
+        '''Returns lifetime transition counts per edge'''
+        return {
+            self.compiled.scopes[_scope].edges[edge]: count
+            for _scope, totals in self.totals.items()
+            if scope is None or scope == _scope
+            for edge, count in enumerate(totals)
+        }
+
+    def recent(self, seconds: float, scope: str | None = None) -> Dict[str, int]:
+        '''Returns transition counts per edge over the last seconds
+
+        Counts are accurate to the bucket resolution: the current bucket and
+        as many whole buckets before it as fit into the remaining seconds,
+        limited to the window covered by the ring of buckets.
+        '''
+        epoch = int(self.clock() // self.resolution)
+        back = max(int(seconds // self.resolution) - 1, 0)
+        oldest = epoch - min(back, len(self._epochs) - 1)
+        result: Dict[str, int] = {}
+        for slot, _epoch in enumerate(self._epochs):
+            if not oldest <= _epoch <= epoch:
+                continue
+            for _scope, counts in self._ring[slot].items():
+                if scope is not None and scope != _scope:
+                    continue
+                edges = self.compiled.scopes[_scope].edges
+                for edge, count in enumerate(counts):
+                    result[edges[edge]] = result.get(edges[edge], 0) + count
+        return result
+
+    def rebind(self, compiled: CompiledEngine) -> None:
+        '''Switches over to a recompiled model, keeping counts of edges that still exist'''
+        totals = self.edge_counts()
+        buckets = [self._counts(bucket) for bucket in self._ring]
+        self.compiled = compiled
+        self.totals = {
+            scope: array('q', [totals.get(edge, 0) for edge in cscope.edges])
+            for scope, cscope in compiled.scopes.items()
+        }
+        self._ring = [
+            {
+                scope: array('q', [counts.get(edge, 0) for edge in cscope.edges])
+                for scope, cscope in compiled.scopes.items()
+            }
+            for counts in buckets
+        ]
+
+    def _counts(self, bucket: Dict[str, array]) -> Dict[str, int]:
+        '''Counts of a bucket by edge name'''
+        return {
+            self.compiled.scopes[scope].edges[edge]: count
+            for scope, counts in bucket.items() for edge, count in enumerate(counts)
+        }
+
+    def reset(self) -> None:
+        '''Clears all counters'''
+        for totals in self.totals.values():
+            totals[:] = array('q', [0]) * len(totals)
+        self._epochs[:] = array('q', [-1]) * len(self._epochs)
@@ -0,0 +1,338 @@
+'''Columnar entity storage for WorkState scopes'''
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from types import FunctionType, MethodType
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Sequence, Tuple
+
+from workstate.compiled import CompiledScope
+from workstate.exceptions import BrokenStateModelException
+
+if TYPE_CHECKING:  # pragma: nocoverage
+    from workstate.dispatch import Dispatcher, Flow
+
+try:
+    import numpy as np
+except ImportError:  # pragma: nocoverage
+    np = None  # type: ignore
+
+__all__ = ('ScopeStore', 'EntityHandle', 'WriteSet')
+
+#: Column typecodes inferred from the Python type of a default value
+TYPECODES = {bool: 'b', int: 'q', float: 'd'}
+
+#: Column typecodes inferred from the NumPy dtype kind of a default value
+KINDS = {'b': 'b', 'i': 'q', 'u': 'q', 'f': 'd'}
+
+#: Default value of typed columns
+DEFAULTS = {'b': False, 'q': 0, 'd': 0.0}
+
+
+def _typecode(sample: Any) -> str | None:
+    '''Column typecode for a sample value, None if it needs a plain list'''
+    dtype = getattr(sample, 'dtype', None)
+    if dtype is not None:
+        return KINDS.get(dtype.kind, None)
+    return TYPECODES.get(type(sample), None)
+
+
+def _plain(value: Any) -> Any:
+    '''Converts NumPy scalars to the equivalent Python value'''
+    return value.item() if np is not None and isinstance(value, np.generic) else value
+
+
+def _is_sequence(value: Any) -> bool:
+    '''Is value a per-row sequence rather than a scalar?'''
+    if isinstance(value, (str, bytes)):
+        return False
+    return isinstance(value, Sequence) or (np is not None and isinstance(value, np.ndarray))
+
+
+class EntityHandle:
+    '''Lightweight view onto a single row of a ScopeStore'''
+
+    __slots__ = ('store', 'row')
+    store: ScopeStore
+    row: int
+
+    def __init__(self, store: ScopeStore, row: int) -> None:
+        object.__setattr__(self, 'store', store)
+        object.__setattr__(self, 'row', row)
+
+    @property
+    def key(self) -> int:
+        '''Entity key'''
+        return self.store.keys[self.row]
+
+    @property
+    def state_id(self) -> int:
+        '''Current state id'''
+        return self.store.states[self.row]
+
+    @property
+    def state(self) -> str:
+        '''Current state name'''
+        return self.store.compiled.states[self.store.states[self.row]]
+
+    def event(self, event: str) -> Flow:
+        '''Applies event to this entity'''
+        return self.store.dispatcher.event(self.store.scope, self.key, event)
+
+    def __getattr__(self, name: str) -> Any:
+        store = self.store
+        if name in store.attributes:
+            return store.attributes[name][self.row]
+        if name.startswith('get_') and name[4:] in store.dispatcher.stores:
+            other = store.dispatcher.stores[name[4:]]
+            rows = store.related(self.row, other.scope)
+            return lambda: [EntityHandle(other, row) for row in rows]
+        if store.compiled.cls is not None and hasattr(store.compiled.cls, name):
+            val = getattr(store.compiled.cls, name)
+            if isinstance(val, FunctionType):
+                return MethodType(val, self)
+            return val
+        raise AttributeError(f'{store.scope} entity has no attribute {name}')
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        self.store.set(self.row, name, value)
+
+    def __repr__(self) -> str:
+        return f'<{self.store.scope}:{self.state} key={self.key}>'
+
+
+class ScopeStore:  # pylint: disable=R0902
+    '''Columnar store of all entities of a single scope
+
+    Entity keys, state ids and attributes live in ``array`` columns, rows are
+    addressed by position. Keys added in increasing order are located by
+    bisection, otherwise a key index is maintained.
+    '''
+
+    def __init__(self, compiled: CompiledScope, dispatcher: Dispatcher) -> None:
+        self.compiled = compiled
+        self.dispatcher = dispatcher
+        self.scope = compiled.scope
+        self.keys = array('q')
+        self.states = array(compiled.typecode)
+        self.counts = array('q', [0]) * len(compiled.states)
+        self.attributes: Dict[str, Any] = {}
+        self.defaults: Dict[str, Any] = {}
+        self.parents: Dict[str, array] = {}
+        self.children: Dict[str, Dict[int, List[int]]] = {}
+        self._index: Dict[int, int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, keys: Iterable[int], **attributes: Any) -> range:
+        '''Bulk adds entities in the initial state, returns the new rows
+
+        Attributes are either a scalar applied to all new rows or a sequence
+        with a value per key. Raises ValueError, adding nothing, if a key is
+        given twice or already exists.
+        '''
+        if self.compiled.initial is None:
+            raise BrokenStateModelException(f'Scope {self.scope} has no initial state')
+
+        fresh = array('q')
+        if np is not None and isinstance(keys, np.ndarray):
+            fresh.frombytes(keys.astype('q').tobytes())
+        else:
+            fresh.extend(keys)
+
+        # Keep lookup by bisection while keys are strictly increasing, which
+        # also keeps them unique, otherwise check them against a key index
+        start = len(self.keys)
+        index = self._index
+        if index is None and any(
+                prev >= key for prev, key in zip(self.keys[-1:] + fresh, fresh)):
+            index = {key: row for row, key in enumerate(self.keys)}
+        if index is not None:
+            seen = set()
+            for key in fresh:
+                if key in index or key in seen:
+                    raise ValueError(f'Entity {self.scope}:{key} already exists')
+                seen.add(key)
+            self._index = index
+            for row, key in enumerate(fresh, start):
+                index[key] = row
+
+        self.keys.extend(fresh)
+        count = len(fresh)
+        self.states.extend(array(self.states.typecode, [self.compiled.initial]) * count)
+        self.counts[self.compiled.initial] += count
+
+        for name in set(self.attributes) - set(attributes):
+            self._extend(name, [self.defaults[name]] * count)
+        for name, value in attributes.items():
+            if not _is_sequence(value):
+                value = [_plain(value)] * count
+            if name not in self.attributes:
+                self._create(name, value[0] if count else None, start)
+            self._extend(name, value)
+
+        for parents in self.parents.values():
+            parents.extend(array('q', [-1]) * count)
+
+        rows = range(start, start + count)
+        self.dispatcher.added(self, rows)
+        return rows
+
+    def _create(self, name: str, sample: Any, length: int) -> None:
+        '''Creates an attribute column, typed by sample value'''
+        typecode = _typecode(sample)
+        default = DEFAULTS[typecode] if typecode else None
+        self.defaults[name] = default
+        if typecode:
+            self.attributes[name] = array(typecode, [default]) * length  # type: ignore
+        else:
+            self.attributes[name] = [default] * length
+
+    def _extend(self, name: str, values: Any) -> None:
+        '''Appends values to an attribute column'''
+        column = self.attributes[name]
+        if np is not None and isinstance(values, np.ndarray):
+            if isinstance(column, array):
+                column.frombytes(values.astype(column.typecode).tobytes())
+                return
+            values = values.tolist()
+        column.extend(values)
+
+    def set(self, row: int, name: str, value: Any) -> None:
+        '''Sets an attribute of an entity'''
+        value = _plain(value)
+        if name not in self.attributes:
+            self._create(name, value, len(self.keys))
+        self.attributes[name][row] = value
+        self.dispatcher.changed(self, row, name)
+
+    def row(self, key: int) -> int:
+        '''Returns row of entity key'''
+        if self._index is not None:
+            return self._index[key]
+        row = bisect_left(self.keys, key)
+        if row == len(self.keys) or self.keys[row] != key:
+            raise KeyError(key)
+        return row
+
+    def move(self, row: int, state_id: int) -> None:
+        '''Moves entity into a new state, keeping state counts current'''
+        counts = self.counts
+        counts[self.states[row]] -= 1
+        counts[state_id] += 1
+        self.states[row] = state_id
+
+    def commit(self, originals: Dict[int, int]) -> None:
+        '''Settles state counts of rows whose state was written directly, given original states'''
+        counts = self.counts
+        for row, state_id in originals.items():
+            counts[state_id] -= 1
+            counts[self.states[row]] += 1
+
+    def histogram(self) -> Dict[str, int]:
+        '''Returns number of entities per state'''
+        return dict(zip(self.compiled.states, self.counts))
+
+    def recount(self) -> Dict[str, int]:
+        '''Recomputes state counts exactly from the state column'''
+        size = len(self.compiled.states)
+        if np is None:  # pragma: nocoverage
+            counter = Counter(self.states)  # type: ignore
+            self.counts = array('q', [counter[state] for state in range(size)])
+        else:
+            counts = np.bincount(self.column(), minlength=size)
+            self.counts = array('q', counts.astype('q').tobytes())
+        return self.histogram()
+
+    def rebind(self, compiled: CompiledScope, mapping: Sequence[int]) -> None:
+        '''Swaps in recompiled tables, translating state ids through mapping (old id to new)'''
+        states = array(compiled.typecode)
+        if np is not None and len(self.states):
+            lut = np.asarray(mapping, dtype='q')
+            states.frombytes(lut[self.column()].astype(compiled.typecode).tobytes())
+        else:
+            states.extend(mapping[state_id] for state_id in self.states)
+        (self.compiled, self.states) = (compiled, states)
+        self.recount()
+
+    def handle(self, key: int) -> EntityHandle:
+        '''Returns a handle to entity'''
+        return EntityHandle(self, self.row(key))
+
+    __getitem__ = handle
+
+    def state(self, key: int) -> str:
+        '''Returns state name of entity'''
+        return self.compiled.states[self.states[self.row(key)]]
+
+    def event(self, key: int, event: str) -> Flow:
+        '''Applies event to entity'''
+        return self.dispatcher.event(self.scope, key, event)
+
+    def apply(self, event: str, keys: Iterable[int] | None = None) -> Any:
+        '''Applies event to all (or the given) entities at once, returns keys of moved entities'''
+        return self.dispatcher.apply(self.scope, event, keys)
+
+    def link(self, rows: Iterable[int], parent: ScopeStore, parent_rows: Iterable[int]) -> None:
+        '''Links rows of this store to their parent rows in another store'''
+        if parent.scope not in self.parents:
+            self.parents[parent.scope] = array('q', [-1]) * len(self.keys)
+        parents = self.parents[parent.scope]
+        children = parent.children.setdefault(self.scope, {})
+        for row, parent_row in zip(rows, parent_rows):
+            parents[row] = parent_row
+            children.setdefault(parent_row, []).append(row)
+
+    def related(self, row: int, scope: str) -> List[int]:
+        '''Returns rows of related entities in another scope'''
+        if scope in self.parents:
+            parent_row = self.parents[scope][row]
+            return [] if parent_row < 0 else [parent_row]
+        return self.children.get(scope, {}).get(row, [])
+
+    def column(self, name: str = 'state') -> Any:
+        '''Returns a zero-copy NumPy view of a column
+
+        The view must be released before more entities are added.
+        '''
+        if np is None:  # pragma: nocoverage
+            raise RuntimeError('NumPy is required for column views')
+        col = self.states if name == 'state' else self.attributes[name]
+        if isinstance(col, list):
+            return np.array(col, dtype=object)
+        if not col:
+            return np.zeros(0, dtype=col.typecode)
+        return np.frombuffer(col, dtype=col.typecode)
+
+
+class WriteSet:
+    '''Transitions staged by a cascade, to be committed or rolled back as a whole
+
+    Staged states are written to the state column so that later guards of the
+    cascade see them, everything derived from states (counts, timers, flow
+    statistics) is left for the commit.
+    '''
+
+    __slots__ = ('originals', 'edges', 'hops')
+
+    def __init__(self) -> None:
+        self.originals: Dict[ScopeStore, Dict[int, int]] = {}
+        self.edges: List[Tuple[str, int]] = []
+        # Hops for the history: (scope, row, event id, cause, from id, to id)
+        self.hops: List[Tuple[str, int, int, int, int, int]] = []
+
+    def stage(self, store: ScopeStore, row: int, state_id: int, edge: int) -> None:
+        '''Stages a transition of an entity'''
+        originals = self.originals.setdefault(store, {})
+        if row not in originals:
+            originals[row] = store.states[row]
+        store.states[row] = state_id
+        self.edges.append((store.scope, edge))
+
+    def rollback(self) -> None:
+        '''Restores the original states of all staged entities'''
+        for store, originals in self.originals.items():
+            for row, state_id in originals.items():
+                store.states[row] = state_id
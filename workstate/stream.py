@@ -0,0 +1,100 @@
+'''Streaming ingestion of events into a Dispatcher'''
+from __future__ import annotations
+
+import json
+from itertools import islice
+from typing import IO, Any, Iterable, Iterator, List, Tuple
+
+from workstate.dispatch import Dispatcher
+from workstate.exceptions import EventRejectedException
+from workstate.queue import Result
+
+__all__ = ('ingest', 'read_jsonl', 'records')
+
+#: An event record: (scope, entity key, event)
+Record = Tuple[str, int, str]
+
+
+def records(source: Iterable[Any], scope: str | None = None) -> Iterator[Record]:
+    '''Normalises ``(scope, key, event)``, or ``(key, event)`` with a default scope, records'''
+    for record in source:
+        if len(record) == 3:
+            yield (record[0], record[1], record[2])
+        elif len(record) == 2 and scope is not None:
+            yield (scope, record[0], record[1])
+        else:
+            raise ValueError(f'Invalid event record {record!r}')
+
+
+def _lines(lines: Iterable[str], scope: str | None) -> Iterator[Record]:
+    '''Parses JSON lines into records, skipping blank lines'''
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ValueError(f'Line {lineno}: {exc}') from exc
+        if isinstance(record, dict):
+            record = (
+                record.get('scope', scope), record.get('key', None), record.get('event', None)
+            )
+            if None in record:
+                raise ValueError(f'Line {lineno}: records need a scope, key and event')
+        yield from records((record, ), scope)
+
+
+def read_jsonl(source: str | IO[str], scope: str | None = None) -> Iterator[Record]:
+    '''Reads records lazily from a JSON lines file, given by name or as an open file
+
+    Each line is either an object with ``scope``, ``key`` and ``event`` members
+    or a ``[scope, key, event]`` list, where the scope may be left out if a
+    default scope is given.
+    '''
+    if isinstance(source, str):
+        with open(source, encoding='utf-8') as inf:
+            yield from _lines(inf, scope)
+    else:
+        yield from _lines(source, scope)
+
+
+def ingest(dispatcher: Dispatcher,
+           source: str | IO[str] | Iterable[Any],
+           scope: str | None = None,
+           batch: int = 1024,
+           atomic: bool = False) -> Iterator[Result]:
+    '''Dispatches events from source in bounded batches, yielding results lazily
+
+    Source is a JSON lines file (by name or as an open file) or an iterable of
+    records as taken by ``records()``. At most batch records are read ahead
+    of the results consumed, so memory use doesn't grow with the input and a
+    slow consumer throttles reading. Each batch is a single dispatch cycle;
+    rejected events, and events for unknown entities, are yielded as results
+    with an error. With atomic, each event's cascade is a transaction.
+    '''
+    if isinstance(source, str) or hasattr(source, 'read'):
+        stream = read_jsonl(source, scope)  # type: ignore
+    else:
+        stream = records(source, scope)
+
+    while True:
+        chunk = list(islice(stream, batch))
+        if not chunk:
+            return
+        results: List[Result] = []
+        with dispatcher.cycle():
+            for (_scope, key, event) in chunk:
+                try:
+                    dispatcher.store(_scope).row(key)
+                except KeyError:
+                    error = EventRejectedException(f'Unknown entity {_scope}:{key}')
+                    results.append(Result(_scope, key, event, None, error))
+                    continue
+                try:
+                    flow = dispatcher.event(_scope, key, event, atomic=atomic)
+                except EventRejectedException as exc:
+                    results.append(Result(_scope, key, event, None, exc))
+                else:
+                    results.append(Result(_scope, key, event, flow, None))
+        # Results are handed out after the cycle, so a paused consumer holds no lock
+        yield from results
@@ -0,0 +1,253 @@
+'''Partial dot graphs generated straight from the compiled tables'''
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from workstate.compiled import CompiledEngine, CompiledScope
+from workstate.docgen import BGCOLORS, FGCOLORS, Digraph
+
+__all__ = ('neighborhood', 'scope_graph', 'collapsed')
+
+#: A state node: (scope, state id)
+Node = Tuple[str, int]
+
+#: A trigger link: (watched state, state entered by the triggered event, trigger name)
+Link = Tuple[Node, Node, str]
+
+
+def _col(compiled: CompiledEngine, scope: str) -> int:
+    '''Colour index of a scope, in line with Engine.graph()'''
+    return (list(compiled.scopes).index(scope) + 1) % len(FGCOLORS)
+
+
+def _wildcard(cscope: CompiledScope, edge: int) -> bool:
+    '''Is edge an expanded wildcard (``*__x``) edge?'''
+    return cscope.edges[edge].split(':')[1].startswith('*__')
+
+
+def _links(compiled: CompiledEngine) -> List[Link]:
+    '''Lists trigger links from watched states to the states their events lead to'''
+    links: List[Link] = []
+    for scope, cscope in compiled.scopes.items():
+        for state_id, watchers in cscope.watchers.items():
+            for watcher in watchers:
+                owner = compiled.scopes[watcher.scope]
+                event_id = owner.event_ids.get(watcher.event, None)
+                if event_id is None:
+                    continue
+                # Same-scope triggers fire on the entity in the watched state
+                if watcher.scope == scope:
+                    sources = [state_id]
+                else:
+                    sources = [
+                        _id for _id in range(len(owner.states)) if owner.fires[event_id] >> _id & 1
+                    ]
+                targets = {
+                    cand.target for _id in sources
+                    for cand in owner.table.get((_id, event_id), ())
+                }
+                links.extend(
+                    ((scope, state_id), (watcher.scope, target), watcher.name.split(':')[1])
+                    for target in sorted(targets)
+                )
+    return links
+
+
+def _linked(compiled: CompiledEngine) -> Dict[Node, List[Link]]:
+    '''Trigger links by the states at either end, built once per compiled model'''
+    if compiled.links is None:
+        linked: Dict[Node, List[Link]] = {}
+        for link in _links(compiled):
+            linked.setdefault(link[0], []).append(link)
+            if link[1] != link[0]:
+                linked.setdefault(link[1], []).append(link)
+        compiled.links = linked
+    return compiled.links
+
+
+def _adjacency(cscope: CompiledScope) -> List[Set[int]]:
+    '''Undirected state adjacency of a scope, leaving out wildcard edges'''
+    if len(cscope.adjacency) != len(cscope.states):
+        adjacent: List[Set[int]] = [set() for _ in cscope.states]
+        for (state_id, _), cands in cscope.table.items():
+            for cand in cands:
+                if not _wildcard(cscope, cand.edge):
+                    adjacent[state_id].add(cand.target)
+                    adjacent[cand.target].add(state_id)
+        cscope.adjacency = adjacent
+    return cscope.adjacency
+
+
+def _draw(compiled: CompiledEngine, nodes: Set[Node], links: Iterable[Link]) -> Digraph:
+    '''Draws the given state nodes, with moves and trigger links between them'''
+    dot = Digraph()
+    scopes: Dict[str, List[int]] = {}
+    for scope, state_id in nodes:
+        scopes.setdefault(scope, []).append(state_id)
+
+    for scope in compiled.scopes:
+        if scope not in scopes:
+            continue
+        (cscope, col) = (compiled.scopes[scope], _col(compiled, scope))
+        included = set(scopes[scope])
+        for state_id in sorted(included):
+            pretty = cscope.states[state_id].replace('_', ' ').title()
+            if state_id == cscope.initial:
+                dot.node(
+                    cscope.fullname(state_id),
+                    pretty,
+                    shape='oval',
+                    style="bold,filled",
+                    fillcolor=BGCOLORS[col],
+                    color=FGCOLORS[col],
+                )
+            else:
+                dot.node(
+                    cscope.fullname(state_id),
+                    pretty,
+                    shape='rectangle',
+                    style="filled,rounded",
+                    fillcolor=BGCOLORS[col],
+                    color=FGCOLORS[col],
+                )
+
+        drawn: Set[Tuple[str, int, str]] = set()
+        for state_id in sorted(included):
+            # Wildcard edges lead from every other state, so one of them shows those into ours
+            probe = next((_id for _id in range(len(cscope.states)) if _id != state_id), None)
+            for event_id in range(len(cscope.events)):
+                pevent = cscope.events[event_id].replace('_', ' ').title()
+                for cand in cscope.table.get((state_id, event_id), ()):
+                    if cand.target in included and not _wildcard(cscope, cand.edge):
+                        dot.edge(
+                            cscope.fullname(state_id),
+                            cscope.fullname(cand.target),
+                            pevent,
+                            style="dashed" if cand.condition else "solid",
+                            color=FGCOLORS[col],
+                        )
+                if probe is None:
+                    continue
+                for cand in cscope.table.get((probe, event_id), ()):
+                    if cand.target != state_id or not _wildcard(cscope, cand.edge):
+                        continue
+                    # Wildcard edges are drawn once, from an "Any" node
+                    if (f'{scope}:*', cand.target, pevent) not in drawn:
+                        drawn.add((f'{scope}:*', cand.target, pevent))
+                        dot.edge(f'{scope}:*', cscope.fullname(cand.target), pevent,
+                                 color=FGCOLORS[col])
+        if any(source.endswith(':*') for source, _, _ in drawn):
+            dot.node(
+                f'{scope}:*', 'Any', shape='none', style="filled",
+                fillcolor=BGCOLORS[col], color=FGCOLORS[col],
+            )
+
+    for (source, target, name) in links:
+        if source in nodes and target in nodes:
+            dot.edge(
+                compiled.scopes[source[0]].fullname(source[1]),
+                compiled.scopes[target[0]].fullname(target[1]),
+                f'<FONT POINT-SIZE="10">{name}</FONT>',
+                style="dotted",
+                color=FGCOLORS[_col(compiled, target[0])],
+            )
+
+    return dot
+
+
+def neighborhood(compiled: CompiledEngine,
+                 scope: str,
+                 state: str | None = None,
+                 event: str | None = None,
+                 hops: int = 1) -> Digraph:
+    '''Graphs the states within hops moves of a state, or of the edges of an event
+
+    Moves are followed in both directions, and trigger links cross scopes.
+    Wildcard edges are drawn but not followed, as they would pull in the
+    whole scope in a single hop. The adjacency of scopes and the trigger
+    links are indexed once and cached with the compiled tables, so only the
+    states within reach get walked and drawn.
+    '''
+    cscope = compiled.get_scope(scope)
+    if state is not None:
+        seeds = {(scope, cscope.state_id(state))}
+    elif event is not None:
+        event_id = cscope.event_ids[event]
+        seeds = set()
+        for (state_id, _event_id), cands in cscope.table.items():
+            if _event_id == event_id:
+                for cand in cands:
+                    seeds.add((scope, cand.target))
+                    if not _wildcard(cscope, cand.edge):
+                        seeds.add((scope, state_id))
+    else:
+        raise ValueError('Either state or event needs to be given')
+
+    linked = _linked(compiled)
+    nodes = set(seeds)
+    todo = deque((node, 0) for node in seeds)
+    while todo:
+        (node, depth) = todo.popleft()
+        if depth >= hops:
+            continue
+        adjacent = [(node[0], _id) for _id in _adjacency(compiled.scopes[node[0]])[node[1]]]
+        adjacent.extend(
+            target if source == node else source
+            for source, target, _ in linked.get(node, ())
+        )
+        for other in adjacent:
+            if other not in nodes:
+                nodes.add(other)
+                todo.append((other, depth + 1))
+
+    links = dict.fromkeys(link for node in sorted(nodes) for link in linked.get(node, ()))
+    return _draw(compiled, nodes, list(links))
+
+
+def scope_graph(compiled: CompiledEngine, scope: str) -> Digraph:
+    '''Graphs a single scope, plus the trigger links from or into it'''
+    cscope = compiled.get_scope(scope)
+    linked = _linked(compiled)
+    links = list(dict.fromkeys(
+        link for state_id in range(len(cscope.states)) for link in linked.get((scope, state_id), ())
+    ))
+    nodes = {(scope, state_id) for state_id in range(len(cscope.states))}
+    for source, target, _ in links:
+        nodes.update((source, target))
+    return _draw(compiled, nodes, links)
+
+
+def collapsed(compiled: CompiledEngine) -> Digraph:
+    '''Graphs one node per scope, linked by the triggers between scopes'''
+    dot = Digraph()
+    for scope, cscope in compiled.scopes.items():
+        col = _col(compiled, scope)
+        dot.node(
+            scope,
+            f'{scope.replace("_", " ").title()} <SUP><FONT POINT-SIZE="10">'
+            f'({len(cscope.states)})</FONT></SUP>',
+            shape='rectangle',
+            style="filled,rounded",
+            fillcolor=BGCOLORS[col],
+            color=FGCOLORS[col],
+        )
+
+    triggers: Dict[Tuple[str, str], List[str]] = {}
+    for scope, cscope in compiled.scopes.items():
+        for watchers in cscope.watchers.values():
+            for watcher in watchers:
+                names = triggers.setdefault((scope, watcher.scope), [])
+                if watcher.scope != scope and watcher.name.split(':')[1] not in names:
+                    names.append(watcher.name.split(':')[1])
+    for (source, target), names in triggers.items():
+        if names:
+            dot.edge(
+                source,
+                target,
+                f'<FONT POINT-SIZE="10">{", ".join(names)}</FONT>',
+                style="dotted",
+                color=FGCOLORS[_col(compiled, target)],
+            )
+
+    return dot
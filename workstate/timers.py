@@ -0,0 +1,123 @@
+'''Hierarchical timing-wheel scheduler'''
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+__all__ = ('TimingWheel', )
+
+#: A scheduled entry: (deadline tick, payload)
+Entry = Tuple[int, Any]
+
+
+class TimingWheel:  # pylint: disable=R0902
+    '''Hierarchical timing wheel
+
+    Level 0 has a slot per tick of ``resolution`` seconds, every next level has
+    slots that each span a full revolution of the level below it. Timers land
+    in the coarsest slot that still lies within its level's revolution, and
+    cascade down a level whenever the level below wraps around. Deadlines past
+    the top level are kept in an overflow slot that is re-examined whenever
+    the top level wraps.
+
+    Insertion and cancellation are O(1), advancing skips over runs of empty
+    level 0 slots.
+    '''
+
+    def __init__(self,
+                 resolution: float = 1.0,
+                 slots: int = 256,
+                 levels: int = 4,
+                 start: float = 0.0) -> None:
+        self.resolution = resolution
+        self.slots = slots
+        self.tick = int(start // resolution)
+        self.wheels: List[List[Dict[int, Entry]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self.overflow: Dict[int, Entry] = {}
+        self.sizes = [0] * levels
+        self.spans = [slots ** level for level in range(levels)]
+        self._where: Dict[int, Tuple[int, Dict[int, Entry]]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, deadline: float, payload: Any) -> int:
+        '''Schedules payload to be due at deadline, returns a timer id'''
+        timer_id = self._next_id
+        self._next_id += 1
+        tick = int(deadline // self.resolution)
+        if tick <= self.tick:
+            tick = self.tick + 1
+        self._place(timer_id, (tick, payload))
+        return timer_id
+
+    def cancel(self, timer_id: int) -> bool:
+        '''Cancels a pending timer, returns False if it was not pending'''
+        try:
+            (level, slot) = self._where.pop(timer_id)
+        except KeyError:
+            return False
+        del slot[timer_id]
+        if level >= 0:
+            self.sizes[level] -= 1
+        return True
+
+    def _place(self, timer_id: int, entry: Entry) -> None:
+        '''Places an entry in the wheel slot that covers its deadline'''
+        (deadline, slots, tick) = (entry[0], self.slots, self.tick)
+        for level, span in enumerate(self.spans):
+            block = deadline // span
+            if block - tick // span < slots:
+                slot = self.wheels[level][block % slots]
+                self.sizes[level] += 1
+                break
+        else:
+            (level, slot) = (-1, self.overflow)
+        slot[timer_id] = entry
+        self._where[timer_id] = (level, slot)
+
+    def _cascade(self) -> None:
+        '''Moves entries of higher levels down as lower levels wrap around'''
+        span = 1
+        for level in range(1, len(self.wheels)):
+            span *= self.slots
+            if self.tick % span:
+                return
+            slot = self.wheels[level][(self.tick // span) % self.slots]
+            self.sizes[level] -= len(slot)
+            entries = list(slot.items())
+            slot.clear()
+            for timer_id, entry in entries:
+                self._place(timer_id, entry)
+
+        entries = list(self.overflow.items())
+        self.overflow.clear()
+        for timer_id, entry in entries:
+            self._place(timer_id, entry)
+
+    def advance(self, now: float) -> List[Any]:
+        '''Advances the wheel to now, returns payloads that are due, in deadline order'''
+        target = int(now // self.resolution)
+        due: List[Any] = []
+        wheel = self.wheels[0]
+        while self.tick < target:
+            if not self.sizes[0]:
+                # Nothing in level 0, skip ahead to where the next level cascades
+                boundary = (self.tick // self.slots + 1) * self.slots
+                if boundary > target:
+                    self.tick = target
+                    break
+                self.tick = boundary
+            else:
+                self.tick += 1
+            self._cascade()
+            slot = wheel[self.tick % self.slots]
+            if slot:
+                self.sizes[0] -= len(slot)
+                for timer_id, entry in slot.items():
+                    del self._where[timer_id]
+                    due.append(entry[1])
+                slot.clear()
+        return due
@@ -1,13 +1,13 @@
 '''WorkState engine'''
 from __future__ import annotations
 
-from typing import Dict, List, Set
+from typing import Dict, List, Mapping, Set
 
 from workstate.engine_graph import Event, State, Transitions
 from workstate.exceptions import BrokenStateModelException
 
 
-def mark_states(_states: Dict[str, State],
+def mark_states(_states: Mapping[str, State],
                 _transitions: Transitions,
                 statename: str,
                 pool: Set[str],
@@ -41,7 +41,7 @@ def mark_states(_states: Dict[str, State],
 
 def check_edges(_transitions: Transitions,
                 events: Dict[str, List[str]],
-                _events: Dict[str, Event]) -> None:
+                _events: Mapping[str, Event]) -> None:
     '''Check that edges are valid'''
 
     # Check that each edge has an event that can trigger it